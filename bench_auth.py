@@ -0,0 +1,286 @@
+"""
+Authentication benchmarks
+
+Usage:
+    python bench_auth.py loader      # per-request cost of the Flask-Login user loader, with/without the user cache
+    python bench_auth.py lookup      # registration conflict check: two scans vs two/one indexed queries
+    python bench_auth.py storm       # page latency during a login storm, bcrypt inline vs on the bounded pool
+    python bench_auth.py sqlite      # user repository operations on the local SQLite backend, no network
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), 'project_agri'))
+sys.path.append(PROJECT_DIR)
+
+# Keep benchmark traffic out of the real analytics store
+os.environ.setdefault('ANALYTICS_STORAGE', 'memory')
+os.environ.setdefault('ANALYTICS_FLUSH_INTERVAL_MS', '0')
+
+USER_ID = '507f1f77bcf86cd799439011'
+
+
+class SlowUsersCollection:
+    """Users collection answering find_one after a simulated network round trip"""
+
+    def __init__(self, latency_ms):
+        self.latency = latency_ms / 1000.0
+        self.queries = 0
+
+    def create_index(self, field, unique=False, name=None):
+        pass
+
+    def find_one(self, query):
+        self.queries += 1
+        time.sleep(self.latency)
+        return {'_id': query['_id'], 'username': 'bench', 'email': 'bench@example.com', 'password': 'x'}
+
+
+class StandInUsersCollection:
+    """
+    Local stand-in for the MongoDB users collection
+
+    Documents are scanned one by one unless a unique index was created on
+    the queried field, in which case lookups are a dict access, mirroring
+    a collection scan vs an index seek. Every query pays a simulated round
+    trip.
+    """
+
+    def __init__(self, users, latency_ms):
+        self.latency = latency_ms / 1000.0
+        self.docs = [{'_id': i, 'username': f'user{i}', 'email': f'user{i}@example.com', 'password': 'x'}
+                     for i in range(users)]
+        self.indexes = {}
+        self.queries = 0
+
+    def create_index(self, field, unique=False, name=None):
+        self.indexes[field] = {doc[field]: doc for doc in self.docs}
+
+    def _match(self, field, value):
+        if field in self.indexes:
+            doc = self.indexes[field].get(value)
+            return [doc] if doc else []
+        return [doc for doc in self.docs if doc[field] == value]
+
+    def _query(self, query):
+        self.queries += 1
+        time.sleep(self.latency)
+        clauses = query.get('$or', [query])
+        found = {}
+        for clause in clauses:
+            (field, value), = clause.items()
+            for doc in self._match(field, value):
+                found[doc['_id']] = doc
+        return list(found.values())
+
+    def find_one(self, query):
+        docs = self._query(query)
+        return docs[0] if docs else None
+
+    def find(self, query, projection=None):
+        return StandInCursor(self._query(query))
+
+
+class StandInCursor(list):
+    def limit(self, n):
+        return StandInCursor(self[:n])
+
+
+def time_call(func, repeat):
+    """Median wall time of func() in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def time_requests(client, path, repeat):
+    """Median and p99 wall time of GET path in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(path)
+        samples.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f'GET {path} returned {response.status_code}')
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99)]
+
+
+def bench_loader(args):
+    """Authenticated page views with User.get going to the database every time vs the per-worker cache"""
+    from unittest.mock import patch
+
+    import models
+    from crop_predict import app
+    from user_repository import MongoUserRepository
+
+    collection = SlowUsersCollection(args.latency_ms)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = USER_ID
+        session['_fresh'] = True
+        session['visited'] = True
+
+    print(f"GET {args.path} as a logged-in user, {args.requests} requests, "
+          f"simulated MongoDB round trip {args.latency_ms:g} ms")
+    print(f"  {'user cache':>10} {'p50 ms':>8} {'p99 ms':>8} {'user queries':>13}")
+    for name, ttl in (('off', 0), ('on', 60)):
+        with patch.object(models, '_repository', MongoUserRepository(lambda: collection)), \
+                patch.object(models, '_user_cache', models.UserCache(ttl=ttl)):
+            client.get(args.path)
+            collection.queries = 0
+            p50, p99 = time_requests(client, args.path, args.requests)
+        print(f"  {name:>10} {p50:>8.3f} {p99:>8.3f} {collection.queries:>13,}")
+
+
+def bench_lookup(args):
+    """Registration conflict check for a new user, as the user base grows"""
+    from unittest.mock import patch
+
+    import models
+    from models import User
+    from user_repository import MongoUserRepository
+
+    def two_queries():
+        return User.find_by_username('newuser') or User.find_by_email('new@example.com')
+
+    def one_query():
+        return User.find_conflicts('newuser', 'new@example.com')
+
+    print(f"conflict check for a new username/email, median of {args.repeat}, "
+          f"simulated MongoDB round trip {args.latency_ms:g} ms")
+    print(f"  {'users':>10} {'2 queries, scan':>16} {'2 queries, index':>17} {'1 $or query, index':>19}")
+    for users in args.users:
+        collection = StandInUsersCollection(users, args.latency_ms)
+        repository = MongoUserRepository(lambda: collection)
+        # Keep the first access from creating the indexes, so the scans are measured first
+        repository._indexed = True
+        with patch.object(models, '_repository', repository):
+            scan = time_call(two_queries, args.repeat)
+            models.ensure_user_indexes()
+            indexed = time_call(two_queries, args.repeat)
+            combined = time_call(one_query, args.repeat)
+        print(f"  {users:>10,} {scan:>16.3f} {indexed:>17.3f} {combined:>19.3f}")
+
+
+def render_page():
+    """CPU work standing in for rendering a page such as /weather"""
+    return sum(i * i for i in range(20000))
+
+
+def bench_storm(args):
+    """Latency of ordinary page work while many threads check passwords"""
+    import bcrypt
+    from password_hasher import PasswordHasher
+
+    hasher = PasswordHasher(rounds=args.rounds, workers=args.workers, max_pending=args.logins)
+    password_hash = bcrypt.hashpw(b'password123', bcrypt.gensalt(args.rounds))
+
+    def inline_check():
+        bcrypt.checkpw(b'password123', password_hash)
+
+    def pooled_check():
+        hasher.check(password_hash.decode(), 'password123')
+
+    print(f"{args.logins} threads logging in continuously, bcrypt rounds {args.rounds}, "
+          f"{os.cpu_count()} CPUs; page work median of {args.pages}")
+    print(f"  {'hashing':>18} {'page p50 ms':>12} {'page p99 ms':>12} {'logins/s':>9}")
+    baseline = [time_call(render_page, 1) for _ in range(args.pages)]
+    print(f"  {'idle':>18} {statistics.median(baseline):>12.3f} {sorted(baseline)[int(len(baseline) * 0.99)]:>12.3f} "
+          f"{0:>9}")
+    for name, check in (('inline', inline_check), (f'pool of {args.workers}', pooled_check)):
+        stop = threading.Event()
+        logins = []
+
+        def login_loop():
+            count = 0
+            while not stop.is_set():
+                check()
+                count += 1
+            logins.append(count)
+
+        threads = [threading.Thread(target=login_loop) for _ in range(args.logins)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        samples = sorted(time_call(render_page, 1) for _ in range(args.pages))
+        stop.set()
+        for thread in threads:
+            thread.join()
+        rate = sum(logins) / (time.perf_counter() - start)
+        print(f"  {name:>18} {statistics.median(samples):>12.3f} {samples[int(len(samples) * 0.99)]:>12.3f} "
+              f"{rate:>9.0f}")
+
+
+def bench_sqlite(args):
+    """User repository operations on a local SQLite file as the user base grows"""
+    from user_repository import SQLiteUserRepository
+
+    print(f"SQLite user repository (WAL, unique indexes), median of {args.repeat} ms")
+    print(f"  {'users':>10} {'get':>8} {'by email':>9} {'conflicts':>10} {'insert':>8} {'update pw':>10}")
+    for users in args.users:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            repository = SQLiteUserRepository(os.path.join(tmpdir, 'site.db'))
+            with repository._connections.transaction() as conn:
+                conn.executemany("INSERT INTO users (username, email, password) VALUES (?, ?, ?)",
+                                 ((f'user{i}', f'user{i}@example.com', 'x') for i in range(users)))
+            middle = str(users // 2)
+            counter = iter(range(10 ** 9))
+
+            def insert():
+                n = next(counter)
+                repository.insert(f'new{n}', f'new{n}@example.com', 'x')
+
+            timings = [
+                time_call(lambda: repository.get(middle), args.repeat),
+                time_call(lambda: repository.find_by_email(f'user{users // 2}@example.com'), args.repeat),
+                time_call(lambda: repository.find_conflicts('newuser', 'new@example.com'), args.repeat),
+                time_call(insert, args.repeat),
+                time_call(lambda: repository.update_password(middle, 'y'), args.repeat),
+            ]
+        print(f"  {users:>10,} " + " ".join(f"{t:>{w}.3f}" for t, w in zip(timings, (8, 9, 10, 8, 10))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    loader = subparsers.add_parser('loader', help='Flask-Login user loader with/without the user cache')
+    loader.add_argument('--path', default='/about', help='authenticated page to request')
+    loader.add_argument('--requests', type=int, default=500)
+    loader.add_argument('--latency-ms', type=float, default=1.0, help='simulated MongoDB round trip')
+    loader.set_defaults(func=bench_loader)
+
+    lookup = subparsers.add_parser('lookup', help='registration conflict check, scans vs indexed $or query')
+    lookup.add_argument('--users', type=int, nargs='+', default=[10000, 100000, 1000000])
+    lookup.add_argument('--repeat', type=int, default=20)
+    lookup.add_argument('--latency-ms', type=float, default=1.0, help='simulated MongoDB round trip')
+    lookup.set_defaults(func=bench_lookup)
+
+    storm = subparsers.add_parser('storm', help='page latency during a login storm, inline vs pooled bcrypt')
+    storm.add_argument('--logins', type=int, default=32, help='concurrent login threads')
+    storm.add_argument('--workers', type=int, default=2, help='hashing pool size')
+    storm.add_argument('--rounds', type=int, default=10)
+    storm.add_argument('--pages', type=int, default=200)
+    storm.set_defaults(func=bench_storm)
+
+    sqlite = subparsers.add_parser('sqlite', help='user repository operations on the local SQLite backend')
+    sqlite.add_argument('--users', type=int, nargs='+', default=[10000, 100000, 1000000])
+    sqlite.add_argument('--repeat', type=int, default=200)
+    sqlite.set_defaults(func=bench_sqlite)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
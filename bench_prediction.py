@@ -0,0 +1,246 @@
+"""
+Crop prediction benchmarks
+
+Usage:
+    python bench_prediction.py compiled      # sklearn vs NumPy tree evaluator
+    python bench_prediction.py batcher       # concurrent single-row predictions with/without micro-batching
+    python bench_prediction.py memory        # per-worker RSS/PSS with .npz vs memory-mapped model arrays (Linux)
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), 'project_agri'))
+sys.path.append(PROJECT_DIR)
+
+DATASET_FILE = os.path.join(PROJECT_DIR, 'Crop_recommendation.csv')
+
+
+def load_features():
+    return np.loadtxt(DATASET_FILE, delimiter=',', skiprows=1, usecols=range(7))
+
+
+def time_call(func, repeat):
+    """Median wall time of func() in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def time_subprocess(code, repeat):
+    """Median time for a fresh interpreter to run code, in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-W', 'ignore', '-c', code], cwd=PROJECT_DIR,
+                                capture_output=True, text=True, check=True).stdout
+        samples.append(float(output))
+    return statistics.median(samples)
+
+
+def bench_compiled(args):
+    """Compare import/load time and per-batch latency of sklearn and the compiled evaluator"""
+    timer = "import time; start = time.perf_counter(); {}; print((time.perf_counter() - start) * 1000)"
+    sklearn_load = time_subprocess(timer.format("import joblib; joblib.load('crop_recommend')"), args.repeat)
+    compiled_load = time_subprocess(
+        timer.format("from tree_compiler import CompiledTreeModel; CompiledTreeModel.load('crop_recommend.compiled')"),
+        args.repeat)
+
+    print("Cold import + load (fresh interpreter, median ms)")
+    print(f"  sklearn/joblib : {sklearn_load:8.1f}")
+    print(f"  compiled NumPy : {compiled_load:8.1f}")
+
+    from tree_compiler import CompiledTreeModel
+
+    # Fit the notebook's model in-process so the estimator's predict() runs on the pinned sklearn version
+    features = load_features()
+    sklearn_model = fit_model('sklearn')
+    compiled_model = CompiledTreeModel.from_model(sklearn_model)
+
+    print("\nPer-batch latency (median ms)")
+    print(f"  {'batch':>8} {'sklearn':>10} {'compiled':>10}")
+    rng = np.random.default_rng(0)
+    for size in args.batch_sizes:
+        batch = features[rng.integers(0, len(features), size)]
+        repeat = max(5, args.repeat * 10 // max(1, size // 1000))
+        sklearn_ms = time_call(lambda: sklearn_model.predict(batch), repeat)
+        compiled_ms = time_call(lambda: compiled_model.predict(batch), repeat)
+        print(f"  {size:>8} {sklearn_ms:>10.3f} {compiled_ms:>10.3f}")
+
+
+def fit_model(kind):
+    """Fit the notebook's decision tree and return it as sklearn or compiled"""
+    from sklearn.tree import DecisionTreeClassifier
+    from tree_compiler import CompiledTreeModel
+
+    features = load_features()
+    labels = np.loadtxt(DATASET_FILE, delimiter=',', skiprows=1, usecols=7, dtype=str)
+    model = DecisionTreeClassifier(random_state=1).fit(features, labels)
+    return CompiledTreeModel.from_model(model) if kind == 'compiled' else model
+
+
+def run_threads(threads, requests_per_thread, predict):
+    """Run predict(row) from many threads; returns (requests/s, per-request latencies in ms)"""
+    rows = load_features()
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(offset):
+        local = []
+        barrier.wait()
+        for i in range(requests_per_thread):
+            row = rows[(offset * requests_per_thread + i) % len(rows)].tolist()
+            start = time.perf_counter()
+            predict(row)
+            local.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return threads * requests_per_thread / elapsed, sorted(latencies)
+
+
+def bench_batcher(args):
+    """Throughput of concurrent single-row predictions, direct vs micro-batched"""
+    from model_service import predict_top_k
+    from prediction_batcher import MicroBatcher
+
+    model = fit_model(args.model)
+
+    def direct(row):
+        return predict_top_k([row], k=3, model=model)[0]
+
+    print(f"{args.model} model, {args.requests} requests per thread, top-3 predictions")
+    print(f"  {'threads':>7} {'mode':>18} {'req/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'mean batch':>10}")
+    for threads in args.threads:
+        modes = [('direct', direct, None)]
+        for wait_ms in args.wait_ms:
+            batcher = MicroBatcher(lambda rows, key: predict_top_k(rows, k=3, model=model),
+                                   max_batch=args.max_batch, max_wait_ms=wait_ms)
+            modes.append((f'batched {wait_ms:g} ms', batcher.predict, batcher))
+        for name, predict, batcher in modes:
+            rate, latencies = run_threads(threads, args.requests, predict)
+            mean_batch = batcher.stats()['mean_batch_size'] if batcher else 1
+            print(f"  {threads:>7} {name:>18} {rate:>10,.0f} {latencies[len(latencies) // 2]:>8.3f} "
+                  f"{latencies[int(len(latencies) * 0.99)]:>8.3f} {mean_batch:>10}")
+
+
+# Worker process for the memory benchmark: load the model the way a gunicorn worker would,
+# predict the whole dataset so every node is touched, then wait to be measured
+MEMORY_WORKER = """
+import sys
+import numpy as np
+from tree_compiler import CompiledTreeModel
+mode, path, dataset = sys.argv[1:4]
+features = np.loadtxt(dataset, delimiter=',', skiprows=1, usecols=range(7))
+model = CompiledTreeModel.load(path) if mode != 'none' else None
+if model is not None:
+    model.predict(features)
+print('ready', flush=True)
+sys.stdin.read()
+"""
+
+
+def read_memory_kb(pid):
+    """Rss and Pss of a process in kB, from /proc/<pid>/smaps_rollup"""
+    memory = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            key, _, rest = line.partition(':')
+            if key in ('Rss', 'Pss'):
+                memory[key] = int(rest.split()[0])
+    return memory
+
+
+def measure_workers(mode, path, workers):
+    """Start `workers` model-serving processes at once; returns per-process memory readings"""
+    processes = [subprocess.Popen([sys.executable, '-W', 'ignore', '-c', MEMORY_WORKER, mode, path, DATASET_FILE],
+                                  cwd=PROJECT_DIR, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+                 for _ in range(workers)]
+    try:
+        for process in processes:
+            if process.stdout.readline().strip() != 'ready':
+                raise RuntimeError(f'{mode} worker failed to start')
+        return [read_memory_kb(process.pid) for process in processes]
+    finally:
+        for process in processes:
+            process.stdin.close()
+            process.wait()
+
+
+def bench_memory(args):
+    """Per-worker memory with the model read into each process vs memory-mapped from shared files"""
+    from sklearn.ensemble import RandomForestClassifier
+    from tree_compiler import CompiledTreeModel
+
+    features = load_features()
+    labels = np.loadtxt(DATASET_FILE, delimiter=',', skiprows=1, usecols=7, dtype=str)
+    model = CompiledTreeModel.from_model(
+        RandomForestClassifier(n_estimators=args.trees, random_state=1).fit(features, labels))
+    print(f"random forest, {args.trees} trees, {len(model.feature):,} nodes, {args.workers} workers")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        npz_path = os.path.join(tmpdir, 'model.npz')
+        mmap_path = os.path.join(tmpdir, 'model.compiled')
+        model.save(npz_path)
+        model.save(mmap_path)
+        array_kb = sum(os.path.getsize(os.path.join(mmap_path, name)) for name in os.listdir(mmap_path)) / 1024
+        print(f"model arrays: {array_kb:,.0f} kB\n")
+
+        print(f"  {'format':>8} {'RSS kB':>10} {'PSS kB':>10} {'model PSS kB':>13} {'host total PSS kB':>17}")
+        baseline = None
+        for mode, path in (('none', npz_path), ('npz', npz_path), ('mmap', mmap_path)):
+            readings = measure_workers(mode, path, args.workers)
+            rss = statistics.median(r['Rss'] for r in readings)
+            pss = statistics.median(r['Pss'] for r in readings)
+            baseline = pss if baseline is None else baseline
+            print(f"  {mode:>8} {rss:>10,.0f} {pss:>10,.0f} {pss - baseline:>13,.0f} "
+                  f"{sum(r['Pss'] for r in readings):>17,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    compiled = subparsers.add_parser('compiled', help='sklearn vs compiled NumPy tree evaluator')
+    compiled.add_argument('--repeat', type=int, default=5)
+    compiled.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 100, 10000, 100000])
+    compiled.set_defaults(func=bench_compiled)
+
+    batcher = subparsers.add_parser('batcher', help='concurrent single-row predictions, direct vs micro-batched')
+    batcher.add_argument('--model', choices=['sklearn', 'compiled'], default='sklearn')
+    batcher.add_argument('--threads', type=int, nargs='+', default=[1, 8, 32])
+    batcher.add_argument('--requests', type=int, default=500, help='requests per thread')
+    batcher.add_argument('--wait-ms', type=float, nargs='+', default=[1, 2])
+    batcher.add_argument('--max-batch', type=int, default=64)
+    batcher.set_defaults(func=bench_batcher)
+
+    memory = subparsers.add_parser('memory', help='per-worker RSS/PSS, .npz vs memory-mapped model arrays')
+    memory.add_argument('--trees', type=int, default=200, help='random forest size (bigger shows the effect)')
+    memory.add_argument('--workers', type=int, default=4)
+    memory.set_defaults(func=bench_memory)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
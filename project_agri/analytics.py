@@ -7,147 +7,428 @@ Provides insights on feature usage, popular crops, and user behavior.
 
 import os
 import json
-from datetime import datetime
+import atexit
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
 from collections import defaultdict, Counter
-from pymongo import MongoClient
-from dotenv import load_dotenv
+from flask import g, has_request_context, session, current_app
 
-# Load environment variables
-load_dotenv()
+from analytics_buffer import AnalyticsBuffer, FLUSH_INTERVAL_MS
+from analytics_storage import MemoryStorage, apply_increments, create_storage
+from database import MONGO_URI, get_client, get_collection
+from hyperloglog import HyperLogLog
+from space_saving import SpaceSaving
 
 # MongoDB Configuration
-MONGO_URI = os.getenv("MONGO_URI")
-DB_NAME = "agriculture_website"
 COLLECTION_NAME = "analytics"
 
-# In-memory fallback if DB is not available
-_memory_analytics = None
+# Storage backend: "mongodb", "sqlite" (instance/site.db) or "memory"; MongoDB when MONGO_URI is set,
+# otherwise SQLite, so workers on one host share durable counters without a database server
+ANALYTICS_STORAGE = os.getenv("ANALYTICS_STORAGE") or ("mongodb" if MONGO_URI else "sqlite")
 
-# Global variable for the MongoDB client
-_mongo_client = None
+# Counter maps stored in the analytics document
+COUNTER_CATEGORIES = (
+    "page_views",
+    "feature_usage",
+    "crop_searches",
+    "scheme_views",
+    "rotation_queries",
+    "weather_queries",
+    "fertilizer_calculations",
+)
 
 def get_mongo_client():
-    """Get or initialize the MongoDB client lazily"""
-    global _mongo_client
-    if _mongo_client is None and MONGO_URI:
-        try:
-            # Note: dnspython is required for srv URIs
-            _mongo_client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-        except Exception as e:
-            print(f"MongoDB connection setup failed: {e}")
-    return _mongo_client
+    """The process-wide client from database.py"""
+    return get_client()
 
 def get_db_collection():
     """Get MongoDB collection or None if not configured/failed"""
-    client = get_mongo_client()
-    if not client:
-        return None
-    try:
-        db = client[DB_NAME]
-        return db[COLLECTION_NAME]
-    except Exception as e:
-        print(f"MongoDB selection error: {e}")
-        return None
+    return get_collection(COLLECTION_NAME)
+
+_storage = None
+
+# Per-worker fallback while the configured backend is unavailable
+_memory_storage = MemoryStorage()
+
+def get_storage():
+    """Get the configured analytics storage backend, created on first use"""
+    global _storage
+    if _storage is None:
+        if ANALYTICS_STORAGE.lower() == "memory":
+            _storage = _memory_storage
+        else:
+            _storage = create_storage(ANALYTICS_STORAGE, lambda: get_db_collection())
+    return _storage
+
+def _use_storage(operation):
+    """Run operation(storage) on the configured backend, or on the memory fallback if that fails"""
+    storage = get_storage()
+    if storage is not _memory_storage and storage.available():
+        try:
+            return operation(storage)
+        except Exception as e:
+            print(f"Error using {storage.name} analytics storage: {e}")
+    return operation(_memory_storage)
 
 # Initialize analytics structure
 def init_analytics():
     """Initialize analytics data structure"""
-    return {
-        "page_views": {},
-        "feature_usage": {},
-        "crop_searches": {},
-        "scheme_views": {},
-        "rotation_queries": {},
-        "weather_queries": {},
-        "fertilizer_calculations": {},
-        "total_visits": 0,
-        "last_updated": datetime.now().isoformat()
-    }
+    analytics = {category: {} for category in COUNTER_CATEGORIES}
+    analytics["total_visits"] = 0
+    analytics["last_updated"] = datetime.now().isoformat()
+    return analytics
+
+# Field names are used as dotted update paths, where '.' and a leading '$' are not allowed
+def encode_key(key):
+    """Encode a counter name (city, crop, page...) for use as a MongoDB field name"""
+    return str(key).replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+def decode_key(key):
+    """Reverse encode_key()"""
+    return key.replace("%24", "$").replace("%2E", ".").replace("%25", "%")
+
+def _decode_counters(data):
+    """Return the analytics document with counter names decoded"""
+    for category in COUNTER_CATEGORIES:
+        if isinstance(data.get(category), dict):
+            data[category] = {decode_key(key): value for key, value in data[category].items()}
+    return data
+
+# Unique visitors: a HyperLogLog sketch per page per day and per page for all time, stored as
+# "hll:<YYYY-MM-DD or all>:<page>" documents; page "*" counts visitors to the whole site
+SITE_WIDE = "*"
+_sketches = {}
+_sketch_lock = threading.Lock()
+
+# Heavy hitters: categories keyed by free text are kept as bounded Space-Saving summaries in
+# "topk:<YYYY-MM-DD or all>:<category>" documents instead of ever-growing counter maps
+HEAVY_HITTER_CATEGORIES = ("weather_queries",)
+HEAVY_HITTER_CAPACITY = int(os.getenv("ANALYTICS_TOPK_CAPACITY", "100"))
+_heavy_hitters = {}
+
+# Sketches and summaries are merged into storage in batches, by the buffer's flusher or (without the
+# buffer) when a request ends, once ANALYTICS_SKETCH_FLUSH_INTERVAL_MS have passed or
+# ANALYTICS_SKETCH_FLUSH_MAX_EVENTS events were added; and always at exit and before a dashboard reload
+SKETCH_FLUSH_INTERVAL_MS = float(os.getenv("ANALYTICS_SKETCH_FLUSH_INTERVAL_MS", "60000"))
+SKETCH_FLUSH_MAX_EVENTS = int(os.getenv("ANALYTICS_SKETCH_FLUSH_MAX_EVENTS", "500"))
+_sketch_events = 0
+_sketches_flushed_at = time.monotonic()
+
+# Time ranges offered on the analytics dashboard
+SUMMARY_RANGES = {
+    "24h": ("Last 24 hours", timedelta(hours=24)),
+    "7d": ("Last 7 days", timedelta(days=7)),
+    "30d": ("Last 30 days", timedelta(days=30)),
+    "365d": ("Last year", timedelta(days=365)),
+}
+
+# Dashboard summaries are kept per range and reloaded at most every ANALYTICS_SUMMARY_TTL seconds
+# (0 disables the cache); this worker's own writes are added to the cached counters in between
+SUMMARY_CACHE_TTL = float(os.getenv("ANALYTICS_SUMMARY_TTL", "30"))
+_summary_cache = {}
+_summary_cache_lock = threading.Lock()
+
+# Time buckets: every write also goes to the document of the current hour and of the current day,
+# stored in the same collection as main_analytics under ids like "hour:2025-01-31T14" and "day:2025-01-31"
+def _bucket_ids(moment):
+    """(kind, document id, bucket start) of the hour and day buckets containing moment"""
+    hour = moment.replace(minute=0, second=0, microsecond=0)
+    day = hour.replace(hour=0)
+    return [("hour", hour.strftime("hour:%Y-%m-%dT%H"), hour.isoformat()),
+            ("day", day.strftime("day:%Y-%m-%d"), day.isoformat())]
+
+def bucket_ids_for_range(start, end):
+    """
+    Fewest bucket documents covering [start, end)
+
+    Whole days are read from day rollups and the partial days at either end
+    from hour documents, so a one-year range needs at most 365 + 46 documents.
+    Both ends are widened to whole hours.
+    """
+    cursor = start.replace(minute=0, second=0, microsecond=0)
+    ids = []
+    while cursor < end:
+        next_day = cursor + timedelta(days=1)
+        if cursor.hour == 0 and next_day <= end:
+            ids.append(cursor.strftime("day:%Y-%m-%d"))
+            cursor = next_day
+        else:
+            ids.append(cursor.strftime("hour:%Y-%m-%dT%H"))
+            cursor += timedelta(hours=1)
+    return ids
+
+def _merge_documents(documents):
+    """Sum the counters of several analytics documents into one"""
+    merged = init_analytics()
+    merged["last_updated"] = ""
+    for doc in documents:
+        for category in COUNTER_CATEGORIES:
+            counters = merged[category]
+            for key, value in (doc.get(category) or {}).items():
+                counters[key] = counters.get(key, 0) + value
+        merged["total_visits"] += doc.get("total_visits", 0)
+        merged["last_updated"] = max(merged["last_updated"], doc.get("last_updated", ""))
+    return merged
+
+def load_range(start, end):
+    """Counters for events between start and end, summed from the hourly/daily rollups"""
+    ids = bucket_ids_for_range(start, end)
+    return _decode_counters(_merge_documents(_use_storage(lambda storage: storage.find_ids(ids))))
 
 # Load analytics data
 def load_analytics():
-    """Load analytics data from MongoDB or fallback"""
-    global _memory_analytics
-    
-    collection = get_db_collection()
-    
-    if collection is not None:
-        try:
-            data = collection.find_one({"_id": "main_analytics"})
-            if data:
-                # Convert regular dicts to Counter/defaultdict behavior where needed
-                # For read operations, we just return the dict, logic handles the rest
-                return data
-        except Exception as e:
-            print(f"Error loading from MongoDB: {e}")
-    
-    # Fallback to in-memory if DB fails or empty
-    if _memory_analytics is None:
-        _memory_analytics = init_analytics()
-    return _memory_analytics
+    """Load the all-time analytics document"""
+    data = _use_storage(lambda storage: storage.find_one("main_analytics"))
+    if not data:
+        return init_analytics()
+    return _decode_counters(data)
 
 # Save analytics data
 def save_analytics(analytics):
-    """Save analytics data to MongoDB"""
-    global _memory_analytics
-    
+    """Overwrite the all-time analytics counters"""
     # Update timestamp
     analytics["last_updated"] = datetime.now().isoformat()
     
-    collection = get_db_collection()
+    # Storage takes plain dicts with encoded names, not Counter/defaultdict
+    counters = {
+        category: {encode_key(key): value for key, value in dict(analytics.get(category, {})).items()}
+        for category in COUNTER_CATEGORIES
+    }
+    counters["total_visits"] = analytics.get("total_visits", 0)
+    _use_storage(lambda storage: storage.replace_counters("main_analytics", counters, analytics["last_updated"]))
+
+# Decode the counter names in an increments dict, like documents read back from MongoDB
+def _decode_increments(increments):
+    decoded = {}
+    for path, amount in increments.items():
+        category, dot, key = path.partition(".")
+        decoded[category + dot + decode_key(key) if dot else path] = amount
+    return decoded
+
+# Apply counter increments in one atomic update
+def increment_counters(increments):
+    """
+    Add to analytics counters in one round trip
     
-    if collection is not None:
-        try:
-            # MongoDB doesn't like Counter/defaultdict types directly, ensure they are dicts
-            data_to_save = {
-                "page_views": dict(analytics.get("page_views", {})),
-                "feature_usage": dict(analytics.get("feature_usage", {})),
-                "crop_searches": dict(analytics.get("crop_searches", {})),
-                "scheme_views": dict(analytics.get("scheme_views", {})),
-                "rotation_queries": dict(analytics.get("rotation_queries", {})),
-                "weather_queries": dict(analytics.get("weather_queries", {})),
-                "fertilizer_calculations": dict(analytics.get("fertilizer_calculations", {})),
-                "total_visits": analytics.get("total_visits", 0),
-                "last_updated": analytics["last_updated"]
-            }
-            
-            collection.update_one(
-                {"_id": "main_analytics"},
-                {"$set": data_to_save},
-                upsert=True
-            )
-            return
-        except Exception as e:
-            print(f"Error saving to MongoDB: {e}")
+    The all-time document and the current hour and day buckets are updated
+    in one batch (a single unordered bulk write on MongoDB, a single
+    transaction on SQLite).
+    
+    Args:
+        increments (dict): Dotted field path -> amount, e.g.
+                           {"page_views.Home": 1, "total_visits": 1}. Keys below a
+                           category must be encoded with encode_key().
+    """
+    if not increments:
+        return
+    now = datetime.now()
+    timestamp = now.isoformat()
+    documents = {"main_analytics": {}}
+    for kind, bucket_id, start in _bucket_ids(now):
+        documents[bucket_id] = {"bucket": kind, "start": start}
     
-    # Update in-memory fallback
-    _memory_analytics = analytics
+    _use_storage(lambda storage: storage.increment(documents, increments, timestamp))
+    _update_cached_summaries(increments, timestamp)
 
-# Helper to safely increment a value in a nested dict structure
-def _safe_increment(category, key):
-    analytics = load_analytics()
+# Unique visitor sketches
+def current_visitor_id():
+    """The logged-in user's id, otherwise a random id kept in the session"""
+    if hasattr(current_app, "login_manager"):
+        from flask_login import current_user
+        if current_user.is_authenticated:
+            return f"user:{current_user.get_id()}"
+    vid = session.get("vid")
+    if vid is None:
+        vid = session["vid"] = uuid.uuid4().hex
+    return f"session:{vid}"
+
+def _sketch_id(period, page):
+    return f"hll:{period}:{encode_key(page)}"
+
+def track_unique_visitor(page_name, visitor_id=None):
+    """Add a visitor to this worker's sketches for the page and the whole site, today and all time"""
+    global _sketch_events
+    visitor_id = visitor_id or current_visitor_id()
+    day = datetime.now().strftime("%Y-%m-%d")
+    with _sketch_lock:
+        _sketch_events += 1
+        for period in (day, "all"):
+            for page in (page_name, SITE_WIDE):
+                sketch = _sketches.get((period, page))
+                if sketch is None:
+                    sketch = _sketches[(period, page)] = HyperLogLog()
+                sketch.add(visitor_id)
+
+def _merge_sketch(storage, doc_id, sketch):
+    """
+    Merge a HyperLogLog sketch into its stored document
+    
+    Merging is a register-wise max, so re-applying a sketch after a lost race
+    never double counts.
+    """
+    def merge(doc):
+        merged = HyperLogLog(sketch.p, sketch.registers)
+        if doc:
+            stored = bytes(doc["registers"])
+            merged.merge(stored)
+            if merged.to_bytes() == stored:
+                return None
+        return {"registers": merged.to_bytes(), "p": merged.p}
+    storage.merge(doc_id, merge)
+
+def _merge_heavy_hitters(storage, doc_id, summary):
+    """Merge a Space-Saving summary into its stored document"""
+    def merge(doc):
+        merged = SpaceSaving.from_dict(doc) if doc else SpaceSaving(summary.capacity)
+        return merged.merge(summary).to_dict()
+    storage.merge(doc_id, merge)
+
+def flush_sketches():
+    """Merge this worker's unique visitor sketches and heavy-hitter summaries into storage"""
+    global _sketches, _heavy_hitters, _sketch_events, _sketches_flushed_at
+    with _sketch_lock:
+        pending, _sketches = _sketches, {}
+        pending_heavy_hitters, _heavy_hitters = _heavy_hitters, {}
+        _sketch_events = 0
+        _sketches_flushed_at = time.monotonic()
+    if not pending and not pending_heavy_hitters:
+        return
     
-    # Ensure category exists and is a dict
-    if category not in analytics or not isinstance(analytics[category], dict):
-        analytics[category] = {}
-        
-    # Increment
-    current_val = analytics[category].get(key, 0)
-    analytics[category][key] = current_val + 1
+    for (period, page), sketch in pending.items():
+        doc_id = _sketch_id(period, page)
+        _use_storage(lambda storage: _merge_sketch(storage, doc_id, sketch))
     
-    save_analytics(analytics)
+    for (period, category), summary in pending_heavy_hitters.items():
+        doc_id = f"topk:{period}:{category}"
+        _use_storage(lambda storage: _merge_heavy_hitters(storage, doc_id, summary))
+
+def track_heavy_hitter(category, key):
+    """Count a free-text key in this worker's bounded summaries for today and all time"""
+    global _sketch_events
+    day = datetime.now().strftime("%Y-%m-%d")
+    with _sketch_lock:
+        _sketch_events += 1
+        for period in (day, "all"):
+            summary = _heavy_hitters.get((period, category))
+            if summary is None:
+                summary = _heavy_hitters[(period, category)] = SpaceSaving(HEAVY_HITTER_CAPACITY)
+            summary.add(str(key))
+
+def load_heavy_hitters(category, start=None, end=None):
+    """
+    Merged Space-Saving summary of a category over a range of days (all time without a start)
+    """
+    if start is None:
+        first = last = "all"
+    else:
+        first = start.strftime("%Y-%m-%d")
+        last = (end or datetime.now()).strftime("%Y-%m-%d")
+    low, high = f"topk:{first}:", f"topk:{last};"
+    
+    merged = SpaceSaving(HEAVY_HITTER_CAPACITY)
+    for doc in _use_storage(lambda storage: storage.find_range(low, high)):
+        if doc["_id"].split(":", 2)[2] == category:
+            merged.merge(SpaceSaving.from_dict(doc))
+    return merged
+
+def load_unique_visitors(start=None, end=None):
+    """
+    Estimated distinct visitors per page ("*" for the whole site)
+    
+    Day sketches in the range are merged, so a visitor seen on several days
+    is counted once. Without a start, the all-time sketches are used.
+    """
+    if start is None:
+        first = last = "all"
+    else:
+        first = start.strftime("%Y-%m-%d")
+        last = (end or datetime.now()).strftime("%Y-%m-%d")
+    low, high = f"hll:{first}:", f"hll:{last};"
+    
+    sketches = {}
+    for doc in _use_storage(lambda storage: storage.find_range(low, high)):
+        page = decode_key(doc["_id"].split(":", 2)[2])
+        if page not in sketches:
+            sketches[page] = HyperLogLog()
+        sketches[page].merge(bytes(doc["registers"]))
+    return {page: sketch.count() for page, sketch in sketches.items()}
+
+def _sketches_due():
+    """Whether the unbuffered request path should merge the pending sketches now"""
+    with _sketch_lock:
+        if not _sketch_events:
+            return False
+        elapsed_ms = (time.monotonic() - _sketches_flushed_at) * 1000
+        return _sketch_events >= SKETCH_FLUSH_MAX_EVENTS or elapsed_ms >= SKETCH_FLUSH_INTERVAL_MS
+
+def _flush_events(increments):
+    if increments:
+        increment_counters(increments)
+    if _sketches_due():
+        flush_sketches()
+
+# Tracking calls only touch this buffer; a background thread writes it out in one update.
+# ANALYTICS_FLUSH_INTERVAL_MS=0 disables buffering and writes each event synchronously.
+_buffer = AnalyticsBuffer(_flush_events) if FLUSH_INTERVAL_MS > 0 else None
+
+def _write(increments):
+    if _buffer is not None:
+        _buffer.add(increments)
+    else:
+        increment_counters(increments)
+
+def _record(increments):
+    # Inside a request, events are combined on flask.g and written once by flush_request_analytics()
+    if has_request_context():
+        pending = g.setdefault("_analytics_increments", {})
+        for path, amount in increments.items():
+            pending[path] = pending.get(path, 0) + amount
+        return
+    _write(increments)
+
+def flush_request_analytics(exc=None):
+    """Teardown hook: write the events tracked during this request as one update"""
+    increments = g.pop("_analytics_increments", None)
+    if increments:
+        _write(increments)
+    if _buffer is None and _sketches_due():
+        flush_sketches()
+
+def init_app(app):
+    """Combine each request's tracking calls into a single write when the request ends"""
+    app.teardown_request(flush_request_analytics)
+
+def flush_analytics():
+    """Write buffered events now (also runs when the worker exits)"""
+    if _buffer is not None:
+        _buffer.flush()
+    flush_sketches()
+
+atexit.register(flush_analytics)
+
+def get_buffer_stats():
+    """Buffer counters for this worker, for the analytics dashboard"""
+    if _buffer is None:
+        return {'enabled': False}
+    return _buffer.stats()
+
+# Helper to safely increment a value in a nested dict structure
+def _safe_increment(category, key):
+    _record({f"{category}.{encode_key(key)}": 1})
 
 # Track page view
 def track_page_view(page_name):
     """Track a page view"""
     _safe_increment("page_views", page_name)
+    if has_request_context():
+        track_unique_visitor(page_name)
 
 # Track unique visit
 def track_visit():
     """Track a unique website visit"""
-    analytics = load_analytics()
-    analytics["total_visits"] = analytics.get("total_visits", 0) + 1
-    save_analytics(analytics)
+    _record({"total_visits": 1})
 
 # Track feature usage
 def track_feature(feature_name):
@@ -172,17 +453,36 @@ def track_rotation_query(crop_name):
 # Track weather query
 def track_weather_query(city_name):
     """Track weather query"""
-    _safe_increment("weather_queries", city_name)
+    track_heavy_hitter("weather_queries", city_name)
 
 # Track fertilizer calculation
 def track_fertilizer_calc(crop_name):
     """Track fertilizer calculation"""
     _safe_increment("fertilizer_calculations", crop_name)
 
-# Get analytics summary
-def get_analytics_summary():
-    """Get summary of analytics data"""
-    analytics = load_analytics()
+# Read everything a summary is built from
+def _load_summary_data(start=None, end=None):
+    # Include this worker's own buffered events; other workers' arrive within one flush interval
+    flush_analytics()
+    storage = get_storage()
+    connected = storage is not _memory_storage and storage.available()
+    if start is None:
+        analytics = load_analytics()
+    else:
+        analytics = load_range(start, end or datetime.now())
+    return {
+        "analytics": analytics,
+        # Free-text categories come from their bounded summaries (count may overestimate by the error)
+        "top_weather": [(city, count) for city, count, _ in load_heavy_hitters("weather_queries", start, end).top(5)],
+        "unique_visitors": load_unique_visitors(start, end),
+        "range_start": start.isoformat() if start else None,
+        "db_status": "Connected" if connected else "Disconnected (Using Memory)",
+        "storage_backend": storage.name,
+    }
+
+# Build the summary from loaded data
+def _summarize(data):
+    analytics = data["analytics"]
     
     # Helper to get Counter-like objects
     def get_counter(key):
@@ -192,7 +492,6 @@ def get_analytics_summary():
     top_crops = get_counter("crop_searches").most_common(5)
     top_schemes = get_counter("scheme_views").most_common(5)
     top_rotations = get_counter("rotation_queries").most_common(5)
-    top_weather = get_counter("weather_queries").most_common(5)
     top_fertilizer = get_counter("fertilizer_calculations").most_common(5)
     
     page_views = analytics.get("page_views", {})
@@ -201,22 +500,93 @@ def get_analytics_summary():
     top_pages = sorted(page_views.items(), key=lambda x: x[1], reverse=True)[:5]
     top_features = sorted(feature_usage.items(), key=lambda x: x[1], reverse=True)[:5]
     
+    unique_visitors = data["unique_visitors"]
+    top_pages_unique = sorted(((page, count) for page, count in unique_visitors.items() if page != SITE_WIDE),
+                              key=lambda x: x[1], reverse=True)[:5]
+    
     return {
         "total_visits": analytics.get("total_visits", 0),
         "total_page_views": sum(page_views.values()),
         "total_features_used": sum(feature_usage.values()),
+        "unique_visitors": unique_visitors.get(SITE_WIDE, 0),
         "top_pages": top_pages,
+        "top_pages_unique": top_pages_unique,
         "top_features": top_features,
         "top_crops": top_crops,
         "top_schemes": top_schemes,
         "top_rotations": top_rotations,
-        "top_weather_cities": top_weather,
+        "top_weather_cities": data["top_weather"],
         "top_fertilizer_crops": top_fertilizer,
-        "last_updated": analytics.get("last_updated", datetime.now().isoformat()),
-        "db_status": "Connected" if get_db_collection() is not None else "Disconnected (Using Memory)",
+        "last_updated": analytics.get("last_updated") or datetime.now().isoformat(),
+        "range_start": data["range_start"],
+        "db_status": data["db_status"],
+        "storage_backend": data["storage_backend"],
         "mongo_uri_configured": bool(MONGO_URI)
     }
 
+# Get analytics summary
+def get_analytics_summary(start=None, end=None):
+    """
+    Get summary of analytics data
+    
+    Args:
+        start (datetime): Start of the time range; None for all-time totals
+        end (datetime): End of the time range (default: now)
+    """
+    return _summarize(_load_summary_data(start, end))
+
+# Get analytics summary from the cache
+def get_cached_summary(range_key="all"):
+    """
+    Get the analytics summary for "all" or a SUMMARY_RANGES key, at most SUMMARY_CACHE_TTL old
+    
+    Counters written by this worker since the summary was loaded are already
+    included; unique visitors, heavy hitters and other workers' writes are
+    picked up when it is reloaded. The summary's "cached_at" is the load time.
+    """
+    if range_key not in SUMMARY_RANGES:
+        range_key = "all"
+    now = time.monotonic()
+    with _summary_cache_lock:
+        entry = _summary_cache.get(range_key)
+        if entry is not None and now < entry["expires"]:
+            if entry["summary"] is None:
+                entry["summary"] = _summarize(entry["data"])
+                entry["summary"]["cached_at"] = entry["cached_at"]
+            return entry["summary"]
+    
+    # Load outside the lock, so writers applying increments are never held up by the database.
+    # This worker's pending sketches are merged first, so its own visitors are in the reload.
+    flush_sketches()
+    loaded_at = datetime.now()
+    if range_key == "all":
+        data = _load_summary_data()
+    else:
+        data = _load_summary_data(loaded_at - SUMMARY_RANGES[range_key][1], loaded_at)
+    summary = _summarize(data)
+    summary["cached_at"] = loaded_at.isoformat()
+    if SUMMARY_CACHE_TTL > 0:
+        with _summary_cache_lock:
+            _summary_cache[range_key] = {"data": data, "summary": summary, "cached_at": summary["cached_at"],
+                                         "expires": now + SUMMARY_CACHE_TTL}
+    return summary
+
+# Add this worker's writes to the cached summaries
+def _update_cached_summaries(increments, timestamp):
+    if not _summary_cache:
+        return
+    decoded = _decode_increments(increments)
+    with _summary_cache_lock:
+        for entry in _summary_cache.values():
+            # Every range ends now, so the new events fall into all of them
+            apply_increments(entry["data"]["analytics"], decoded, timestamp)
+            entry["summary"] = None
+
+def clear_summary_cache():
+    """Drop the cached summaries, so the next dashboard view reloads them"""
+    with _summary_cache_lock:
+        _summary_cache.clear()
+
 # Get detailed analytics
 def get_detailed_analytics():
     """Get detailed analytics data"""
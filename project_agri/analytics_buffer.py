@@ -0,0 +1,132 @@
+"""
+Analytics Buffer Module
+Collects analytics counter increments in memory and writes them to the
+database from a background thread, off the request path
+"""
+
+import os
+import threading
+import time
+
+# Longest time (ms) an event waits in the buffer; 0 writes every event synchronously
+FLUSH_INTERVAL_MS = float(os.getenv("ANALYTICS_FLUSH_INTERVAL_MS", "1000"))
+
+# Flush early once this many events are buffered
+FLUSH_MAX_EVENTS = int(os.getenv("ANALYTICS_FLUSH_MAX_EVENTS", "500"))
+
+# Distinct counters held at once; events for new counters are dropped beyond this
+BUFFER_MAX_KEYS = int(os.getenv("ANALYTICS_BUFFER_MAX_KEYS", "10000"))
+
+
+class AnalyticsBuffer:
+    """
+    In-process buffer of counter increments with a background flusher
+
+    add() merges increments into a dict of pending amounts per counter
+    path, so memory is bounded by the number of distinct counters rather
+    than the number of events. A daemon thread calls `flush_fn(increments)`
+    with everything pending every `interval_ms`, or as soon as `max_events`
+    events are waiting. The call is made even when nothing is pending (with
+    an empty dict), so flush_fn can also write state kept outside the
+    buffer. Increments for a new counter are dropped (and counted) once
+    `max_keys` counters are pending.
+
+    The thread starts on first use. A forked child discards the pending
+    increments it inherited, which the parent still owns, and starts its
+    own thread.
+    """
+
+    def __init__(self, flush_fn, interval_ms=FLUSH_INTERVAL_MS, max_events=FLUSH_MAX_EVENTS,
+                 max_keys=BUFFER_MAX_KEYS):
+        self.flush_fn = flush_fn
+        self.interval = interval_ms / 1000.0
+        self.max_events = max(1, max_events)
+        self.max_keys = max(1, max_keys)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = os.getpid()
+        self._pending = {}
+        self._pending_events = 0
+        self.events = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.last_flush_ms = 0.0
+
+    def _ensure_worker(self):
+        """Start the flusher thread; called with self._lock held"""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._pending = {}
+            self._pending_events = 0
+            self._wake = threading.Event()
+            self._thread = None
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='analytics-flusher', daemon=True)
+            self._thread.start()
+
+    def add(self, increments):
+        """Buffer one event's increments ({counter path: amount}); never blocks on the database"""
+        with self._lock:
+            self._ensure_worker()
+            accepted = False
+            for path, amount in increments.items():
+                if path in self._pending:
+                    self._pending[path] += amount
+                elif len(self._pending) < self.max_keys:
+                    self._pending[path] = amount
+                else:
+                    self.dropped += 1
+                    continue
+                accepted = True
+            if accepted:
+                self.events += 1
+                self._pending_events += 1
+                if self._pending_events >= self.max_events:
+                    self._wake.set()
+
+    def flush(self):
+        """Write everything pending now; returns the number of counters written"""
+        with self._flush_lock:
+            with self._lock:
+                if self._pid != os.getpid():
+                    return 0
+                pending, self._pending = self._pending, {}
+                self._pending_events = 0
+            start = time.perf_counter()
+            try:
+                self.flush_fn(pending)
+            except Exception as e:
+                self.flush_errors += 1
+                print(f"Analytics flush failed, {len(pending)} counters lost: {e}")
+                return 0
+            if not pending:
+                return 0
+            self.flushes += 1
+            self.last_flush_ms = (time.perf_counter() - start) * 1000
+            return len(pending)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def stats(self):
+        """Buffer counters for the analytics dashboard"""
+        with self._lock:
+            return {
+                'enabled': True,
+                'interval_ms': self.interval * 1000,
+                'max_events': self.max_events,
+                'max_keys': self.max_keys,
+                'events': self.events,
+                'pending_events': self._pending_events,
+                'pending_keys': len(self._pending),
+                'dropped': self.dropped,
+                'flushes': self.flushes,
+                'flush_errors': self.flush_errors,
+                'last_flush_ms': round(self.last_flush_ms, 3),
+            }
@@ -0,0 +1,362 @@
+"""
+Analytics Storage Module
+Backends holding the analytics documents: MongoDB, a local SQLite file, or
+process memory
+"""
+
+import base64
+import json
+import os
+import threading
+
+from pymongo import UpdateOne
+
+from database import SQLITE_PATH as DEFAULT_SQLITE_PATH, SQLiteConnections
+
+# Local database used by the SQLite backend
+SQLITE_PATH = os.getenv("ANALYTICS_SQLITE_PATH", DEFAULT_SQLITE_PATH)
+
+# Attempts at a compare-and-swap merge before giving up
+CAS_RETRIES = 10
+
+# SQLite limits the number of bound parameters per statement
+SQLITE_MAX_PARAMS = 500
+
+
+class StorageUnavailable(Exception):
+    """The backend is not configured or cannot be reached"""
+
+
+def apply_increments(doc, increments, timestamp):
+    """Apply {dotted path: amount} increments to an analytics document in place"""
+    for path, amount in increments.items():
+        if "." not in path:
+            doc[path] = doc.get(path, 0) + amount
+            continue
+        category, key = path.split(".", 1)
+        # Ensure category exists and is a dict
+        if not isinstance(doc.get(category), dict):
+            doc[category] = {}
+        counters = doc[category]
+        counters[key] = counters.get(key, 0) + amount
+    doc["last_updated"] = max(doc.get("last_updated", ""), timestamp)
+
+
+class AnalyticsStorage:
+    """
+    Store of analytics documents addressed by string id
+
+    Documents are dicts with an "_id". Counters are either top-level numbers
+    (total_visits) or maps under a category (page_views), addressed in
+    increments as dotted paths with encoded keys ("page_views.Home").
+    Other fields (bucket metadata, sketches) are written whole by merge().
+    """
+
+    name = "storage"
+
+    def available(self):
+        """Whether the backend is configured and usable right now"""
+        return True
+
+    def increment(self, documents, increments, timestamp):
+        """
+        Add the same counter increments to several documents in one batch
+
+        Args:
+            documents (dict): Document id -> fields set only when the document is created
+            increments (dict): Dotted counter path -> amount
+            timestamp (str): ISO time; last_updated never moves backwards
+        """
+        raise NotImplementedError
+
+    def replace_counters(self, doc_id, counters, timestamp):
+        """Overwrite a document's counter maps and top-level counters"""
+        raise NotImplementedError
+
+    def find_one(self, doc_id):
+        """One document, or None"""
+        raise NotImplementedError
+
+    def find_ids(self, ids):
+        """The existing documents among ids"""
+        raise NotImplementedError
+
+    def find_range(self, low, high):
+        """Documents with low <= id < high, in id order"""
+        raise NotImplementedError
+
+    def merge(self, doc_id, merge):
+        """
+        Atomically read-merge-write a document's fields
+
+        merge(stored document or None) returns the fields to write, or None if
+        nothing changed. It may be called more than once if writers race.
+        """
+        raise NotImplementedError
+
+
+class MongoStorage(AnalyticsStorage):
+    """Documents in a MongoDB collection, updated with server-side $inc"""
+
+    name = "MongoDB"
+
+    def __init__(self, get_collection):
+        self._get_collection = get_collection
+
+    def _collection(self):
+        collection = self._get_collection()
+        if collection is None:
+            raise StorageUnavailable("MongoDB is not configured")
+        return collection
+
+    def available(self):
+        return self._get_collection() is not None
+
+    def increment(self, documents, increments, timestamp):
+        # $inc is applied server-side, so concurrent workers never overwrite each other;
+        # $max keeps last_updated from moving backwards when writes arrive out of order
+        update = {"$inc": increments, "$max": {"last_updated": timestamp}}
+        operations = []
+        for doc_id, on_insert in documents.items():
+            if on_insert:
+                operations.append(UpdateOne({"_id": doc_id}, dict(update, **{"$setOnInsert": on_insert}),
+                                            upsert=True))
+            else:
+                operations.append(UpdateOne({"_id": doc_id}, update, upsert=True))
+        self._collection().bulk_write(operations, ordered=False)
+
+    def replace_counters(self, doc_id, counters, timestamp):
+        self._collection().update_one(
+            {"_id": doc_id},
+            {"$set": dict(counters, last_updated=timestamp)},
+            upsert=True
+        )
+
+    def find_one(self, doc_id):
+        return self._collection().find_one({"_id": doc_id})
+
+    def find_ids(self, ids):
+        return list(self._collection().find({"_id": {"$in": list(ids)}}))
+
+    def find_range(self, low, high):
+        return list(self._collection().find({"_id": {"$gte": low, "$lt": high}}))
+
+    def merge(self, doc_id, merge):
+        # Compare-and-swap on a version field
+        collection = self._collection()
+        for _ in range(CAS_RETRIES):
+            doc = collection.find_one({"_id": doc_id})
+            version = doc.get("version", 0) if doc else 0
+            fields = merge(doc)
+            if fields is None:
+                return
+            try:
+                # Matches only the version we read; if another worker wrote first, the upsert
+                # collides with the existing _id and the merge is retried against its data
+                collection.update_one(
+                    {"_id": doc_id, "version": version},
+                    {"$set": dict(fields, version=version + 1)},
+                    upsert=True
+                )
+                return
+            except Exception as e:
+                if getattr(e, "code", None) != 11000:
+                    raise
+        raise RuntimeError(f"{doc_id} changed {CAS_RETRIES} times while merging")
+
+
+class MemoryStorage(AnalyticsStorage):
+    """Documents in a dict; private to this worker and lost on exit"""
+
+    name = "Memory"
+
+    def __init__(self):
+        self._docs = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _copy(doc):
+        # Copy, so readers never iterate a dict another thread is incrementing
+        return {key: dict(value) if isinstance(value, dict) else value for key, value in doc.items()}
+
+    def increment(self, documents, increments, timestamp):
+        with self._lock:
+            for doc_id, on_insert in documents.items():
+                if doc_id not in self._docs:
+                    self._docs[doc_id] = dict(on_insert, _id=doc_id)
+                apply_increments(self._docs[doc_id], increments, timestamp)
+
+    def replace_counters(self, doc_id, counters, timestamp):
+        with self._lock:
+            doc = self._docs.setdefault(doc_id, {"_id": doc_id})
+            doc.update(self._copy(counters))
+            doc["last_updated"] = timestamp
+
+    def find_one(self, doc_id):
+        with self._lock:
+            doc = self._docs.get(doc_id)
+            return self._copy(doc) if doc is not None else None
+
+    def find_ids(self, ids):
+        with self._lock:
+            return [self._copy(self._docs[i]) for i in ids if i in self._docs]
+
+    def find_range(self, low, high):
+        with self._lock:
+            return [self._copy(doc) for doc_id, doc in sorted(self._docs.items()) if low <= doc_id < high]
+
+    def merge(self, doc_id, merge):
+        with self._lock:
+            doc = self._docs.get(doc_id)
+            fields = merge(self._copy(doc) if doc is not None else None)
+            if fields is None:
+                return
+            if doc is None:
+                doc = self._docs[doc_id] = {"_id": doc_id}
+            doc.update(fields)
+            doc["version"] = doc.get("version", 0) + 1
+
+
+def _dump_fields(fields):
+    return json.dumps({key: {"$binary": base64.b64encode(value).decode("ascii")}
+                       if isinstance(value, (bytes, bytearray)) else value
+                       for key, value in fields.items()})
+
+
+def _load_fields(text):
+    fields = json.loads(text) if text else {}
+    for key, value in fields.items():
+        if isinstance(value, dict) and set(value) == {"$binary"}:
+            fields[key] = base64.b64decode(value["$binary"])
+    return fields
+
+
+class SQLiteStorage(AnalyticsStorage):
+    """
+    Documents in a local SQLite database shared by all workers on the host
+
+    Counters live in their own table, one row per (document, dotted path),
+    so an increment is an INSERT ... ON CONFLICT DO UPDATE that adds to the
+    stored value. A whole batch of increments is applied with executemany
+    in one transaction. Other fields are kept as JSON next to last_updated.
+    The database runs in WAL mode, so readers do not block the writer.
+    """
+
+    name = "SQLite"
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS analytics_documents (
+               doc_id TEXT PRIMARY KEY,
+               last_updated TEXT NOT NULL DEFAULT '',
+               fields TEXT NOT NULL DEFAULT '{}'
+           ) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS analytics_counters (
+               doc_id TEXT NOT NULL,
+               path TEXT NOT NULL,
+               value INTEGER NOT NULL,
+               PRIMARY KEY (doc_id, path)
+           ) WITHOUT ROWID""",
+    )
+
+    def __init__(self, path=SQLITE_PATH, timeout=30.0):
+        self.path = path
+        self._connections = SQLiteConnections(path, self.SCHEMA, timeout)
+
+    def increment(self, documents, increments, timestamp):
+        with self._connections.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO analytics_documents (doc_id, last_updated, fields) VALUES (?, ?, ?) "
+                "ON CONFLICT (doc_id) DO UPDATE SET last_updated = max(last_updated, excluded.last_updated)",
+                [(doc_id, timestamp, _dump_fields(on_insert)) for doc_id, on_insert in documents.items()]
+            )
+            conn.executemany(
+                "INSERT INTO analytics_counters (doc_id, path, value) VALUES (?, ?, ?) "
+                "ON CONFLICT (doc_id, path) DO UPDATE SET value = value + excluded.value",
+                [(doc_id, path, amount) for doc_id in documents for path, amount in increments.items()]
+            )
+
+    def replace_counters(self, doc_id, counters, timestamp):
+        rows = []
+        with self._connections.transaction() as conn:
+            for name, value in counters.items():
+                if isinstance(value, dict):
+                    # Every path below the category: '/' sorts right after '.'
+                    conn.execute("DELETE FROM analytics_counters WHERE doc_id = ? AND path >= ? AND path < ?",
+                                 (doc_id, name + ".", name + "/"))
+                    rows.extend((doc_id, f"{name}.{key}", amount) for key, amount in value.items())
+                else:
+                    rows.append((doc_id, name, value))
+            conn.executemany("INSERT OR REPLACE INTO analytics_counters (doc_id, path, value) VALUES (?, ?, ?)",
+                             rows)
+            conn.execute(
+                "INSERT INTO analytics_documents (doc_id, last_updated) VALUES (?, ?) "
+                "ON CONFLICT (doc_id) DO UPDATE SET last_updated = excluded.last_updated",
+                (doc_id, timestamp)
+            )
+
+    def _assemble(self, conn, where, params):
+        docs = {}
+        for doc_id, last_updated, fields in conn.execute(
+                f"SELECT doc_id, last_updated, fields FROM analytics_documents WHERE {where} ORDER BY doc_id",
+                params):
+            doc = _load_fields(fields)
+            doc["_id"] = doc_id
+            doc["last_updated"] = last_updated
+            docs[doc_id] = doc
+        for doc_id, path, value in conn.execute(
+                f"SELECT doc_id, path, value FROM analytics_counters WHERE {where}", params):
+            doc = docs.get(doc_id)
+            if doc is None:
+                continue
+            category, dot, key = path.partition(".")
+            if dot:
+                doc.setdefault(category, {})[key] = value
+            else:
+                doc[path] = value
+        return list(docs.values())
+
+    def find_one(self, doc_id):
+        docs = self._assemble(self._connections.get(), "doc_id = ?", (doc_id,))
+        return docs[0] if docs else None
+
+    def find_ids(self, ids):
+        ids = list(ids)
+        conn = self._connections.get()
+        docs = []
+        for start in range(0, len(ids), SQLITE_MAX_PARAMS):
+            chunk = ids[start:start + SQLITE_MAX_PARAMS]
+            docs.extend(self._assemble(conn, f"doc_id IN ({', '.join('?' * len(chunk))})", chunk))
+        return docs
+
+    def find_range(self, low, high):
+        return self._assemble(self._connections.get(), "doc_id >= ? AND doc_id < ?", (low, high))
+
+    def merge(self, doc_id, merge):
+        with self._connections.transaction() as conn:
+            row = conn.execute("SELECT fields FROM analytics_documents WHERE doc_id = ?", (doc_id,)).fetchone()
+            doc = None
+            if row is not None:
+                doc = _load_fields(row[0])
+                doc["_id"] = doc_id
+            fields = merge(doc)
+            if fields is None:
+                return
+            stored = dict(doc or {}, **fields)
+            stored.pop("_id", None)
+            conn.execute(
+                "INSERT INTO analytics_documents (doc_id, fields) VALUES (?, ?) "
+                "ON CONFLICT (doc_id) DO UPDATE SET fields = excluded.fields",
+                (doc_id, _dump_fields(stored))
+            )
+
+
+def create_storage(kind, get_collection=None):
+    """Backend for an ANALYTICS_STORAGE value: "mongodb", "sqlite" or "memory" """
+    kind = kind.lower()
+    if kind in ("mongodb", "mongo"):
+        return MongoStorage(get_collection)
+    if kind == "sqlite":
+        return SQLiteStorage()
+    if kind == "memory":
+        return MemoryStorage()
+    raise ValueError(f"Unknown analytics storage: {kind}")
@@ -1,5 +1,6 @@
 from flask import Blueprint, render_template, url_for, flash, redirect, request
-from models import User, bcrypt
+from models import User
+from password_hasher import get_password_hasher, HasherBusy
 
 from flask_login import login_user, current_user, logout_user, login_required
 
@@ -19,21 +20,28 @@ def register():
             flash('Passwords do not match', 'error')
             return render_template('register.html')
 
-        user_exists = User.find_by_username(username)
-        if user_exists:
+        conflicts = User.find_conflicts(username, email)
+        if 'username' in conflicts:
             flash('Username already exists', 'error')
             return render_template('register.html')
         
-        email_exists = User.find_by_email(email)
-        if email_exists:
+        if 'email' in conflicts:
             flash('Email already registered', 'error')
             return render_template('register.html')
 
-        hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+        try:
+            hashed_password = get_password_hasher().hash(password)
+        except HasherBusy:
+            flash('The server is busy, please try again in a moment', 'error')
+            return render_template('register.html')
         user = User(username=username, email=email, password=hashed_password)
         if user.save():
             flash('Your account has been created! You are now able to log in', 'success')
             return redirect(url_for('auth.login'))
+        elif user.duplicate_field == 'username':
+            flash('Username already exists', 'error')
+        elif user.duplicate_field == 'email':
+            flash('Email already registered', 'error')
         else:
             flash('An error occurred while creating your account. Please try again.', 'error')
             
@@ -47,7 +55,16 @@ def login():
         email = request.form.get('email')
         password = request.form.get('password')
         user = User.find_by_email(email)
-        if user and bcrypt.check_password_hash(user.password, password):
+        hasher = get_password_hasher()
+        try:
+            valid = user is not None and hasher.check(user.password, password)
+        except HasherBusy:
+            flash('The server is busy, please try again in a moment', 'error')
+            return render_template('login.html')
+        if valid:
+            # Hashes made with an older, cheaper work factor are upgraded now that we have the password
+            if hasher.needs_rehash(user.password):
+                hasher.rehash_in_background(password, user.update_password)
             login_user(user, remember=request.form.get('remember'))
             next_page = request.args.get('next')
             return redirect(next_page) if next_page else redirect(url_for('index'))
@@ -1,7 +1,14 @@
-import joblib
 import os
-from flask import Flask, render_template, request, flash, redirect, url_for, session
+import io
+import base64
+import numpy as np
+from flask import Flask, render_template, request, flash, redirect, url_for, session, jsonify, Response, stream_with_context
 from models import User, bcrypt
+from password_hasher import get_password_hasher, get_hasher_stats
+from model_service import (get_model, validate_features, parse_record, predict_batch, predict_top_k,
+                           predict_cached, get_prediction_cache_stats, get_batcher_stats,
+                           stream_csv_predictions, build_grid_axes, sweep_grid, FEATURES)
+from similar_farms import find_similar_farms
 
 from flask_login import LoginManager, login_required, current_user
 
@@ -12,6 +19,15 @@ app.secret_key = 'your-secret-key-change-in-production'  # Change this in produc
 # Initialize Bcrypt
 bcrypt.init_app(app)
 
+# Upper bound on records accepted by the batch prediction API
+BATCH_MAX_RECORDS = int(os.getenv('BATCH_MAX_RECORDS', '10000'))
+
+# Number of ranked crops shown on the prediction result page
+TOP_K_CROPS = int(os.getenv('TOP_K_CROPS', '3'))
+
+# Upper bound on neighbours returned by the similar farms API
+SIMILAR_FARMS_MAX_K = int(os.getenv('SIMILAR_FARMS_MAX_K', '50'))
+
 login_manager = LoginManager(app)
 login_manager.login_view = 'auth.login'
 login_manager.login_message_category = 'info'
@@ -20,10 +36,17 @@ login_manager.login_message_category = 'info'
 def load_user(user_id):
     return User.get(user_id)
 
+# Calibrate the bcrypt work factor now rather than on the first login
+get_password_hasher()
+
 # Register Auth Blueprint
 from auth import auth as auth_blueprint
 app.register_blueprint(auth_blueprint)
 
+# Analytics events tracked during a request are written once, when it ends
+from analytics import init_app as init_analytics
+init_analytics(app)
+
 # For debugging production crashes - remove before final delivery
 @app.errorhandler(500)
 @app.errorhandler(Exception)
@@ -131,34 +154,34 @@ def brain():
         ph = float(request.form['PH'])
         rainfall = float(request.form['Rainfall'])
 
-        # Validate input ranges
-        if not (0 < ph <= 14):
-            flash('PH value must be between 0 and 14', 'error')
-            return redirect(url_for('crop_prediction'))
-        
-        if not (temperature < 100):
-            flash('Temperature must be less than 100°C', 'error')
-            return redirect(url_for('crop_prediction'))
-        
-        if not (humidity > 0):
-            flash('Humidity must be greater than 0%', 'error')
-            return redirect(url_for('crop_prediction'))
-
         # Prepare input for model
         value = [nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall]
 
-        # Load model and make prediction
-        if not os.path.exists('crop_recommend'):
+        # Validate input ranges
+        error = validate_features(value)
+        if error:
+            flash(error, 'error')
+            return redirect(url_for('crop_prediction'))
+
+        # Get the cached model and make prediction
+        try:
+            model = get_model()
+        except FileNotFoundError:
             flash('Model file not found. Please contact administrator.', 'error')
             return redirect(url_for('crop_prediction'))
         
-        model = joblib.load('crop_recommend')
-        arr = [value]
-        prediction = model.predict(arr)
-        
-        # Clean up prediction output - remove brackets and quotes
-        crop_name = str(prediction[0]) if len(prediction) > 0 else "Unknown"
+        # Main prediction and ranked alternatives come from one predict_proba call,
+        # skipped entirely when the same rounded inputs were seen recently
+        result = predict_cached(value, k=TOP_K_CROPS, model=model)
+        crop_name = result['prediction']
+        alternatives = result['top_k'][1:]
         track_crop_search(crop_name)
+
+        # Closest historical samples, shown as precedents next to the prediction
+        try:
+            similar_farms = find_similar_farms(value)
+        except OSError:
+            similar_farms = []
         
         # Store input values to display on result page
         input_data = {
@@ -171,7 +194,9 @@ def brain():
             'rainfall': rainfall
         }
         
-        return render_template('predict.html', prediction=crop_name, input_data=input_data)
+        return render_template('predict.html', prediction=crop_name, input_data=input_data,
+                               top_crops=result['top_k'], alternatives=alternatives,
+                               similar_farms=similar_farms)
     
     except ValueError as e:
         flash('Invalid input values. Please enter valid numbers.', 'error')
@@ -181,6 +206,171 @@ def brain():
         return redirect(url_for('crop_prediction'))
 
 
+@app.route('/api/predict/batch', methods=["POST"])
+def predict_batch_api():
+    """Predict crops for an array of soil/climate records in one model call"""
+    from analytics import track_feature
+    track_feature('Batch Crop Prediction')
+
+    payload = request.get_json(silent=True)
+    records = payload.get('records') if isinstance(payload, dict) else payload
+    if not isinstance(records, list) or not records:
+        return jsonify({'success': False, 'error': 'Expected a non-empty JSON array of records'}), 400
+    if len(records) > BATCH_MAX_RECORDS:
+        return jsonify({'success': False,
+                        'error': f'Batch too large (maximum {BATCH_MAX_RECORDS} records)'}), 413
+
+    # Optional ranked alternatives, from the body or the query string
+    top_k = payload.get('top_k') if isinstance(payload, dict) else None
+    top_k = top_k if top_k is not None else request.args.get('top_k')
+    if top_k is not None:
+        try:
+            top_k = int(top_k)
+        except (TypeError, ValueError):
+            top_k = 0
+        if top_k < 1:
+            return jsonify({'success': False, 'error': 'top_k must be a positive integer'}), 400
+
+    # Validate every record with the same rules as the prediction form
+    rows = []
+    errors = []
+    for index, record in enumerate(records):
+        try:
+            values = parse_record(record)
+        except ValueError as e:
+            errors.append({'index': index, 'error': str(e)})
+            continue
+        error = validate_features(values)
+        if error:
+            errors.append({'index': index, 'error': error})
+        rows.append(values)
+    if errors:
+        return jsonify({'success': False, 'error': 'Invalid records', 'errors': errors}), 400
+
+    try:
+        if top_k:
+            results = predict_top_k(rows, k=top_k)
+        else:
+            predictions = predict_batch(rows)
+    except FileNotFoundError:
+        return jsonify({'success': False, 'error': 'Model file not found'}), 503
+
+    if top_k:
+        return jsonify({'success': True, 'count': len(results),
+                        'predictions': [result['prediction'] for result in results],
+                        'top_k': [result['top_k'] for result in results]})
+    return jsonify({'success': True, 'count': len(predictions), 'predictions': predictions})
+
+
+@app.route('/api/predict/csv', methods=["POST"])
+def predict_csv_api():
+    """Stream crop predictions for an uploaded CSV in the Crop_recommendation.csv layout"""
+    from analytics import track_feature
+    track_feature('CSV Crop Prediction')
+
+    fmt = request.args.get('format', 'csv')
+
+    # Multipart uploads are spooled to disk by Werkzeug; a raw text/csv body is read straight from the socket
+    upload = request.files.get('file')
+    if upload is not None:
+        raw = upload.stream
+    elif request.mimetype == 'text/csv':
+        raw = request.stream
+    else:
+        return jsonify({'success': False, 'error': "Upload a CSV as the 'file' field or as a text/csv body"}), 400
+    lines = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+
+    try:
+        chunks = stream_csv_predictions(lines, fmt=fmt)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except FileNotFoundError:
+        return jsonify({'success': False, 'error': 'Model file not found'}), 503
+
+    if fmt == 'ndjson':
+        mimetype, filename = 'application/x-ndjson', 'predictions.ndjson'
+    else:
+        mimetype, filename = 'text/csv', 'predictions.csv'
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+@app.route('/api/predict/grid', methods=["POST"])
+def predict_grid_api():
+    """
+    What-if sweep: vary some features over ranges while the rest stay fixed
+
+    Body: {"base": {7 features}, "ranges": {"rainfall": {"start": 50, "stop": 300, "steps": 100}, ...},
+           "format": "base64" | "list"}
+    """
+    from analytics import track_feature
+    track_feature('Crop Grid Sweep')
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'success': False, 'error': 'Expected a JSON object with base and ranges'}), 400
+    fmt = payload.get('format', 'base64')
+    if fmt not in ('base64', 'list'):
+        return jsonify({'success': False, 'error': "format must be 'base64' or 'list'"}), 400
+
+    try:
+        base = parse_record(payload.get('base'))
+        axes = build_grid_axes(base, payload.get('ranges'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    if fmt == 'list' and np.prod([len(values) for _, values in axes]) > 10000:
+        return jsonify({'success': False, 'error': "Use format 'base64' for grids over 10000 cells"}), 400
+
+    try:
+        model = get_model()
+    except FileNotFoundError:
+        return jsonify({'success': False, 'error': 'Model file not found'}), 503
+    grid = sweep_grid(base, axes, model=model)
+
+    response = {
+        'success': True,
+        'features': [FEATURES[index] for index, _ in axes],
+        'axes': {FEATURES[index]: values.tolist() for index, values in axes},
+        'shape': list(grid.shape),
+        'labels': [str(label) for label in model.classes_],
+        'label_counts': {str(model.classes_[i]): int(n)
+                         for i, n in enumerate(np.bincount(grid.ravel(), minlength=len(model.classes_))) if n},
+    }
+    if fmt == 'list':
+        response['cells'] = grid.tolist()
+    else:
+        # Row-major class indices, one byte per cell (two above 255 classes)
+        response['dtype'] = grid.dtype.name
+        response['cells'] = base64.b64encode(grid.tobytes()).decode('ascii')
+    return jsonify(response)
+
+
+@app.route('/api/similar', methods=["POST"])
+def similar_farms_api():
+    """Nearest samples in Crop_recommendation.csv for one soil/climate record"""
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'success': False, 'error': 'Expected a JSON object with a record'}), 400
+
+    try:
+        values = parse_record(payload.get('record'))
+        k = int(payload.get('k', request.args.get('k', 5)))
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if not 1 <= k <= SIMILAR_FARMS_MAX_K:
+        return jsonify({'success': False, 'error': f'k must be between 1 and {SIMILAR_FARMS_MAX_K}'}), 400
+    error = validate_features(values)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+
+    try:
+        neighbours = find_similar_farms(values, k)
+    except OSError:
+        return jsonify({'success': False, 'error': 'Dataset file not found'}), 503
+    return jsonify({'success': True, 'count': len(neighbours), 'neighbours': neighbours})
+
+
 @app.route('/contact', methods=["POST"])
 def contact():
     """Handle contact/donation form submissions"""
@@ -265,9 +455,18 @@ def scheme_detail(scheme_id):
 @login_required
 def analytics_dashboard():
     """Analytics dashboard showing usage statistics"""
-    from analytics import get_analytics_summary
-    summary = get_analytics_summary()
-    return render_template('analytics.html', summary=summary)
+    from analytics import get_cached_summary, get_buffer_stats, SUMMARY_RANGES, SUMMARY_CACHE_TTL
+    selected_range = request.args.get('range', 'all')
+    if selected_range not in SUMMARY_RANGES:
+        selected_range = 'all'
+    summary = get_cached_summary(selected_range)
+    return render_template('analytics.html', summary=summary,
+                           ranges=SUMMARY_RANGES, selected_range=selected_range,
+                           summary_ttl=SUMMARY_CACHE_TTL,
+                           prediction_cache=get_prediction_cache_stats(),
+                           prediction_batcher=get_batcher_stats(),
+                           password_hasher=get_hasher_stats(),
+                           analytics_buffer=get_buffer_stats())
 
 
 # Weather Forecast Routes
@@ -0,0 +1,192 @@
+"""
+Database Module
+The one MongoDB client shared by users and analytics in each worker process,
+and connections to the local SQLite database used without MongoDB
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+# Load environment variables
+load_dotenv()
+
+# MongoDB Configuration
+MONGO_URI = os.getenv("MONGO_URI")
+DB_NAME = "agriculture_website"
+
+# Connection pool and timeouts of the shared client
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "10000"))
+
+# How long (seconds) a health check result is reused before pinging again
+MONGO_HEALTH_CHECK_INTERVAL = float(os.getenv("MONGO_HEALTH_CHECK_INTERVAL", "30"))
+
+# After a failed ping, retry after this many seconds, doubling with each further failure
+MONGO_HEALTH_RETRY_INTERVAL = float(os.getenv("MONGO_HEALTH_RETRY_INTERVAL", "1"))
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Local database for single-host deployments
+SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join(BASE_DIR, 'instance', 'site.db'))
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+_health = None
+_health_checked = 0.0
+_health_failures = 0
+_health_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Get this process's MongoDB client, or None if MONGO_URI is not set
+
+    The client is created on first use with connect=False, so importing the
+    app in a preloading master opens no sockets or monitor threads. A
+    client inherited through fork() is never used: the child creates its
+    own.
+    """
+    global _client, _client_pid, _health, _health_failures, _health_lock
+    if not MONGO_URI:
+        return None
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            # The parent's client (if any) is left alone; its sockets belong to the parent
+            _client, _client_pid, _health = None, pid, None
+            _health_failures, _health_lock = 0, threading.Lock()
+            try:
+                # Note: dnspython is required for srv URIs
+                _client = MongoClient(
+                    MONGO_URI,
+                    connect=False,
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                    socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+                )
+            except Exception as e:
+                print(f"MongoDB connection setup failed: {e}")
+        return _client
+
+
+def _health_is_fresh(max_age):
+    """Whether the last health check result can still be used"""
+    if _health is None:
+        return False
+    if not _health:
+        max_age = min(max_age, MONGO_HEALTH_RETRY_INTERVAL * 2 ** (_health_failures - 1))
+    return time.monotonic() - _health_checked < max_age
+
+
+def check_health(max_age=MONGO_HEALTH_CHECK_INTERVAL):
+    """
+    Whether the server answered a ping
+
+    A success is reused for max_age seconds. A failure is re-checked after
+    MONGO_HEALTH_RETRY_INTERVAL seconds, doubling with each consecutive
+    failure up to max_age, so one lost ping does not take MongoDB out of
+    service for long. One thread pings at a time; the others use the last
+    result meanwhile.
+    """
+    global _health, _health_checked, _health_failures
+    client = get_client()
+    if client is None:
+        return False
+    if _health_is_fresh(max_age):
+        return _health
+    lock = _health_lock
+    # Only the very first check has no result to fall back on, so only it waits
+    if not lock.acquire(blocking=_health is None):
+        return _health
+    try:
+        if _health_is_fresh(max_age):
+            return _health
+        now = time.monotonic()
+        try:
+            client.admin.command("ping")
+            healthy = True
+        except Exception as e:
+            print(f"MongoDB health check failed: {e}")
+            healthy = False
+        _health_failures = 0 if healthy else _health_failures + 1
+        _health, _health_checked = healthy, now
+        return healthy
+    finally:
+        lock.release()
+
+
+def get_collection(name):
+    """
+    Get a collection of the application database, or None
+
+    None means MongoDB is not configured or failed its last health check,
+    so callers fall back right away instead of each waiting for the
+    server selection timeout.
+    """
+    client = get_client()
+    if client is None or not check_health():
+        return None
+    try:
+        return client[DB_NAME][name]
+    except Exception as e:
+        print(f"MongoDB selection error: {e}")
+        return None
+
+
+class SQLiteConnections:
+    """
+    Per-thread connections to one SQLite database file
+
+    Connections are opened on first use in each thread, and again in a
+    forked child, in WAL mode so readers never block the writer and
+    writers in other processes wait up to `timeout` seconds for the lock.
+    The `schema` statements (CREATE ... IF NOT EXISTS) run on every new
+    connection. Statements are passed as constant SQL with ? parameters,
+    so sqlite3 reuses their prepared form from the connection's cache.
+    """
+
+    def __init__(self, path=SQLITE_PATH, schema=(), timeout=30.0):
+        self.path = path
+        self.schema = schema
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def get(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Autocommit; transactions are opened explicitly in transaction()
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in self.schema:
+                conn.execute(statement)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        conn = self.get()
+        # Take the write lock up front, so read-modify-write sequences cannot interleave
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
@@ -0,0 +1,264 @@
+"""
+Model Registry Module
+Stores versioned crop model artifacts with their metadata and an "active"
+pointer that serving workers follow
+
+Layout:
+    <registry>/versions/<version>/model.compiled/|model.npz|model.joblib
+    <registry>/versions/<version>/metadata.json
+    <registry>/ACTIVE.json     {"active": "<version>", "history": [...]}
+
+Usage:
+    python model_registry.py list
+    python model_registry.py register crop_recommend.compiled crop_recommend --activate
+    python model_registry.py activate <version>
+    python model_registry.py rollback
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+REGISTRY_DIR = os.getenv("CROP_MODEL_REGISTRY", os.path.join(BASE_DIR, 'instance', 'model_registry'))
+
+# Artifact names inside a version directory, in serving preference order
+ARTIFACT_NAMES = ('model.compiled', 'model.npz', 'model.joblib')
+
+
+class RegistryError(Exception):
+    """Raised for unknown versions or an invalid registry operation"""
+
+
+def file_sha256(path):
+    """SHA-256 of a file, or of the names and contents of the files in a directory"""
+    digest = hashlib.sha256()
+    paths = [path]
+    if os.path.isdir(path):
+        paths = [os.path.join(path, name) for name in sorted(os.listdir(path))]
+    for file_path in paths:
+        if file_path != path:
+            digest.update(os.path.basename(file_path).encode())
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(65536), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_json_atomic(path, data):
+    """Write JSON via a temp file and rename, so readers never see a partial file"""
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class ModelRegistry:
+    """Versioned artifacts on the local filesystem with an atomically swapped active pointer"""
+
+    def __init__(self, root=REGISTRY_DIR):
+        self.root = root
+        self.versions_dir = os.path.join(root, 'versions')
+        self.pointer_path = os.path.join(root, 'ACTIVE.json')
+
+    def _read_pointer(self):
+        try:
+            with open(self.pointer_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {'active': None, 'history': []}
+
+    def _version_dir(self, version):
+        path = os.path.join(self.versions_dir, version)
+        if not version or os.sep in version or not os.path.isdir(path):
+            raise RegistryError(f"Unknown model version: {version}")
+        return path
+
+    def register(self, artifacts, data_sha256=None, metrics=None, notes=None):
+        """
+        Copy artifacts into a new immutable version
+
+        Args:
+            artifacts (list): Paths of compiled arrays (directory or .npz) and/or a joblib pickle
+            data_sha256 (str): Hash of the training data
+            metrics (dict): Evaluation metrics to keep with the version
+            notes (str): Free-text description
+
+        Returns:
+            str: The new version id
+        """
+        os.makedirs(self.versions_dir, exist_ok=True)
+        created_at = datetime.now()
+        base = created_at.strftime('v%Y%m%d-%H%M%S')
+        version, counter = base, 1
+        while os.path.exists(os.path.join(self.versions_dir, version)):
+            counter += 1
+            version = f"{base}-{counter}"
+
+        # Build the version in a staging directory and rename it into place in one step
+        staging = tempfile.mkdtemp(dir=self.versions_dir, prefix='.staging-')
+        try:
+            files = {}
+            for source in artifacts:
+                if os.path.isdir(source):
+                    name = 'model.compiled'
+                elif source.endswith('.npz'):
+                    name = 'model.npz'
+                else:
+                    name = 'model.joblib'
+                if name in files:
+                    raise RegistryError(f"More than one artifact maps to {name}")
+                if name == 'model.compiled':
+                    shutil.copytree(source, os.path.join(staging, name))
+                else:
+                    shutil.copyfile(source, os.path.join(staging, name))
+                files[name] = file_sha256(source)
+            if not files:
+                raise RegistryError("No artifacts given")
+
+            _write_json_atomic(os.path.join(staging, 'metadata.json'), {
+                'version': version,
+                'created_at': created_at.isoformat(),
+                'data_sha256': data_sha256,
+                'metrics': metrics or {},
+                'artifacts': files,
+                'notes': notes,
+            })
+            os.rename(staging, os.path.join(self.versions_dir, version))
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return version
+
+    def metadata(self, version):
+        with open(os.path.join(self._version_dir(version), 'metadata.json')) as f:
+            return json.load(f)
+
+    def list_versions(self):
+        """Metadata of every version, oldest first"""
+        if not os.path.isdir(self.versions_dir):
+            return []
+        versions = sorted(name for name in os.listdir(self.versions_dir) if not name.startswith('.'))
+        return [self.metadata(version) for version in versions]
+
+    def active_version(self):
+        return self._read_pointer().get('active')
+
+    def artifact_path(self, version):
+        """Path of the artifact the server should load for a version"""
+        directory = self._version_dir(version)
+        for name in ARTIFACT_NAMES:
+            path = os.path.join(directory, name)
+            if os.path.exists(path):
+                return path
+        raise RegistryError(f"Version {version} has no artifact")
+
+    def active_artifact_path(self):
+        """Artifact path of the active version, or None if nothing is active"""
+        version = self.active_version()
+        return self.artifact_path(version) if version else None
+
+    def activate(self, version):
+        """Point serving at a version; the previous one is kept for rollback"""
+        self._version_dir(version)
+        pointer = self._read_pointer()
+        if pointer.get('active') == version:
+            return
+        history = pointer.get('history', [])
+        if pointer.get('active'):
+            history.append(pointer['active'])
+        _write_json_atomic(self.pointer_path, {
+            'active': version,
+            'history': history,
+            'activated_at': datetime.now().isoformat(),
+        })
+
+    def rollback(self):
+        """
+        Flip the pointer back to the previously active version
+
+        Returns:
+            str: The version now active
+        """
+        pointer = self._read_pointer()
+        history = pointer.get('history', [])
+        if not history:
+            raise RegistryError("No previous version to roll back to")
+        version = history.pop()
+        self._version_dir(version)
+        _write_json_atomic(self.pointer_path, {
+            'active': version,
+            'history': history,
+            'activated_at': datetime.now().isoformat(),
+        })
+        return version
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Manage versioned crop model artifacts')
+    parser.add_argument('--registry', default=REGISTRY_DIR, help='Registry directory')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('list', help='List versions')
+
+    register = subparsers.add_parser('register', help='Register artifact files as a new version')
+    register.add_argument('artifacts', nargs='+')
+    register.add_argument('--data', help='Training CSV to hash into the metadata')
+    register.add_argument('--metrics', help='JSON file with evaluation metrics')
+    register.add_argument('--notes')
+    register.add_argument('--activate', action='store_true', help='Make the new version active')
+
+    activate = subparsers.add_parser('activate', help='Make a version active')
+    activate.add_argument('version')
+
+    subparsers.add_parser('rollback', help='Re-activate the previously active version')
+
+    args = parser.parse_args(argv)
+    registry = ModelRegistry(args.registry)
+
+    try:
+        if args.command == 'list':
+            active = registry.active_version()
+            for meta in registry.list_versions():
+                marker = '*' if meta['version'] == active else ' '
+                accuracy = meta.get('metrics', {}).get('accuracy')
+                accuracy = f"accuracy={accuracy:.4f}" if accuracy is not None else ''
+                print(f"{marker} {meta['version']}  {meta['created_at'][:19]}  "
+                      f"{', '.join(meta['artifacts'])}  {accuracy}")
+        elif args.command == 'register':
+            metrics = None
+            if args.metrics:
+                with open(args.metrics) as f:
+                    metrics = json.load(f)
+            data_sha256 = file_sha256(args.data) if args.data else None
+            version = registry.register(args.artifacts, data_sha256, metrics, args.notes)
+            print(f"Registered {version}")
+            if args.activate:
+                registry.activate(version)
+                print(f"Activated {version}")
+        elif args.command == 'activate':
+            registry.activate(args.version)
+            print(f"Activated {args.version}")
+        elif args.command == 'rollback':
+            print(f"Rolled back to {registry.rollback()}")
+    except RegistryError as e:
+        print(f"Error: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
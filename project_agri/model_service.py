@@ -0,0 +1,643 @@
+"""
+Model Service Module
+Keeps the crop recommendation model loaded once per worker process and
+swaps in a new version when the registry pointer or model file changes
+"""
+
+import os
+import csv
+import io
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from model_registry import ModelRegistry, RegistryError, file_sha256
+from prediction_batcher import MicroBatcher, BATCH_MAX_WAIT_MS
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Artifacts bundled with the app, used when the model registry has no active version.
+# The compiled arrays (see tree_compiler.py) are preferred: serving them needs only NumPy,
+# and the directory of .npy files is memory-mapped, so all workers share one copy.
+BUNDLED_MODEL_PATHS = [os.path.join(BASE_DIR, 'crop_recommend.compiled'), os.path.join(BASE_DIR, 'crop_recommend')]
+
+# A sample the holder predicts once before putting a newly loaded model into service
+WARMUP_SAMPLE = [90.0, 42.0, 43.0, 20.88, 82.0, 6.5, 202.9]
+
+# Model inputs, in training column order (same layout as Crop_recommendation.csv)
+FEATURES = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+
+# Rows predicted per model call when streaming CSV uploads
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "5000"))
+
+# Grid sweeps: cells predicted per model call, and the largest grid accepted
+GRID_CHUNK_CELLS = int(os.getenv("GRID_CHUNK_CELLS", "65536"))
+GRID_MAX_CELLS = int(os.getenv("GRID_MAX_CELLS", "4000000"))
+
+# Prediction cache size (entries per worker) and the decimal places each feature is
+# rounded to before it is used as a key, e.g. PREDICTION_CACHE_PRECISION="ph=1,rainfall=0"
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "4096"))
+DEFAULT_CACHE_PRECISION = {'N': 0, 'P': 0, 'K': 0, 'temperature': 1, 'humidity': 1, 'ph': 2, 'rainfall': 1}
+
+# How often (seconds) the holder checks the registry and model file for a new version
+RELOAD_CHECK_INTERVAL = float(os.getenv("CROP_MODEL_RELOAD_INTERVAL", "2.0"))
+
+
+def load_artifact(path):
+    """
+    Load a model file
+
+    Directories and .npz files are compiled trees evaluated with NumPy alone
+    (directories are memory-mapped); anything else is a joblib pickle, so
+    joblib and scikit-learn are only imported when needed.
+    """
+    if os.path.isdir(path) or path.endswith('.npz'):
+        from tree_compiler import CompiledTreeModel
+        return CompiledTreeModel.load(path)
+
+    import joblib
+    return joblib.load(path)
+
+
+def resolve_model_path(registry=None):
+    """
+    Path of the model this worker should serve
+
+    CROP_MODEL_PATH pins a file; otherwise the registry's active version is
+    used, falling back to the artifact bundled next to this module.
+    """
+    pinned = os.getenv("CROP_MODEL_PATH")
+    if pinned:
+        return pinned
+    try:
+        path = (registry or _registry).active_artifact_path()
+    except (RegistryError, OSError) as e:
+        print(f"Model registry error, using bundled model: {e}")
+        path = None
+    if path:
+        return path
+    for path in BUNDLED_MODEL_PATHS:
+        if os.path.exists(path):
+            return path
+    return BUNDLED_MODEL_PATHS[-1]
+
+
+class ModelHolder:
+    """
+    Process-wide holder for a deserialized model.
+
+    The model is loaded on first use and kept in memory. At most every
+    `check_interval` seconds the holder re-resolves its path (a fixed path or
+    a callable such as resolve_model_path) and compares (path, inode, mtime, size)
+    with the loaded version; when it differs the contents are hashed, and
+    only a real content change triggers a reload.
+
+    A new model is loaded and warmed with one prediction before the
+    reference is swapped, so callers always see a complete, ready model.
+    With `background=True` that happens on a separate thread while requests
+    keep using the current model. A model that fails to load or warm is
+    skipped until its file changes again.
+    """
+
+    def __init__(self, path, loader=load_artifact, check_interval=RELOAD_CHECK_INTERVAL,
+                 warm=True, background=True):
+        self.path = path
+        self.loader = loader
+        self.check_interval = check_interval
+        self.warm = warm
+        self.background = background
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._reload_thread = None
+        self._model = None
+        self._signature = None
+        self._failed_signature = None
+        self._digest = None
+        self._last_check = 0.0
+        self.model_path = None
+        self.loaded_at = None
+        self.reloads = 0
+
+    def current_path(self):
+        return self.path() if callable(self.path) else self.path
+
+    def _warm_up(self, model):
+        """Run one prediction so lazy initialisation happens before the swap"""
+        sample = np.asarray([WARMUP_SAMPLE])
+        if hasattr(model, 'predict'):
+            model.predict(sample)
+        if hasattr(model, 'predict_proba'):
+            model.predict_proba(sample)
+
+    def _refresh(self):
+        """Load, warm and swap in the model if its file changed"""
+        with self._reload_lock:
+            path = self.current_path()
+            stat = os.stat(path)
+            # The inode changes when save() renames a new compiled directory into place
+            signature = (path, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if self._model is not None and signature in (self._signature, self._failed_signature):
+                return
+
+            digest = file_sha256(path)
+            if self._model is not None and digest == self._digest:
+                self._signature = signature
+                return
+
+            try:
+                model = self.loader(path)
+                if self.warm:
+                    self._warm_up(model)
+            except Exception:
+                self._failed_signature = signature
+                raise
+
+            if self._model is not None:
+                self.reloads += 1
+            # Single reference assignment - readers see either the old or the new model
+            self._model = model
+            self._digest = digest
+            self._signature = signature
+            self.model_path = path
+            self.loaded_at = time.time()
+
+    def _refresh_quietly(self):
+        """Reload in the background; failures keep the current model in service"""
+        try:
+            self._refresh()
+        except FileNotFoundError:
+            # Keep serving the loaded model while a deploy replaces the file
+            pass
+        except Exception as e:
+            print(f"Model reload failed, keeping current model: {e}")
+
+    def get(self):
+        """
+        Get the current model, loading it on first use and scheduling reloads
+
+        Raises:
+            FileNotFoundError: If the model file does not exist and no model is loaded
+        """
+        model = self._model
+        now = time.monotonic()
+        if model is not None and now - self._last_check < self.check_interval:
+            return model
+
+        with self._lock:
+            if self._model is None:
+                self._refresh()
+                self._last_check = now
+            elif now - self._last_check >= self.check_interval:
+                self._last_check = now
+                if not self.background:
+                    self._refresh_quietly()
+                elif self._reload_thread is None or not self._reload_thread.is_alive():
+                    self._reload_thread = threading.Thread(target=self._refresh_quietly, daemon=True)
+                    self._reload_thread.start()
+            return self._model
+
+    def wait_for_reload(self, timeout=None):
+        """Block until a background reload in progress has finished"""
+        thread = self._reload_thread
+        if thread is not None:
+            thread.join(timeout)
+
+
+_registry = ModelRegistry()
+_holder = ModelHolder(resolve_model_path)
+
+
+def get_model():
+    """Get the cached crop recommendation model for this worker"""
+    return _holder.get()
+
+
+def validate_features(values):
+    """
+    Validate one sample against the rules used by the prediction form
+
+    Args:
+        values (list): Feature values in FEATURES order
+
+    Returns:
+        str: Error message, or None if the sample is valid
+    """
+    temperature, humidity, ph = values[3], values[4], values[5]
+    if not (0 < ph <= 14):
+        return 'PH value must be between 0 and 14'
+    if not (temperature < 100):
+        return 'Temperature must be less than 100°C'
+    if not (humidity > 0):
+        return 'Humidity must be greater than 0%'
+    return None
+
+
+def parse_record(record):
+    """
+    Convert a JSON record to a list of floats in FEATURES order
+
+    Accepts either an object keyed by feature name or a list of 7 numbers.
+
+    Raises:
+        ValueError: If a feature is missing or not a number
+    """
+    if isinstance(record, dict):
+        missing = [name for name in FEATURES if name not in record]
+        if missing:
+            raise ValueError(f"Missing fields: {', '.join(missing)}")
+        values = [record[name] for name in FEATURES]
+    elif isinstance(record, (list, tuple)) and len(record) == len(FEATURES):
+        values = list(record)
+    else:
+        raise ValueError(f"Expected an object or a list of {len(FEATURES)} values")
+
+    if any(isinstance(v, bool) for v in values):
+        raise ValueError('Feature values must be numbers')
+    try:
+        values = [float(v) for v in values]
+    except (TypeError, ValueError):
+        raise ValueError('Feature values must be numbers')
+    if not all(np.isfinite(values)):
+        raise ValueError('Feature values must be finite numbers')
+    return values
+
+
+def predict_batch(rows, model=None):
+    """
+    Predict crops for many samples with one vectorized model call
+
+    Args:
+        rows: Sequence of samples or a 2-D array, columns in FEATURES order
+        model: Model to use (defaults to the cached model)
+
+    Returns:
+        list: Predicted crop name per row
+    """
+    matrix = np.asarray(rows, dtype=np.float64).reshape(-1, len(FEATURES))
+    if len(matrix) == 0:
+        return []
+    if model is None:
+        model = get_model()
+    return [str(label) for label in model.predict(matrix)]
+
+
+def predict_top_k(rows, k=3, model=None):
+    """
+    Predict crops and the k most likely alternatives with one vectorized call
+
+    The main label is the arg-max of predict_proba, which is what
+    model.predict returns for sklearn classifiers, so both come from the same
+    pass over the model. Crops scored zero are left out of the ranking, so a
+    model with one-hot probabilities (a single decision tree) ranks only its
+    prediction.
+
+    Args:
+        rows: Sequence of samples or a 2-D array, columns in FEATURES order
+        k (int): Number of ranked crops to return per row
+        model: Model to use (defaults to the cached model)
+
+    Returns:
+        list: Per row, a dict with 'prediction' and 'top_k' (up to k of {'crop', 'score'})
+    """
+    matrix = np.asarray(rows, dtype=np.float64).reshape(-1, len(FEATURES))
+    if len(matrix) == 0:
+        return []
+    if model is None:
+        model = get_model()
+
+    # Models without probabilities can only offer their single label
+    if not hasattr(model, 'predict_proba'):
+        return [{'prediction': str(label), 'top_k': [{'crop': str(label), 'score': None}]}
+                for label in model.predict(matrix)]
+
+    proba = np.asarray(model.predict_proba(matrix))
+    classes = np.asarray(model.classes_)
+    k = max(1, min(int(k), len(classes)))
+
+    # Stable sort keeps the lowest class index first on ties, matching predict's arg-max
+    ranked = np.argsort(-proba, axis=1, kind='stable')[:, :k]
+    ranked_scores = np.take_along_axis(proba, ranked, axis=1)
+
+    results = []
+    for row_classes, row_scores in zip(classes[ranked], ranked_scores):
+        top = [{'crop': str(crop), 'score': round(float(score), 4)}
+               for crop, score in zip(row_classes, row_scores)]
+        # The prediction itself is always kept, even if every score rounds to zero
+        top = top[:1] + [crop for crop in top[1:] if crop['score'] > 0]
+        results.append({'prediction': top[0]['crop'], 'top_k': top})
+    return results
+
+
+def parse_precision(spec, defaults=DEFAULT_CACHE_PRECISION):
+    """
+    Parse a "feature=digits,..." string into a per-feature precision dict
+
+    Unknown features and malformed entries are ignored.
+    """
+    precision = dict(defaults)
+    for item in (spec or '').split(','):
+        name, _, digits = item.partition('=')
+        name = name.strip()
+        if name in precision and digits.strip().lstrip('-').isdigit():
+            precision[name] = int(digits)
+    return precision
+
+
+def _predict_group(rows, key):
+    """Batch callback for the micro-batcher; key is (model, k)"""
+    model, k = key
+    return predict_top_k(rows, k=k, model=model)
+
+
+# Coalesces concurrent single-row predictions when PREDICTION_BATCH_WAIT_MS > 0
+_batcher = MicroBatcher(_predict_group) if BATCH_MAX_WAIT_MS > 0 else None
+
+
+def predict_one(values, k=3, model=None):
+    """Top-k prediction for one sample, batched with concurrent requests when enabled"""
+    if model is None:
+        model = get_model()
+    if _batcher is not None:
+        return _batcher.predict(list(values), key=(model, k))
+    return predict_top_k([values], k=k, model=model)[0]
+
+
+def get_batcher_stats():
+    """Micro-batching metrics for this worker, or None when batching is off"""
+    return _batcher.stats() if _batcher is not None else None
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache of top-k predictions keyed on rounded inputs
+
+    Inputs are rounded per feature before lookup, and misses are predicted
+    from the rounded values, so a hit returns exactly what the model gives
+    at that precision. The cache is emptied when the model is reloaded.
+    """
+
+    def __init__(self, maxsize=PREDICTION_CACHE_SIZE, precision=None):
+        self.maxsize = maxsize
+        precision = precision or DEFAULT_CACHE_PRECISION
+        self.digits = [precision[name] for name in FEATURES]
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._model = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def quantize(self, values):
+        """Round a sample to the cache precision"""
+        return tuple(round(float(v), d) for v, d in zip(values, self.digits))
+
+    def predict(self, values, k=3, model=None):
+        """Get the top-k prediction for one sample, from the cache when possible"""
+        if model is None:
+            model = get_model()
+        key = (k,) + self.quantize(values)
+
+        with self._lock:
+            if model is not self._model:
+                self._entries.clear()
+                self._model = model
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+
+        result = predict_one(key[1:], k=k, model=model)
+
+        with self._lock:
+            if model is self._model and self.maxsize > 0:
+                self._entries[key] = result
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Counters for the analytics dashboard"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hit_rate': round(self.hits / lookups * 100, 1) if lookups else 0.0,
+            }
+
+
+_prediction_cache = PredictionCache(
+    PREDICTION_CACHE_SIZE, parse_precision(os.getenv("PREDICTION_CACHE_PRECISION")))
+
+
+def predict_cached(values, k=3, model=None):
+    """Top-k prediction for one sample through this worker's prediction cache"""
+    return _prediction_cache.predict(values, k=k, model=model)
+
+
+def get_prediction_cache_stats():
+    """Hit/miss/eviction counters of this worker's prediction cache"""
+    return _prediction_cache.stats()
+
+
+def predict_class_indices(rows, model=None):
+    """
+    Index into model.classes_ of the predicted crop for each row
+
+    Uses the arg-max of predict_proba, the same rule sklearn's predict uses.
+    """
+    matrix = np.asarray(rows, dtype=np.float64).reshape(-1, len(FEATURES))
+    if model is None:
+        model = get_model()
+    return np.argmax(model.predict_proba(matrix), axis=1)
+
+
+def build_grid_axes(base, ranges):
+    """
+    Validate a sweep request and build its axes
+
+    Args:
+        base (list): The 7 fixed feature values, in FEATURES order
+        ranges (dict): feature name -> {'start', 'stop', 'steps'}
+
+    Returns:
+        list: (feature index, axis values) per swept feature, in request order
+
+    Raises:
+        ValueError: If a range is malformed, a swept value breaks the form's
+                    rules, or the grid exceeds GRID_MAX_CELLS
+    """
+    if not isinstance(ranges, dict) or not ranges:
+        raise ValueError('Give at least one feature range to sweep')
+
+    axes = []
+    cells = 1
+    for name, spec in ranges.items():
+        if name not in FEATURES:
+            raise ValueError(f"Unknown feature: {name}")
+        if not isinstance(spec, dict):
+            raise ValueError(f"Range for {name} must be an object with start, stop and steps")
+        try:
+            start, stop = float(spec['start']), float(spec['stop'])
+            steps = int(spec['steps'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Range for {name} needs numeric start, stop and steps")
+        if steps < 1 or not np.isfinite([start, stop]).all():
+            raise ValueError(f"Range for {name} needs finite bounds and at least 1 step")
+        cells *= steps
+        if cells > GRID_MAX_CELLS:
+            raise ValueError(f"Grid too large (maximum {GRID_MAX_CELLS} cells)")
+
+        # Each form rule bounds a single feature, so checking both ends covers the whole axis
+        index = FEATURES.index(name)
+        for value in (start, stop):
+            sample = list(base)
+            sample[index] = value
+            error = validate_features(sample)
+            if error:
+                raise ValueError(f"{name}={value:g}: {error}")
+        axes.append((index, np.linspace(start, stop, steps)))
+    return axes
+
+
+def sweep_grid(base, axes, chunk_cells=GRID_CHUNK_CELLS, model=None):
+    """
+    Predict every cell of a Cartesian grid, generating it chunk by chunk
+
+    Only `chunk_cells` feature rows exist at a time; the output holds one
+    small integer per cell.
+
+    Args:
+        base (list): Fixed feature values in FEATURES order
+        axes (list): (feature index, axis values) pairs from build_grid_axes
+        chunk_cells (int): Cells predicted per model call
+
+    Returns:
+        numpy.ndarray: Class indices with one dimension per axis (uint8, or
+                       uint16 for models with more than 255 classes)
+    """
+    if model is None:
+        model = get_model()
+    shape = tuple(len(values) for _, values in axes)
+    total = int(np.prod(shape))
+    dtype = np.uint8 if len(model.classes_) <= 255 else np.uint16
+    result = np.empty(total, dtype=dtype)
+
+    base_row = np.asarray(base, dtype=np.float64)
+    for start in range(0, total, chunk_cells):
+        cell_ids = np.arange(start, min(start + chunk_cells, total))
+        coordinates = np.unravel_index(cell_ids, shape)
+        matrix = np.tile(base_row, (len(cell_ids), 1))
+        for (feature, values), coordinate in zip(axes, coordinates):
+            matrix[:, feature] = values[coordinate]
+        result[start:start + len(cell_ids)] = predict_class_indices(matrix, model=model)
+    return result.reshape(shape)
+
+
+def _predict_csv_chunk(rows, columns, model):
+    """Predict one chunk of CSV rows, returning (prediction, error) per row"""
+    results = [None] * len(rows)
+    valid_rows = []
+    valid_positions = []
+    for position, row in enumerate(rows):
+        try:
+            values = parse_record([row[i] if i < len(row) else '' for i in columns])
+        except ValueError as e:
+            results[position] = ('', str(e))
+            continue
+        error = validate_features(values)
+        if error:
+            results[position] = ('', error)
+            continue
+        valid_rows.append(values)
+        valid_positions.append(position)
+
+    for position, label in zip(valid_positions, predict_batch(valid_rows, model=model)):
+        results[position] = (label, '')
+    return results
+
+
+def stream_csv_predictions(lines, fmt='csv', chunk_rows=CSV_CHUNK_ROWS, model=None):
+    """
+    Predict crops for a CSV file without holding it in memory
+
+    The header is read immediately so a bad layout fails before any output is
+    sent. Rows are then read and predicted `chunk_rows` at a time and each
+    chunk is yielded as soon as it is done.
+
+    Args:
+        lines: Iterable of CSV text lines (e.g. a text file object)
+        fmt (str): 'csv' to append prediction/error columns, 'ndjson' for one JSON object per row
+        chunk_rows (int): Rows per model call
+        model: Model to use (defaults to the cached model)
+
+    Returns:
+        generator: Chunks of output text
+
+    Raises:
+        ValueError: If the header is missing or lacks a feature column
+    """
+    if fmt not in ('csv', 'ndjson'):
+        raise ValueError("Format must be 'csv' or 'ndjson'")
+
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if not header:
+        raise ValueError('CSV file is empty')
+    header = [name.strip() for name in header]
+    positions = {name.lower(): i for i, name in enumerate(header)}
+    missing = [name for name in FEATURES if name.lower() not in positions]
+    if missing:
+        raise ValueError(f"CSV is missing columns: {', '.join(missing)}")
+    columns = [positions[name.lower()] for name in FEATURES]
+
+    if model is None:
+        model = get_model()
+
+    def format_chunk(rows, results):
+        buffer = io.StringIO()
+        if fmt == 'csv':
+            writer = csv.writer(buffer, lineterminator='\n')
+            for row, (label, error) in zip(rows, results):
+                writer.writerow(row + [label, error])
+        else:
+            for row, (label, error) in zip(rows, results):
+                record = dict(zip(header, row))
+                record['prediction'] = label or None
+                if error:
+                    record['error'] = error
+                buffer.write(json.dumps(record) + '\n')
+        return buffer.getvalue()
+
+    def generate():
+        if fmt == 'csv':
+            buffer = io.StringIO()
+            csv.writer(buffer, lineterminator='\n').writerow(header + ['prediction', 'error'])
+            yield buffer.getvalue()
+
+        chunk = []
+        for row in reader:
+            if not any(field.strip() for field in row):
+                continue
+            chunk.append(row)
+            if len(chunk) >= chunk_rows:
+                yield format_chunk(chunk, _predict_csv_chunk(chunk, columns, model))
+                chunk = []
+        if chunk:
+            yield format_chunk(chunk, _predict_csv_chunk(chunk, columns, model))
+
+    return generate()
@@ -1,36 +1,115 @@
 from flask_login import UserMixin
-from pymongo import MongoClient
 import os
+import threading
+import time
+from collections import OrderedDict
 from flask_bcrypt import Bcrypt
-from dotenv import load_dotenv
 
-load_dotenv()
+from database import MONGO_URI, get_client, get_collection
+from user_repository import DuplicateUser, RepositoryUnavailable, create_user_repository
 
 # Initialize Bcrypt
 bcrypt = Bcrypt()
 
 # MongoDB Configuration
-MONGO_URI = os.getenv("MONGO_URI")
-DB_NAME = "agriculture_website"
 COLLECTION_NAME = "users"
 
-# Global client
-_mongo_client = None
+# User storage: "mongodb" or "sqlite" (instance/site.db); MongoDB when MONGO_URI is set, otherwise SQLite.
+# A configured MongoDB that is down is not replaced by SQLite: registration fails instead of splitting accounts
+USER_STORAGE = os.getenv("USER_STORAGE") or ("mongodb" if MONGO_URI else "sqlite")
+
+# Users loaded by id are reused for this many seconds (0 disables the cache)
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
 
 def get_mongo_client():
-    global _mongo_client
-    if _mongo_client is None and MONGO_URI:
-        try:
-            _mongo_client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-        except Exception as e:
-            print(f"MongoDB connection setup failed: {e}")
-    return _mongo_client
+    """The process-wide client from database.py"""
+    return get_client()
 
 def get_users_collection():
-    client = get_mongo_client()
-    if client:
-        return client[DB_NAME][COLLECTION_NAME]
-    return None
+    return get_collection(COLLECTION_NAME)
+
+_repository = None
+
+def get_user_repository():
+    """Get the configured user repository, created on first use"""
+    global _repository
+    if _repository is None:
+        _repository = create_user_repository(USER_STORAGE, lambda: get_users_collection())
+    return _repository
+
+def ensure_user_indexes():
+    """Create the unique indexes on username and email (no-op if they exist)"""
+    return get_user_repository().ensure_indexes()
+
+class UserCache:
+    """
+    Bounded per-worker LRU of user records by id, each kept for `ttl` seconds
+
+    Records are stored as plain dicts and a fresh User is built on every
+    hit, so callers never share an instance. A record is dropped as soon as
+    this worker saves the user; changes made by other workers are picked up
+    when the entry expires. A forked child starts with an empty cache.
+    """
+
+    def __init__(self, maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.hits = 0
+        self.misses = 0
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._entries.clear()
+
+    def get(self, user_id):
+        """The cached record for user_id, or None"""
+        with self._lock:
+            self._check_fork()
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                expires, record = entry
+                if time.monotonic() < expires:
+                    self._entries.move_to_end(user_id)
+                    self.hits += 1
+                    return record
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+
+    def put(self, user_id, record):
+        if self.ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._check_fork()
+            self._entries[user_id] = (time.monotonic() + self.ttl, record)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id=None):
+        """Drop one user's record, or every record"""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+_user_cache = UserCache()
 
 class User(UserMixin):
     def __init__(self, username, email, password, _id=None):
@@ -38,68 +117,65 @@ class User(UserMixin):
         self.email = email
         self.password = password
         self.id = str(_id) if _id else None
+        # Set by save() when the unique index rejected the user: "username" or "email"
+        self.duplicate_field = None
 
     @staticmethod
     def get(user_id):
-        collection = get_users_collection()
-        if collection is not None:
-            try:
-                from bson.objectid import ObjectId
-                user_data = collection.find_one({"_id": ObjectId(user_id)})
-                if user_data:
-                    return User(
-                        username=user_data['username'],
-                        email=user_data['email'],
-                        password=user_data['password'],
-                        _id=user_data['_id']
-                    )
-            except Exception:
-                pass
-        return None
+        # Flask-Login calls this on every authenticated request
+        record = _user_cache.get(user_id)
+        if record is not None:
+            return User(**record)
+        try:
+            record = get_user_repository().get(user_id)
+        except Exception:
+            record = None
+        if record is None:
+            return None
+        _user_cache.put(user_id, record)
+        return User(**record)
 
     @staticmethod
     def find_by_email(email):
-        collection = get_users_collection()
-        if collection is not None:
-            user_data = collection.find_one({"email": email})
-            if user_data:
-                return User(
-                    username=user_data['username'],
-                    email=user_data['email'],
-                    password=user_data['password'],
-                    _id=user_data['_id']
-                )
-        return None
+        record = get_user_repository().find_by_email(email)
+        return User(**record) if record else None
     
     @staticmethod
     def find_by_username(username):
-        collection = get_users_collection()
-        if collection is not None:
-            user_data = collection.find_one({"username": username})
-            if user_data:
-                return User(
-                    username=user_data['username'],
-                    email=user_data['email'],
-                    password=user_data['password'],
-                    _id=user_data['_id']
-                )
-        return None
+        record = get_user_repository().find_by_username(username)
+        return User(**record) if record else None
 
-    def save(self):
-        collection = get_users_collection()
-        if collection is not None:
-            try:
-                user_data = {
-                    "username": self.username,
-                    "email": self.email,
-                    "password": self.password
-                }
-                result = collection.insert_one(user_data)
-                self.id = str(result.inserted_id)
-                return True
-            except Exception as e:
-                print(f"Error saving user to MongoDB: {e}")
+    @staticmethod
+    def find_conflicts(username, email):
+        """Fields ("username", "email") already taken by other users, in one query"""
+        return get_user_repository().find_conflicts(username, email)
+
+    def update_password(self, password_hash):
+        """Store a new password hash for this saved user"""
+        if not self.id:
+            return False
+        try:
+            if not get_user_repository().update_password(self.id, password_hash):
                 return False
-        else:
+            self.password = password_hash
+            return True
+        except Exception as e:
+            print(f"Error updating user password: {e}")
+            return False
+        finally:
+            _user_cache.invalidate(self.id)
+
+    def save(self):
+        try:
+            self.id = get_user_repository().insert(self.username, self.email, self.password)
+            _user_cache.invalidate(self.id)
+            return True
+        except DuplicateUser as e:
+            self.duplicate_field = e.field
+            return False
+        except RepositoryUnavailable:
             print("Error: User collection not available - MongoDB connection failed or not configured.")
-        return False
+            return False
+        except Exception as e:
+            print(f"Error saving user: {e}")
+            return False
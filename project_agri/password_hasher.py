@@ -0,0 +1,243 @@
+"""
+Password Hasher Module
+Runs bcrypt hashing and checks on a small worker pool with a bounded queue,
+so a burst of logins cannot take every request thread
+"""
+
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+# Time (ms) one hash should take on this machine; the work factor is calibrated to it at startup
+HASH_TARGET_MS = float(os.getenv("BCRYPT_TARGET_MS", "250"))
+
+# Fixed work factor, skipping calibration
+HASH_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "0")) or None
+
+# Calibration never goes outside these work factors; 12 was the fixed Flask-Bcrypt default,
+# so calibration can only raise the cost of new hashes
+MIN_ROUNDS = 12
+MAX_ROUNDS = 16
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# The calibrated work factor is stored here by the first worker, so every worker of a deployment uses it
+ROUNDS_PATH = os.getenv("BCRYPT_ROUNDS_PATH", os.path.join(BASE_DIR, 'instance', 'bcrypt_rounds'))
+
+# Threads hashing at once; bcrypt releases the GIL, so threads run in parallel
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+
+# Hashes queued or running at once; beyond this callers wait up to HASH_QUEUE_TIMEOUT seconds
+HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+HASH_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", "5"))
+
+
+class HasherBusy(Exception):
+    """Too many hashes pending; the caller should ask the user to retry"""
+
+
+def hash_rounds(password_hash):
+    """The work factor of a bcrypt hash ("$2b$12$...") or None if it is not one"""
+    try:
+        return int(password_hash.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def calibrate_rounds(target_ms=HASH_TARGET_MS, sample_rounds=8):
+    """
+    Largest work factor whose hash takes at most target_ms here
+
+    Each extra round doubles the cost, so one hash at a cheap work factor
+    is timed and extrapolated.
+    """
+    salt = bcrypt.gensalt(sample_rounds)
+    start = time.perf_counter()
+    bcrypt.hashpw(b"calibration", salt)
+    sample_ms = max((time.perf_counter() - start) * 1000, 1e-3)
+    rounds = sample_rounds
+    while rounds < MAX_ROUNDS and sample_ms * 2 ** (rounds + 1 - sample_rounds) <= target_ms:
+        rounds += 1
+    return max(MIN_ROUNDS, rounds)
+
+
+def _read_rounds(path):
+    try:
+        with open(path) as f:
+            return min(MAX_ROUNDS, max(MIN_ROUNDS, int(f.read().strip())))
+    except (OSError, ValueError):
+        return None
+
+
+def shared_rounds(path=ROUNDS_PATH):
+    """
+    The work factor stored at path, calibrated and stored first if there is none
+
+    The value is published with a hard link, which fails if the file
+    already exists, so concurrent workers all end up with the first
+    worker's value. Where the file cannot be written (a read-only
+    filesystem), this worker's own calibration is used.
+    """
+    rounds = _read_rounds(path)
+    if rounds is not None:
+        return rounds
+    rounds = calibrate_rounds()
+    try:
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(f"{rounds}\n")
+            os.link(tmp_path, path)
+        finally:
+            os.remove(tmp_path)
+    except FileExistsError:
+        # Another worker stored its calibration first
+        return _read_rounds(path) or rounds
+    except OSError as e:
+        print(f"Could not store bcrypt work factor at {path}: {e}")
+    return rounds
+
+
+class PasswordHasher:
+    """
+    bcrypt on a bounded thread pool
+
+    hash() and check() hand the work to `workers` threads and wait for it,
+    so at most `workers` hashes use CPU at once, however many requests are
+    logging in; other pages keep being served. At most `max_pending`
+    hashes may be queued or running; a caller that cannot get a slot
+    within `queue_timeout` seconds gets HasherBusy.
+
+    The pool starts on first use and is recreated in a forked child.
+    """
+
+    def __init__(self, rounds=None, workers=HASH_WORKERS, max_pending=HASH_MAX_PENDING,
+                 queue_timeout=HASH_QUEUE_TIMEOUT):
+        self.rounds = rounds or HASH_ROUNDS or shared_rounds()
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pool = None
+        self._pid = None
+        self.pending = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.total_ms = 0.0
+
+    def _executor(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._slots = threading.BoundedSemaphore(self.max_pending)
+                self.pending = 0
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hasher')
+            return self._pool
+
+    def _run(self, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+                self.total_ms += (time.perf_counter() - start) * 1000
+            self._slots.release()
+
+    def submit(self, fn, *args, blocking=True):
+        """Queue fn(*args) on the pool; returns a Future (blocking=False: HasherBusy at once when full)"""
+        pool = self._executor()
+        slots = self._slots
+        acquired = slots.acquire(timeout=self.queue_timeout) if blocking else slots.acquire(blocking=False)
+        if not acquired:
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy(f"{self.max_pending} password hashes already pending")
+        with self._lock:
+            self.pending += 1
+            self.peak_pending = max(self.peak_pending, self.pending)
+        try:
+            return pool.submit(self._run, fn, *args)
+        except BaseException:
+            with self._lock:
+                self.pending -= 1
+            slots.release()
+            raise
+
+    def hash(self, password):
+        """bcrypt hash of password at the current work factor, as str"""
+        def work(password):
+            return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(self.rounds)).decode("utf-8")
+        return self.submit(work, password).result()
+
+    def check(self, password_hash, password):
+        """Whether password matches password_hash"""
+        def work(password_hash, password):
+            try:
+                return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("utf-8"))
+            except ValueError:
+                # Not a bcrypt hash
+                return False
+        return self.submit(work, password_hash, password).result()
+
+    def needs_rehash(self, password_hash):
+        """Whether a stored hash uses a lower work factor than the current one"""
+        rounds = hash_rounds(password_hash)
+        return rounds is not None and rounds < self.rounds
+
+    def rehash_in_background(self, password, save):
+        """Hash password at the current work factor off the request, then call save(new_hash)"""
+        def work(password):
+            save(bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(self.rounds)).decode("utf-8"))
+            with self._lock:
+                self.rehashed += 1
+        try:
+            # Never hold up the login response waiting for a slot
+            self.submit(work, password, blocking=False)
+        except HasherBusy:
+            # The upgrade is retried at the next login
+            pass
+
+    def stats(self):
+        """Pool counters for the analytics dashboard"""
+        with self._lock:
+            return {
+                'rounds': self.rounds,
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'pending': self.pending,
+                'peak_pending': self.peak_pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'rehashed': self.rehashed,
+                'mean_ms': round(self.total_ms / self.completed, 1) if self.completed else 0.0,
+            }
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_password_hasher():
+    """This worker's hasher, created on first use"""
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                _hasher = PasswordHasher()
+    return _hasher
+
+
+def get_hasher_stats():
+    """Hasher counters for the analytics dashboard"""
+    return get_password_hasher().stats()
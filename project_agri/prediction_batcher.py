@@ -0,0 +1,144 @@
+"""
+Prediction Batcher Module
+Collects single-row prediction requests from concurrent request threads and
+runs them through the model as one batch
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+
+# Longest time (ms) the first request in a batch waits for others to join; 0 disables batching
+BATCH_MAX_WAIT_MS = float(os.getenv("PREDICTION_BATCH_WAIT_MS", "0"))
+
+# Largest number of rows predicted in one call
+BATCH_MAX_SIZE = int(os.getenv("PREDICTION_BATCH_MAX", "64"))
+
+# Recent queueing delays kept for percentile metrics
+DELAY_HISTORY = 2048
+
+
+class _Pending:
+    __slots__ = ('row', 'key', 'future', 'enqueued')
+
+    def __init__(self, row, key):
+        self.row = row
+        self.key = key
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+class MicroBatcher:
+    """
+    In-process dispatcher that turns concurrent single-row predictions into batches
+
+    Callers block in predict() while a background thread waits up to
+    `max_wait_ms` after the first queued row (or until `max_batch` rows are
+    waiting), then calls `predict_fn(rows, key)` once per distinct key and
+    hands each caller its own result. `key` is a hashable value grouping
+    rows that can share a call, e.g. (model, k).
+
+    The thread starts on first use and is restarted in a forked child.
+    """
+
+    def __init__(self, predict_fn, max_batch=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS):
+        self.predict_fn = predict_fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._batch_sizes = Counter()
+        self._delays = deque(maxlen=DELAY_HISTORY)
+        self.batches = 0
+        self.rows = 0
+        self.max_delay_ms = 0.0
+
+    def _ensure_worker(self):
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return self._queue
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, args=(self._queue,),
+                                                name='prediction-batcher', daemon=True)
+                self._thread.start()
+        return self._queue
+
+    def submit(self, row, key=None):
+        """Queue one row; returns a Future resolving to its prediction"""
+        pending = _Pending(row, key)
+        self._ensure_worker().put(pending)
+        return pending.future
+
+    def predict(self, row, key=None, timeout=None):
+        """Predict one row through the batcher, blocking until its batch has run"""
+        return self.submit(row, key).result(timeout)
+
+    def _collect(self, work_queue):
+        """Block for the first row, then gather more until the batch is full or the wait expires"""
+        batch = [work_queue.get()]
+        deadline = batch[0].enqueued + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(work_queue.get(timeout=remaining) if remaining > 0 else work_queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, work_queue):
+        while True:
+            batch = self._collect(work_queue)
+            started = time.monotonic()
+
+            groups = {}
+            for pending in batch:
+                groups.setdefault(pending.key, []).append(pending)
+            for key, members in groups.items():
+                try:
+                    results = self.predict_fn([p.row for p in members], key)
+                    if len(results) != len(members):
+                        raise RuntimeError(f"Expected {len(members)} predictions, got {len(results)}")
+                except Exception as e:
+                    for pending in members:
+                        pending.future.set_exception(e)
+                    continue
+                for pending, result in zip(members, results):
+                    pending.future.set_result(result)
+
+            with self._lock:
+                self.batches += 1
+                self.rows += len(batch)
+                self._batch_sizes[len(batch)] += 1
+                for pending in batch:
+                    delay = (started - pending.enqueued) * 1000
+                    self._delays.append(delay)
+                    self.max_delay_ms = max(self.max_delay_ms, delay)
+
+    def stats(self):
+        """Batch-size distribution and queueing delay for the dashboard"""
+        with self._lock:
+            delays = sorted(self._delays)
+            histogram = Counter()
+            for size, count in self._batch_sizes.items():
+                # Power-of-two buckets: 1, 2-3, 4-7, ...
+                low = 1 << (size.bit_length() - 1)
+                histogram[f"{low}-{2 * low - 1}" if low > 1 else "1"] += count
+            return {
+                'enabled': True,
+                'max_wait_ms': self.max_wait * 1000,
+                'max_batch': self.max_batch,
+                'batches': self.batches,
+                'rows': self.rows,
+                'mean_batch_size': round(self.rows / self.batches, 2) if self.batches else 0.0,
+                'batch_size_histogram': sorted(histogram.items(), key=lambda item: int(item[0].split('-')[0])),
+                'delay_p50_ms': round(delays[len(delays) // 2], 3) if delays else 0.0,
+                'delay_p99_ms': round(delays[min(len(delays) - 1, int(len(delays) * 0.99))], 3) if delays else 0.0,
+                'delay_max_ms': round(self.max_delay_ms, 3),
+            }
@@ -0,0 +1,218 @@
+"""
+Similar Farms Module
+Nearest-neighbour index over Crop_recommendation.csv, used to show the
+historical samples closest to a prediction's inputs
+"""
+
+import csv
+import io
+import os
+import threading
+import time
+
+import numpy as np
+
+from model_service import FEATURES
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(BASE_DIR, 'Crop_recommendation.csv')
+
+# Neighbours shown on the prediction result page
+SIMILAR_FARMS_K = int(os.getenv("SIMILAR_FARMS_K", "5"))
+
+# Appended rows are searched by brute force until they exceed this fraction
+# of the tree, then the tree is rebuilt over everything
+REBUILD_FRACTION = float(os.getenv("SIMILAR_FARMS_REBUILD_FRACTION", "0.1"))
+
+# How often (seconds) the index checks the CSV for appended rows
+REFRESH_CHECK_INTERVAL = float(os.getenv("SIMILAR_FARMS_REFRESH_INTERVAL", "2.0"))
+
+
+def _parse_rows(text, header):
+    """Parse CSV data lines into (features array, labels list), skipping malformed rows"""
+    columns = [header.index(name) for name in FEATURES]
+    label_column = header.index('label')
+    features, labels = [], []
+    for row in csv.reader(io.StringIO(text)):
+        if len(row) != len(header):
+            continue
+        try:
+            features.append([float(row[i]) for i in columns])
+        except ValueError:
+            continue
+        labels.append(row[label_column])
+    return np.asarray(features, dtype=np.float64).reshape(-1, len(FEATURES)), labels
+
+
+class _IndexState:
+    """One immutable snapshot of the index; queries read it without locking"""
+
+    def __init__(self, features, labels, pending_features=None, pending_labels=()):
+        # Imported here, on first use, so scipy stays out of the app's import time
+        from scipy.spatial import cKDTree
+
+        self.features = features
+        self.labels = labels
+        self.mean = features.mean(axis=0) if len(features) else np.zeros(len(FEATURES))
+        std = features.std(axis=0) if len(features) else np.ones(len(FEATURES))
+        self.std = np.where(std > 0, std, 1.0)
+        self.tree = cKDTree((features - self.mean) / self.std) if len(features) else None
+        self.pending_features = (pending_features if pending_features is not None
+                                 else np.empty((0, len(FEATURES))))
+        self.pending_labels = list(pending_labels)
+        self.pending_scaled = (self.pending_features - self.mean) / self.std
+
+    def __len__(self):
+        return len(self.labels) + len(self.pending_labels)
+
+    def with_pending(self, features, labels):
+        """Copy of this snapshot with rows appended to the brute-force buffer"""
+        state = object.__new__(_IndexState)
+        state.__dict__.update(self.__dict__)
+        state.pending_features = np.vstack([self.pending_features, features])
+        state.pending_labels = self.pending_labels + list(labels)
+        state.pending_scaled = (state.pending_features - self.mean) / self.std
+        return state
+
+    def rebuilt(self):
+        """Snapshot with the pending rows merged into a new tree and fresh scaling"""
+        return _IndexState(np.vstack([self.features, self.pending_features]),
+                           self.labels + self.pending_labels)
+
+
+class FarmIndex:
+    """
+    KD-tree over the standardized dataset features
+
+    Features are scaled to zero mean and unit variance so that rainfall (in
+    hundreds of mm) does not drown out pH. The tree is built on first use.
+
+    Rows appended to the CSV (or passed to add()) go into a small buffer
+    that is searched by brute force next to the tree, using the tree's
+    scaling. When the buffer grows beyond `rebuild_fraction` of the tree,
+    the tree is rebuilt over all rows and the scaling recomputed. A file
+    that shrank or got a new header is re-read from scratch.
+    """
+
+    def __init__(self, path=DATA_PATH, check_interval=REFRESH_CHECK_INTERVAL,
+                 rebuild_fraction=REBUILD_FRACTION):
+        self.path = path
+        self.check_interval = check_interval
+        self.rebuild_fraction = rebuild_fraction
+        self._lock = threading.Lock()
+        self._state = None
+        self._header = None
+        self._header_bytes = None
+        self._offset = 0
+        self._last_check = 0.0
+        self.rebuilds = 0
+
+    def _load(self):
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        header_end = data.find(b'\n') + 1
+        if not header_end:
+            raise ValueError(f"{self.path} has no header row")
+        self._header_bytes = data[:header_end]
+        self._header = next(csv.reader([self._header_bytes.decode('utf-8-sig')]))
+        features, labels = _parse_rows(data[header_end:end].decode('utf-8'), self._header)
+        self._offset = end
+        self._state = _IndexState(features, labels)
+        self.rebuilds += 1
+
+    def _read_appended(self):
+        """Pick up complete rows appended to the CSV since the last read"""
+        if os.path.getsize(self.path) == self._offset:
+            return
+        with open(self.path, 'rb') as f:
+            head = f.read(len(self._header_bytes))
+            if head != self._header_bytes or os.fstat(f.fileno()).st_size < self._offset:
+                self._load()
+                return
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        if not end:
+            return
+        features, labels = _parse_rows(data[:end].decode('utf-8'), self._header)
+        self._offset += end
+        if labels:
+            self._append(features, labels)
+
+    def _append(self, features, labels):
+        state = self._state.with_pending(features, labels)
+        if len(state.pending_labels) > self.rebuild_fraction * max(len(state.labels), 1):
+            state = state.rebuilt()
+            self.rebuilds += 1
+        self._state = state
+
+    def _current(self):
+        state = self._state
+        now = time.monotonic()
+        if state is not None and now - self._last_check < self.check_interval:
+            return state
+        with self._lock:
+            if self._state is None:
+                self._load()
+            elif now - self._last_check >= self.check_interval:
+                try:
+                    self._read_appended()
+                except (OSError, ValueError) as e:
+                    print(f"Similar farms refresh failed, keeping current index: {e}")
+            self._last_check = now
+            return self._state
+
+    def add(self, rows, labels):
+        """Add rows in FEATURES order that are not (yet) in the CSV"""
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, len(FEATURES))
+        if len(rows) != len(labels):
+            raise ValueError("rows and labels differ in length")
+        self._current()
+        with self._lock:
+            self._append(rows, labels)
+
+    def __len__(self):
+        return len(self._current())
+
+    def query(self, values, k=SIMILAR_FARMS_K):
+        """
+        Find the dataset rows closest to one sample
+
+        Args:
+            values (list): Feature values in FEATURES order
+            k (int): Number of neighbours
+
+        Returns:
+            list: [{'label', 'distance', 'features': {name: value}}] nearest first;
+                  distance is Euclidean in standardized units
+        """
+        state = self._current()
+        k = min(int(k), len(state))
+        if k < 1:
+            return []
+        point = (np.asarray(values, dtype=np.float64) - state.mean) / state.std
+
+        candidates = []
+        if state.tree is not None:
+            distances, indices = state.tree.query(point, k=min(k, state.tree.n))
+            for distance, index in zip(np.atleast_1d(distances), np.atleast_1d(indices)):
+                candidates.append((float(distance), state.features[index], state.labels[index]))
+        if state.pending_labels:
+            distances = np.sqrt(((state.pending_scaled - point) ** 2).sum(axis=1))
+            for index in np.argsort(distances, kind='stable')[:k]:
+                candidates.append((float(distances[index]), state.pending_features[index],
+                                   state.pending_labels[index]))
+
+        candidates.sort(key=lambda candidate: candidate[0])
+        return [{'label': label, 'distance': round(distance, 4),
+                 'features': dict(zip(FEATURES, row.tolist()))}
+                for distance, row, label in candidates[:k]]
+
+
+_index = FarmIndex()
+
+
+def find_similar_farms(values, k=SIMILAR_FARMS_K):
+    """Nearest historical samples for one sample, from this worker's index"""
+    return _index.query(values, k)
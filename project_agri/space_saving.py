@@ -0,0 +1,83 @@
+"""
+Space-Saving Module
+Bounded top-k counter for categories with unbounded keys, such as the
+free-text city names of weather queries
+"""
+
+import heapq
+
+DEFAULT_CAPACITY = 100
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy-hitter summary with at most `capacity` counters
+
+    When a new item arrives and all counters are taken, the item with the
+    smallest count is replaced and the newcomer inherits that count as its
+    error. With N the total added, every reported count overestimates the
+    true count by at most its error, which is at most N / capacity, and any
+    item occurring more than N / capacity times is guaranteed to be kept.
+
+    Summaries merge (Agarwal et al., "Mergeable Summaries") by adding
+    counts, using the other summary's smallest count for items it does not
+    hold, and keeping the `capacity` largest. The merged summary keeps the
+    same guarantees over the combined input.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        if capacity < 1:
+            raise ValueError("Capacity must be positive")
+        self.capacity = capacity
+        self.counts = {}
+        self.total = 0
+
+    def add(self, item, count=1):
+        self.total += count
+        entry = self.counts.get(item)
+        if entry is not None:
+            entry[0] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = [count, 0]
+        else:
+            victim = min(self.counts, key=lambda key: self.counts[key][0])
+            floor = self.counts.pop(victim)[0]
+            self.counts[item] = [floor + count, floor]
+
+    def min_count(self):
+        """Upper bound on the true count of any item not held (0 until the summary is full)"""
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(count for count, _ in self.counts.values())
+
+    def merge(self, other):
+        """Fold another summary into this one"""
+        floor, other_floor = self.min_count(), other.min_count()
+        merged = {}
+        for item in self.counts.keys() | other.counts.keys():
+            count, error = self.counts.get(item, (floor, floor))
+            other_count, other_error = other.counts.get(item, (other_floor, other_floor))
+            merged[item] = [count + other_count, error + other_error]
+        kept = heapq.nlargest(self.capacity, merged.items(), key=lambda entry: entry[1][0])
+        self.counts = dict(kept)
+        self.total += other.total
+        return self
+
+    def top(self, n=5):
+        """The n largest as (item, count, error), count descending"""
+        ranked = sorted(self.counts.items(), key=lambda entry: (-entry[1][0], entry[0]))
+        return [(item, count, error) for item, (count, error) in ranked[:n]]
+
+    def to_dict(self):
+        return {
+            "capacity": self.capacity,
+            "total": self.total,
+            "items": [[item, count, error] for item, (count, error) in self.counts.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        summary = cls(data.get("capacity", DEFAULT_CAPACITY))
+        summary.total = data.get("total", 0)
+        summary.counts = {item: [count, error] for item, count, error in data.get("items", [])}
+        return summary
@@ -0,0 +1,262 @@
+"""
+Crop Model Training
+Trains candidate classifiers on Crop_recommendation.csv, benchmarks each one
+for accuracy and serving cost, and writes the chosen model artifact
+
+Usage:
+    python train_model.py
+    python train_model.py --select latency --min-accuracy 0.97 --n-jobs 3
+    python train_model.py --register --activate
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import joblib
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+from sklearn.tree import DecisionTreeClassifier
+
+from tree_compiler import CompiledTreeModel
+from model_registry import ModelRegistry, REGISTRY_DIR
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(BASE_DIR, 'Crop_recommendation.csv')
+OUTPUT_PATH = os.path.join(BASE_DIR, 'crop_recommend')
+
+FEATURES = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+
+# Candidate models; the split and seeds match the original notebook
+CANDIDATES = {
+    'logistic': lambda seed: LogisticRegression(max_iter=2000, random_state=seed),
+    'decision_tree': lambda seed: DecisionTreeClassifier(random_state=seed),
+    'random_forest': lambda seed: RandomForestClassifier(random_state=seed),
+}
+
+SELECTION_RULES = ('accuracy', 'latency', 'throughput')
+
+
+def load_dataset(path=DATA_PATH):
+    """
+    Load the training CSV
+
+    Returns:
+        tuple: (features array, labels array, SHA-256 of the file)
+    """
+    with open(path, 'rb') as f:
+        data_hash = hashlib.sha256(f.read()).hexdigest()
+    with open(path) as f:
+        header = f.readline().strip().split(',')
+    columns = [header.index(name) for name in FEATURES]
+    features = np.loadtxt(path, delimiter=',', skiprows=1, usecols=columns)
+    labels = np.loadtxt(path, delimiter=',', skiprows=1, usecols=header.index('label'), dtype=str)
+    return features, labels, data_hash
+
+
+def _fit(name, x_train, y_train, seed):
+    """Fit one candidate (runs in a joblib worker)"""
+    start = time.perf_counter()
+    model = CANDIDATES[name](seed).fit(x_train, y_train)
+    return name, model, time.perf_counter() - start
+
+
+def benchmark(model, x_test, y_test, single_samples=500, batch_rows=10000):
+    """
+    Measure accuracy and serving cost for a fitted model
+
+    Returns:
+        dict: accuracy, p50/p99 single-sample latency (ms), batch throughput
+              (rows/s), artifact size (bytes) and load time (ms)
+    """
+    metrics = {'accuracy': float(accuracy_score(y_test, model.predict(x_test)))}
+
+    # Single-sample latency, one row per call as the /form route does
+    latencies = []
+    for i in range(single_samples):
+        row = x_test[i % len(x_test)][None, :]
+        start = time.perf_counter()
+        model.predict(row)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    metrics['p50_ms'] = latencies[len(latencies) // 2]
+    metrics['p99_ms'] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+
+    # Batch throughput on a test set repeated to batch_rows
+    batch = np.resize(x_test, (batch_rows, x_test.shape[1]))
+    runs = []
+    for _ in range(3):
+        start = time.perf_counter()
+        model.predict(batch)
+        runs.append(time.perf_counter() - start)
+    metrics['throughput_rows_s'] = batch_rows / min(runs)
+
+    # Artifact size and load time in the format the server would read
+    suffix = '.compiled' if isinstance(model, CompiledTreeModel) else '.joblib'
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'model' + suffix)
+        if isinstance(model, CompiledTreeModel):
+            model.save(path)
+            load = CompiledTreeModel.load
+        else:
+            joblib.dump(model, path)
+            load = joblib.load
+        if os.path.isdir(path):
+            metrics['size_bytes'] = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+        else:
+            metrics['size_bytes'] = os.path.getsize(path)
+        load_times = []
+        for _ in range(5):
+            start = time.perf_counter()
+            load(path)
+            load_times.append((time.perf_counter() - start) * 1000)
+        metrics['load_ms'] = statistics.median(load_times)
+    return metrics
+
+
+def choose(results, rule='accuracy', min_accuracy=0.0):
+    """
+    Pick the candidate to ship
+
+    'accuracy' takes the most accurate model (ties go to the lower p50
+    latency). 'latency' and 'throughput' only consider candidates reaching
+    min_accuracy.
+    """
+    eligible = [r for r in results if r['metrics']['accuracy'] >= min_accuracy] or results
+    if rule == 'latency':
+        return min(eligible, key=lambda r: r['metrics']['p50_ms'])
+    if rule == 'throughput':
+        return max(eligible, key=lambda r: r['metrics']['throughput_rows_s'])
+    return max(eligible, key=lambda r: (r['metrics']['accuracy'], -r['metrics']['p50_ms']))
+
+
+def train(data_path=DATA_PATH, candidates=None, n_jobs=-1, test_size=0.2, seed=1, compiled=True):
+    """
+    Train and benchmark all candidates
+
+    Returns:
+        tuple: (list of {'name', 'model', 'fit_seconds', 'metrics'}, dataset hash).
+               Compiled variants also carry the fitted sklearn model as 'source'.
+    """
+    features, labels, data_hash = load_dataset(data_path)
+    x_train, x_test, y_train, y_test = train_test_split(
+        features, labels, random_state=seed, test_size=test_size)
+
+    fitted = Parallel(n_jobs=n_jobs)(
+        delayed(_fit)(name, x_train, y_train, seed) for name in (candidates or CANDIDATES))
+
+    # Benchmarks run one at a time so parallel training does not skew the timings
+    results = []
+    for name, model, fit_seconds in fitted:
+        results.append({'name': name, 'model': model, 'fit_seconds': fit_seconds,
+                        'metrics': benchmark(model, x_test, y_test)})
+        if compiled and (hasattr(model, 'tree_') or hasattr(model, 'estimators_')):
+            compiled_model = CompiledTreeModel.from_model(model)
+            results.append({'name': name + ' (compiled)', 'model': compiled_model, 'source': model,
+                            'fit_seconds': fit_seconds, 'metrics': benchmark(compiled_model, x_test, y_test)})
+    return results, data_hash
+
+
+def print_report(results, chosen=None):
+    print(f"{'model':<28} {'accuracy':>8} {'p50 ms':>8} {'p99 ms':>8} {'rows/s':>12} {'size KB':>9} {'load ms':>8}")
+    for result in results:
+        m = result['metrics']
+        marker = ' *' if result is chosen else ''
+        print(f"{result['name']:<28} {m['accuracy']:>8.4f} {m['p50_ms']:>8.3f} {m['p99_ms']:>8.3f} "
+              f"{m['throughput_rows_s']:>12,.0f} {m['size_bytes'] / 1024:>9.1f} {m['load_ms']:>8.2f}{marker}")
+
+
+def write_artifact(result, output=OUTPUT_PATH):
+    """
+    Write the chosen model for the server
+
+    The sklearn model is always pickled to <output>. A compiled choice also
+    writes the <output>.compiled array directory; otherwise any stale
+    compiled artifact is removed, because the server prefers it when both exist.
+
+    Returns:
+        str: Path of the file or directory the server will load
+    """
+    model = result['model']
+    compiled_path = output + '.compiled'
+    joblib.dump(result.get('source', model), output)
+    if os.path.exists(output + '.npz'):
+        os.remove(output + '.npz')
+    if isinstance(model, CompiledTreeModel):
+        model.save(compiled_path)
+        return compiled_path
+
+    if os.path.isdir(compiled_path):
+        shutil.rmtree(compiled_path)
+    return output
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train and benchmark crop recommendation models')
+    parser.add_argument('--data', default=DATA_PATH, help='Training CSV (default: Crop_recommendation.csv)')
+    parser.add_argument('--output', default=OUTPUT_PATH, help='Artifact path (default: crop_recommend)')
+    parser.add_argument('--models', nargs='+', choices=list(CANDIDATES), default=list(CANDIDATES))
+    parser.add_argument('--n-jobs', type=int, default=-1, help='Parallel training jobs (default: all cores)')
+    parser.add_argument('--test-size', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--select', choices=SELECTION_RULES, default='accuracy',
+                        help='Serving trade-off used to pick the artifact')
+    parser.add_argument('--min-accuracy', type=float, default=0.95,
+                        help='Accuracy floor for --select latency/throughput')
+    parser.add_argument('--no-compile', action='store_true', help='Do not consider compiled tree variants')
+    parser.add_argument('--report', help='Also write the metrics as JSON to this path')
+    parser.add_argument('--dry-run', action='store_true', help='Benchmark only, do not write an artifact')
+    parser.add_argument('--register', action='store_true',
+                        help='Store the artifact as a new model registry version instead of --output')
+    parser.add_argument('--activate', action='store_true', help='With --register, make the new version active')
+    parser.add_argument('--registry', default=REGISTRY_DIR, help='Model registry directory')
+    args = parser.parse_args(argv)
+
+    results, data_hash = train(args.data, args.models, args.n_jobs, args.test_size, args.seed,
+                               compiled=not args.no_compile)
+    chosen = choose(results, args.select, args.min_accuracy)
+    print_report(results, chosen)
+    print(f"\nSelected by {args.select}: {chosen['name']}")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({
+                'data_sha256': data_hash,
+                'select': args.select,
+                'chosen': chosen['name'],
+                'candidates': [{'name': r['name'], 'fit_seconds': r['fit_seconds'], **r['metrics']}
+                               for r in results],
+            }, f, indent=2)
+
+    if args.dry_run:
+        return 0
+    if not args.register:
+        print(f"Wrote {write_artifact(chosen, args.output)}")
+        return 0
+
+    registry = ModelRegistry(args.registry)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        output = os.path.join(tmpdir, 'crop_recommend')
+        artifacts = [output] + ([output + '.compiled'] if 'source' in chosen else [])
+        write_artifact(chosen, output)
+        metrics = dict(chosen['metrics'], model=chosen['name'], select=args.select)
+        version = registry.register(artifacts, data_sha256=data_hash, metrics=metrics)
+    print(f"Registered {version}")
+    if args.activate:
+        registry.activate(version)
+        print(f"Activated {version}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
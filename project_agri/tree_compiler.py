@@ -0,0 +1,235 @@
+"""
+Tree Compiler Module
+Flattens fitted scikit-learn decision trees / random forests into plain NumPy
+arrays and evaluates them without importing scikit-learn at serve time
+
+Compiled models are saved either as a directory of .npy files (memory-mapped
+on load, so every worker on a host shares one copy of the arrays) or as a
+single .npz file (read into each process's own memory).
+
+Usage:
+    python tree_compiler.py crop_recommend crop_recommend.compiled
+    python tree_compiler.py crop_recommend crop_recommend.npz
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+# Bumped whenever the array layout below changes
+FORMAT_VERSION = 1
+
+# Arrays derived from the node table in __init__; the directory format stores them
+# too, so memory-mapped workers do not each compute a private copy
+DERIVED_ARRAYS = ('leaf_class', 'is_leaf')
+
+
+def export_model(model):
+    """
+    Flatten a fitted DecisionTreeClassifier or RandomForestClassifier
+
+    All trees are concatenated into one node table. Leaves point to
+    themselves, so walking a fixed number of levels always ends on a leaf.
+
+    Args:
+        model: Fitted single-output sklearn tree classifier or forest
+
+    Returns:
+        dict: NumPy arrays - feature, threshold, left, right, value, roots, classes, max_depth
+    """
+    if getattr(model, 'n_outputs_', 1) != 1:
+        raise ValueError('Only single-output classifiers can be compiled')
+    if hasattr(model, 'estimators_'):
+        trees = [estimator.tree_ for estimator in model.estimators_]
+    elif hasattr(model, 'tree_'):
+        trees = [model.tree_]
+    else:
+        raise TypeError(f'Cannot compile model of type {type(model).__name__}')
+
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    for tree in trees:
+        node_ids = np.arange(tree.node_count)
+        is_leaf = tree.children_left == -1
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+        lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+        rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+
+        # Class distribution per node, normalized the way predict_proba does
+        value = tree.value[:, 0, :].astype(np.float64)
+        totals = value.sum(axis=1, keepdims=True)
+        totals[totals == 0.0] = 1.0
+        values.append(value / totals)
+
+        roots.append(offset)
+        offset += tree.node_count
+
+    return {
+        'format_version': np.array(FORMAT_VERSION),
+        'feature': np.concatenate(features).astype(np.int32),
+        'threshold': np.concatenate(thresholds).astype(np.float64),
+        'left': np.concatenate(lefts).astype(np.int32),
+        'right': np.concatenate(rights).astype(np.int32),
+        'value': np.concatenate(values),
+        'roots': np.array(roots, dtype=np.int32),
+        'classes': np.asarray(model.classes_).astype(str),
+        'max_depth': np.array(max(tree.max_depth for tree in trees)),
+    }
+
+
+class CompiledTreeModel:
+    """
+    NumPy-only evaluator for exported trees
+
+    Exposes classes_, predict and predict_proba so it can stand in for the
+    sklearn estimator anywhere the app predicts.
+    """
+
+    def __init__(self, arrays):
+        if int(arrays['format_version']) != FORMAT_VERSION:
+            raise ValueError(f"Unsupported compiled model format {int(arrays['format_version'])}")
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.left = arrays['left']
+        self.right = arrays['right']
+        self.value = arrays['value']
+        self.roots = arrays['roots']
+        self.classes_ = arrays['classes']
+        self.max_depth = int(arrays['max_depth'])
+        self.leaf_class = arrays['leaf_class'] if 'leaf_class' in arrays else np.argmax(self.value, axis=1)
+        self.is_leaf = arrays['is_leaf'] if 'is_leaf' in arrays else self.left == np.arange(len(self.left))
+
+    @classmethod
+    def from_model(cls, model):
+        """Compile a fitted sklearn model"""
+        return cls(export_model(model))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load a compiled model saved with save()
+
+        Arrays in a directory are memory-mapped read-only unless mmap=False;
+        the OS then keeps a single copy of their pages for all processes.
+        """
+        if os.path.isdir(path):
+            arrays = {}
+            for filename in os.listdir(path):
+                name, extension = os.path.splitext(filename)
+                if extension != '.npy':
+                    continue
+                # np.memmap has no 0-d form, so the scalar fields are read normally
+                mmap_mode = 'r' if mmap and name not in ('format_version', 'max_depth') else None
+                array = np.load(os.path.join(path, filename), mmap_mode=mmap_mode, allow_pickle=False)
+                # Plain ndarray views, so results of indexing are not np.memmap objects
+                arrays[name] = array.view(np.ndarray)
+            return cls(arrays)
+        with np.load(path, allow_pickle=False) as data:
+            return cls({name: data[name] for name in data.files})
+
+    def arrays(self):
+        """The exported node table, as returned by export_model()"""
+        return {
+            'format_version': np.array(FORMAT_VERSION),
+            'feature': self.feature, 'threshold': self.threshold,
+            'left': self.left, 'right': self.right, 'value': self.value,
+            'roots': self.roots, 'classes': self.classes_,
+            'max_depth': np.array(self.max_depth),
+        }
+
+    def save(self, path):
+        """
+        Save the flat arrays
+
+        A path ending in .npz gets one uncompressed .npz file. Any other path
+        becomes a directory of .npy files. The directory is written next to
+        its destination and renamed into place, so files a running worker
+        has mapped are never truncated or rewritten.
+        """
+        if path.endswith('.npz'):
+            np.savez(path, **self.arrays())
+            return
+
+        parent = os.path.dirname(os.path.abspath(path))
+        staging = tempfile.mkdtemp(dir=parent, prefix='.staging-')
+        try:
+            # mkdtemp creates the directory private; workers may run as another user
+            os.chmod(staging, 0o755)
+            arrays = dict(self.arrays(), leaf_class=self.leaf_class, is_leaf=self.is_leaf)
+            for name, array in arrays.items():
+                np.save(os.path.join(staging, name + '.npy'), np.asarray(array, order='C'))
+            if os.path.lexists(path):
+                retired = tempfile.mkdtemp(dir=parent, prefix='.retired-')
+                os.rename(path, os.path.join(retired, 'old'))
+                os.rename(staging, path)
+                shutil.rmtree(retired, ignore_errors=True)
+            else:
+                os.rename(staging, path)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+    def apply(self, X):
+        """Return the leaf index reached in every tree, shape (n_samples, n_trees)"""
+        # sklearn compares float32 inputs against float64 thresholds
+        X = np.ascontiguousarray(X, dtype=np.float32).astype(np.float64)
+        n_samples, n_features = X.shape
+        if n_samples == 1:
+            # Per-level array ops cost more than walking one sample node by node
+            return np.array([[self._walk(int(root), X[0]) for root in self.roots]])
+
+        flat = X.ravel()
+        row_offsets = (np.arange(n_samples) * n_features)[:, None]
+        nodes = np.broadcast_to(self.roots, (n_samples, len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            go_left = flat.take(row_offsets + self.feature.take(nodes)) <= self.threshold.take(nodes)
+            nodes = np.where(go_left, self.left.take(nodes), self.right.take(nodes))
+            if self.is_leaf.take(nodes).all():
+                break
+        return nodes
+
+    def _walk(self, node, row):
+        """Follow one sample from `node` down to its leaf"""
+        while not self.is_leaf[node]:
+            if row[self.feature[node]] <= self.threshold[node]:
+                node = int(self.left[node])
+            else:
+                node = int(self.right[node])
+        return node
+
+    def predict_proba(self, X):
+        """Class probabilities averaged over all trees"""
+        leaves = self.apply(X)
+        proba = np.zeros((len(leaves), len(self.classes_)))
+        for column in range(leaves.shape[1]):
+            proba += self.value[leaves[:, column]]
+        return proba / leaves.shape[1]
+
+    def predict(self, X):
+        """Most likely class per sample"""
+        if len(self.roots) == 1:
+            # A single tree's answer is fixed per leaf, so skip building probabilities
+            return self.classes_[self.leaf_class.take(self.apply(X)[:, 0])]
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def compile_file(source, destination):
+    """Compile a joblib-pickled sklearn model file to a directory of arrays or a .npz file"""
+    import joblib
+
+    compiled = CompiledTreeModel.from_model(joblib.load(source))
+    compiled.save(destination)
+    return compiled
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python tree_compiler.py <model.joblib> <output directory | output.npz>")
+        sys.exit(1)
+    compiled = compile_file(sys.argv[1], sys.argv[2])
+    print(f"Compiled {len(compiled.roots)} tree(s), {len(compiled.feature)} nodes, "
+          f"{len(compiled.classes_)} classes -> {sys.argv[2]}")
@@ -0,0 +1,275 @@
+"""
+User Repository Module
+Storage of user accounts behind one interface, in MongoDB or in the local
+SQLite database
+"""
+
+import sqlite3
+import threading
+import time
+
+from database import SQLITE_PATH, SQLiteConnections
+
+# Unique fields of a user; lookups by them use these indexes, and inserts rely on them to reject duplicates
+UNIQUE_FIELDS = ("username", "email")
+
+# After a failed attempt, index creation is retried on collection access at most this often (seconds)
+INDEX_RETRY_INTERVAL = 30.0
+
+
+class RepositoryUnavailable(Exception):
+    """The user store is not configured or cannot be reached"""
+
+
+class DuplicateUser(Exception):
+    """A unique field of the new user is already taken"""
+
+    def __init__(self, field):
+        super().__init__(f"{field} already taken")
+        self.field = field
+
+
+class UserRepository:
+    """
+    User accounts as records: {"_id", "username", "email", "password"}
+
+    Lookups return a record or None. insert() returns the new id as str and
+    raises DuplicateUser when the unique index rejects it, so a check made
+    before the insert can never let two equal accounts through.
+    """
+
+    name = "users"
+
+    def ensure_indexes(self):
+        """Create the unique indexes on username and email; False if that failed"""
+        raise NotImplementedError
+
+    def get(self, user_id):
+        raise NotImplementedError
+
+    def find_by_email(self, email):
+        raise NotImplementedError
+
+    def find_by_username(self, username):
+        raise NotImplementedError
+
+    def find_conflicts(self, username, email):
+        """Fields ("username", "email") already taken by other users, in one query"""
+        raise NotImplementedError
+
+    def insert(self, username, email, password):
+        raise NotImplementedError
+
+    def update_password(self, user_id, password_hash):
+        """Store a new password hash; False if the user could not be updated"""
+        raise NotImplementedError
+
+
+def _record(user_data):
+    return {
+        "_id": user_data["_id"],
+        "username": user_data["username"],
+        "email": user_data["email"],
+        "password": user_data["password"],
+    }
+
+
+class MongoUserRepository(UserRepository):
+    """
+    Users in the MongoDB users collection
+
+    The unique indexes are created on the first access that reaches the
+    server, not at import, so the app starts without waiting for MongoDB.
+    A failed attempt is retried every INDEX_RETRY_INTERVAL seconds until
+    one succeeds.
+    """
+
+    name = "MongoDB"
+
+    def __init__(self, get_collection):
+        self._get_collection = get_collection
+        self._indexed = False
+        self._index_failed_at = None
+        self._index_lock = threading.Lock()
+
+    def _create_indexes(self, collection):
+        try:
+            for field in UNIQUE_FIELDS:
+                collection.create_index(field, unique=True, name=f"{field}_unique")
+        except Exception as e:
+            # e.g. existing duplicates; lookups still work, only slower and without the guarantee
+            print(f"Error creating user indexes: {e}")
+            self._index_failed_at = time.monotonic()
+            return False
+        self._indexed = True
+        return True
+
+    def _collection(self):
+        """The users collection or None, with the indexes created on first successful access"""
+        collection = self._get_collection()
+        if collection is None or self._indexed:
+            return collection
+        failed_at = self._index_failed_at
+        if failed_at is not None and time.monotonic() - failed_at < INDEX_RETRY_INTERVAL:
+            return collection
+        # Threads arriving while another creates the indexes carry on without waiting
+        if self._index_lock.acquire(blocking=False):
+            try:
+                if not self._indexed:
+                    self._create_indexes(collection)
+            finally:
+                self._index_lock.release()
+        return collection
+
+    def ensure_indexes(self):
+        collection = self._get_collection()
+        if collection is None:
+            return False
+        with self._index_lock:
+            return self._create_indexes(collection)
+
+    def _find_one(self, query):
+        collection = self._collection()
+        if collection is None:
+            return None
+        user_data = collection.find_one(query)
+        return _record(user_data) if user_data else None
+
+    def get(self, user_id):
+        from bson.objectid import ObjectId
+        return self._find_one({"_id": ObjectId(user_id)})
+
+    def find_by_email(self, email):
+        return self._find_one({"email": email})
+
+    def find_by_username(self, username):
+        return self._find_one({"username": username})
+
+    def find_conflicts(self, username, email):
+        collection = self._collection()
+        if collection is None:
+            return set()
+        conflicts = set()
+        # Both fields are unique, so at most two users can match
+        for user_data in collection.find({"$or": [{"username": username}, {"email": email}]},
+                                         {"username": 1, "email": 1}).limit(2):
+            if user_data.get("username") == username:
+                conflicts.add("username")
+            if user_data.get("email") == email:
+                conflicts.add("email")
+        return conflicts
+
+    def insert(self, username, email, password):
+        collection = self._collection()
+        if collection is None:
+            raise RepositoryUnavailable("MongoDB connection failed or not configured")
+        try:
+            result = collection.insert_one({"username": username, "email": email, "password": password})
+        except Exception as e:
+            if getattr(e, "code", None) != 11000:
+                raise
+            # Another registration took the name or email between the check and the insert
+            key_pattern = (getattr(e, "details", None) or {}).get("keyPattern") or {}
+            raise DuplicateUser(next((field for field in UNIQUE_FIELDS if field in key_pattern), "username"))
+        return str(result.inserted_id)
+
+    def update_password(self, user_id, password_hash):
+        collection = self._collection()
+        if collection is None:
+            return False
+        from bson.objectid import ObjectId
+        collection.update_one({"_id": ObjectId(user_id)}, {"$set": {"password": password_hash}})
+        return True
+
+
+class SQLiteUserRepository(UserRepository):
+    """
+    Users in the local SQLite database
+
+    username and email have unique indexes, which serve the lookups and
+    reject duplicates on insert. Ids are the integer row ids, as strings.
+    """
+
+    name = "SQLite"
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS users (
+               id INTEGER PRIMARY KEY,
+               username TEXT NOT NULL,
+               email TEXT NOT NULL,
+               password TEXT NOT NULL
+           )""",
+        "CREATE UNIQUE INDEX IF NOT EXISTS users_username_unique ON users (username)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS users_email_unique ON users (email)",
+    )
+
+    SELECT = "SELECT id, username, email, password FROM users"
+
+    def __init__(self, path=SQLITE_PATH, timeout=30.0):
+        self.path = path
+        self._connections = SQLiteConnections(path, self.SCHEMA, timeout)
+
+    def ensure_indexes(self):
+        # Created with the table when the first connection opens
+        try:
+            self._connections.get()
+            return True
+        except (sqlite3.Error, OSError) as e:
+            # e.g. a read-only filesystem; the app still starts and user operations fail individually
+            print(f"Error creating user indexes: {e}")
+            return False
+
+    def _find_one(self, where, params):
+        row = self._connections.get().execute(f"{self.SELECT} WHERE {where}", params).fetchone()
+        if row is None:
+            return None
+        return {"_id": row[0], "username": row[1], "email": row[2], "password": row[3]}
+
+    def get(self, user_id):
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+        return self._find_one("id = ?", (user_id,))
+
+    def find_by_email(self, email):
+        return self._find_one("email = ?", (email,))
+
+    def find_by_username(self, username):
+        return self._find_one("username = ?", (username,))
+
+    def find_conflicts(self, username, email):
+        conflicts = set()
+        for found_username, found_email in self._connections.get().execute(
+                "SELECT username, email FROM users WHERE username = ? OR email = ? LIMIT 2", (username, email)):
+            if found_username == username:
+                conflicts.add("username")
+            if found_email == email:
+                conflicts.add("email")
+        return conflicts
+
+    def insert(self, username, email, password):
+        try:
+            with self._connections.transaction() as conn:
+                cursor = conn.execute("INSERT INTO users (username, email, password) VALUES (?, ?, ?)",
+                                      (username, email, password))
+        except sqlite3.IntegrityError as e:
+            # "UNIQUE constraint failed: users.email"
+            raise DuplicateUser(next((field for field in UNIQUE_FIELDS if f"users.{field}" in str(e)),
+                                     "username"))
+        return str(cursor.lastrowid)
+
+    def update_password(self, user_id, password_hash):
+        with self._connections.transaction() as conn:
+            cursor = conn.execute("UPDATE users SET password = ? WHERE id = ?", (password_hash, int(user_id)))
+        return cursor.rowcount == 1
+
+
+def create_user_repository(kind, get_collection=None, path=SQLITE_PATH):
+    """Repository for a USER_STORAGE value: "mongodb" or "sqlite" """
+    kind = kind.lower()
+    if kind in ("mongodb", "mongo"):
+        return MongoUserRepository(get_collection)
+    if kind == "sqlite":
+        return SQLiteUserRepository(path)
+    raise ValueError(f"Unknown user storage: {kind}")
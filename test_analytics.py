@@ -0,0 +1,577 @@
+import unittest
+import os
+import sys
+import threading
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+from flask import Flask
+
+# Mock MongoDB before importing analytics
+sys.modules['pymongo'] = MagicMock()
+sys.modules['pymongo.MongoClient'] = MagicMock()
+
+# Add project path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), 'project_agri')))
+
+from project_agri import analytics
+from project_agri.analytics_buffer import AnalyticsBuffer
+# The module object analytics itself imported, so patches reach its MongoDB backend
+import analytics_storage
+from analytics_storage import MemoryStorage, MongoStorage
+
+
+class FakeUpdateOne:
+    def __init__(self, filter, update, upsert=False):
+        self.filter = filter
+        self.update = update
+
+
+class DuplicateKeyError(Exception):
+    code = 11000
+
+
+class FakeCollection:
+    """In-process stand-in for a MongoDB collection applying $inc/$max/$set atomically per call"""
+
+    def __init__(self):
+        self.docs = {}
+        self.lock = threading.Lock()
+        self.update_calls = 0
+        self.find_calls = 0
+
+    def find_one(self, query):
+        self.find_calls += 1
+        with self.lock:
+            doc = self.docs.get(query['_id'])
+            return {k: dict(v) if isinstance(v, dict) else v for k, v in doc.items()} if doc else None
+
+    def find(self, query):
+        self.find_calls += 1
+        condition = query['_id']
+        with self.lock:
+            if '$in' in condition:
+                return [self.docs[i] for i in condition['$in'] if i in self.docs]
+            return [doc for doc_id, doc in sorted(self.docs.items())
+                    if condition['$gte'] <= doc_id < condition['$lt']]
+
+    def bulk_write(self, operations, ordered=True):
+        with self.lock:
+            self.update_calls += 1
+            for operation in operations:
+                self._apply(operation.filter, operation.update)
+
+    def update_one(self, query, update, upsert=False):
+        with self.lock:
+            self.update_calls += 1
+            doc = self.docs.get(query['_id'])
+            if doc is not None and any(doc.get(k, 0) != v for k, v in query.items() if k != '_id'):
+                # No match; the upsert would insert a second document with the same _id
+                if upsert:
+                    raise DuplicateKeyError('E11000 duplicate key error')
+                return
+            self._apply(query, update)
+
+    def _apply(self, query, update):
+        new = query['_id'] not in self.docs
+        doc = self.docs.setdefault(query['_id'], {'_id': query['_id']})
+        for operator, fields in update.items():
+            if operator == '$setOnInsert' and not new:
+                continue
+            for path, value in fields.items():
+                *parents, field = path.split('.')
+                target = doc
+                for parent in parents:
+                    target = target.setdefault(parent, {})
+                if operator == '$inc':
+                    target[field] = target.get(field, 0) + value
+                elif operator == '$max':
+                    target[field] = max(target.get(field, value), value)
+                else:
+                    target[field] = value
+
+
+def storage_patchers():
+    """Use the MongoDB backend on the (patched) get_db_collection, with an empty memory fallback"""
+    return [patch.object(analytics, '_storage', MongoStorage(lambda: analytics.get_db_collection())),
+            patch.object(analytics, '_memory_storage', MemoryStorage())]
+
+
+class AnalyticsMongoTestCase(unittest.TestCase):
+    def setUp(self):
+        self.collection = FakeCollection()
+        self.patcher = patch.object(analytics, 'get_db_collection', return_value=self.collection)
+        self.patcher.start()
+        # Write each event synchronously; buffering is covered below
+        self.buffer_patcher = patch.object(analytics, '_buffer', None)
+        self.buffer_patcher.start()
+        self.update_patcher = patch.object(analytics_storage, 'UpdateOne', FakeUpdateOne)
+        self.update_patcher.start()
+        self.storage_patchers = storage_patchers()
+        for patcher in self.storage_patchers:
+            patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.buffer_patcher.stop()
+        self.update_patcher.stop()
+        for patcher in self.storage_patchers:
+            patcher.stop()
+
+    def test_single_atomic_update(self):
+        analytics.track_page_view('Home')
+        self.assertEqual(self.collection.update_calls, 1)
+        self.assertEqual(self.collection.find_calls, 0)
+        update = self.collection.docs['main_analytics']
+        self.assertEqual(update['page_views'], {'Home': 1})
+        self.assertIn('last_updated', update)
+
+    def test_no_lost_updates_under_parallel_tracking(self):
+        threads, per_thread = 8, 250
+        barrier = threading.Barrier(threads)
+
+        def worker():
+            barrier.wait()
+            for i in range(per_thread):
+                analytics.track_page_view('Home')
+                analytics.track_weather_query('Pune' if i % 2 else 'Delhi')
+                analytics.track_visit()
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        data = analytics.load_analytics()
+        self.assertEqual(data['page_views']['Home'], threads * per_thread)
+        self.assertEqual(data['total_visits'], threads * per_thread)
+        summary = analytics.get_analytics_summary()
+        self.assertEqual(sorted(summary['top_weather_cities']), [('Delhi', threads * per_thread // 2),
+                                                                  ('Pune', threads * per_thread // 2)])
+
+    def test_writes_hour_and_day_buckets(self):
+        with patch.object(analytics, 'datetime', wraps=datetime) as clock:
+            clock.now.return_value = datetime(2025, 3, 1, 14, 30)
+            analytics.track_page_view('Home')
+            clock.now.return_value = datetime(2025, 3, 2, 9, 5)
+            analytics.track_page_view('Home')
+            analytics.track_visit()
+        self.assertEqual(self.collection.update_calls, 3)
+        docs = self.collection.docs
+        self.assertEqual(docs['hour:2025-03-01T14']['page_views'], {'Home': 1})
+        self.assertEqual(docs['day:2025-03-02']['page_views'], {'Home': 1})
+        self.assertEqual(docs['day:2025-03-02']['total_visits'], 1)
+        self.assertEqual(docs['day:2025-03-01']['bucket'], 'day')
+
+        summary = analytics.get_analytics_summary(datetime(2025, 3, 2), datetime(2025, 3, 3))
+        self.assertEqual(summary['total_page_views'], 1)
+        self.assertEqual(summary['total_visits'], 1)
+        summary = analytics.get_analytics_summary(datetime(2025, 3, 1, 14), datetime(2025, 3, 1, 15))
+        self.assertEqual(summary['top_pages'], [('Home', 1)])
+        self.assertEqual(analytics.get_analytics_summary()['total_page_views'], 2)
+
+    def test_keys_with_dots_and_dollars(self):
+        analytics.track_rotation_query('St. Louis')
+        analytics.track_weather_query('St. Louis')
+        analytics.track_crop_search('$weird%name')
+        raw = self.collection.docs['main_analytics']
+        self.assertEqual(raw['rotation_queries'], {'St%2E Louis': 1})
+        self.assertEqual(raw['crop_searches'], {'%24weird%25name': 1})
+
+        summary = analytics.get_analytics_summary()
+        self.assertEqual(summary['top_weather_cities'], [('St. Louis', 1)])
+        self.assertEqual(summary['top_crops'], [('$weird%name', 1)])
+
+
+class AnalyticsMemoryFallbackTestCase(unittest.TestCase):
+    def setUp(self):
+        self.patcher = patch.object(analytics, 'get_db_collection', return_value=None)
+        self.patcher.start()
+        self.buffer_patcher = patch.object(analytics, '_buffer', None)
+        self.buffer_patcher.start()
+        self.storage_patchers = storage_patchers()
+        for patcher in self.storage_patchers:
+            patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.buffer_patcher.stop()
+        for patcher in self.storage_patchers:
+            patcher.stop()
+
+    def test_no_lost_updates_under_parallel_tracking(self):
+        threads, per_thread = 8, 500
+
+        def worker():
+            for _ in range(per_thread):
+                analytics.track_feature('Crop Prediction')
+                analytics.track_visit()
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        summary = analytics.get_analytics_summary()
+        self.assertEqual(summary['top_features'], [('Crop Prediction', threads * per_thread)])
+        self.assertEqual(summary['total_visits'], threads * per_thread)
+
+    def test_mongo_error_falls_back_to_memory(self):
+        collection = MagicMock()
+        collection.bulk_write.side_effect = Exception('down')
+        with patch.object(analytics, 'get_db_collection', return_value=collection):
+            analytics.track_scheme_view('PM-KISAN')
+        self.assertEqual(analytics.load_analytics()['scheme_views'], {'PM-KISAN': 1})
+
+class RequestScopedTrackingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.collection = FakeCollection()
+        self.patchers = [patch.object(analytics, 'get_db_collection', return_value=self.collection),
+                         patch.object(analytics_storage, 'UpdateOne', FakeUpdateOne),
+                         patch.object(analytics, '_buffer', None),
+                         patch.object(analytics, '_sketches', {}),
+                         patch.object(analytics, '_sketch_events', 0),
+                         patch.object(analytics, '_sketches_flushed_at', analytics.time.monotonic())]
+        self.patchers += storage_patchers()
+        for patcher in self.patchers:
+            patcher.start()
+
+        self.app = Flask(__name__)
+        self.app.secret_key = 'test'
+        analytics.init_app(self.app)
+
+        @self.app.route('/calculate', methods=['POST'])
+        def calculate():
+            analytics.track_visit()
+            analytics.track_page_view('Fertilizer Calculator')
+            analytics.track_feature('Fertilizer Calculator')
+            analytics.track_fertilizer_calc('rice')
+            analytics.track_fertilizer_calc('rice')
+            self.writes_during_request = self.collection.update_calls
+            return 'ok'
+
+        @self.app.route('/fail')
+        def fail():
+            analytics.track_page_view('Broken')
+            raise RuntimeError('boom')
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+
+    def test_one_write_per_request(self):
+        response = self.app.test_client().post('/calculate')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.writes_during_request, 0)
+        self.assertEqual(self.collection.update_calls, 1)
+        self.assertEqual(self.collection.find_calls, 0)
+        doc = self.collection.docs['main_analytics']
+        self.assertEqual(doc['total_visits'], 1)
+        self.assertEqual(doc['page_views'], {'Fertilizer Calculator': 1})
+        self.assertEqual(doc['feature_usage'], {'Fertilizer Calculator': 1})
+        self.assertEqual(doc['fertilizer_calculations'], {'rice': 2})
+
+    def test_events_written_when_request_fails(self):
+        self.app.test_client().get('/fail')
+        self.assertEqual(self.collection.docs['main_analytics']['page_views'], {'Broken': 1})
+
+    def test_request_without_tracking_does_not_write(self):
+        self.app.add_url_rule('/quiet', 'quiet', lambda: 'ok')
+        self.app.test_client().get('/quiet')
+        self.assertEqual(self.collection.update_calls, 0)
+
+    def test_sketches_merged_in_batches_without_buffer(self):
+        client = self.app.test_client()
+        with patch.object(analytics, 'SKETCH_FLUSH_MAX_EVENTS', 3):
+            client.post('/calculate')
+            client.post('/calculate')
+            self.assertFalse(any(doc_id.startswith('hll:') for doc_id in self.collection.docs))
+            client.post('/calculate')
+        self.assertEqual(analytics.load_unique_visitors(), {'*': 1, 'Fertilizer Calculator': 1})
+
+        client.post('/calculate')
+        with patch.object(analytics, 'SKETCH_FLUSH_INTERVAL_MS', 0):
+            client.post('/calculate')
+        self.assertEqual(analytics._sketch_events, 0)
+
+    def test_buffer_flush_leaves_sketches_until_due(self):
+        buffer = AnalyticsBuffer(analytics._flush_events, interval_ms=60000)
+        client = self.app.test_client()
+        with patch.object(analytics, '_buffer', buffer), \
+                patch.object(analytics, '_summary_cache', {}):
+            client.post('/calculate')
+            client.post('/calculate')
+            buffer.flush()
+            self.assertEqual(self.collection.update_calls, 1)
+            self.assertFalse(any(doc_id.startswith('hll:') for doc_id in self.collection.docs))
+
+            # A dashboard reload merges this worker's sketches first
+            summary = analytics.get_cached_summary()
+            self.assertEqual(summary['unique_visitors'], 1)
+            self.assertEqual(summary['total_visits'], 2)
+
+
+class UniqueVisitorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.collection = FakeCollection()
+        self.patchers = [patch.object(analytics, 'get_db_collection', return_value=self.collection),
+                         patch.object(analytics_storage, 'UpdateOne', FakeUpdateOne),
+                         patch.object(analytics, '_buffer', None),
+                         patch.object(analytics, '_sketches', {}),
+                         patch.object(analytics, '_sketch_events', 0)] + storage_patchers()
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+
+    def test_concurrent_workers_merge_without_losing_visitors(self):
+        from project_agri.hyperloglog import HyperLogLog
+        workers, per_worker = 4, 2000
+        sketches = []
+        for w in range(workers):
+            sketch = HyperLogLog()
+            for i in range(per_worker):
+                sketch.add(f'user:{w}:{i}')
+            sketches.append(sketch)
+        barrier = threading.Barrier(workers)
+
+        def merge(sketch):
+            barrier.wait()
+            analytics._merge_sketch(MongoStorage(lambda: self.collection), 'hll:all:%2A', sketch)
+
+        threads = [threading.Thread(target=merge, args=(sketch,)) for sketch in sketches]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stored = HyperLogLog.from_bytes(self.collection.docs['hll:all:%2A']['registers'])
+        union = HyperLogLog()
+        for sketch in sketches:
+            union.merge(sketch)
+        self.assertEqual(stored.to_bytes(), union.to_bytes())
+        self.assertEqual(self.collection.docs['hll:all:%2A']['version'] > 0, True)
+
+    def test_page_views_count_distinct_visitors(self):
+        app = Flask(__name__)
+        app.secret_key = 'test'
+        analytics.init_app(app)
+        app.add_url_rule('/', 'home', lambda: analytics.track_page_view('Home') or 'ok')
+        app.add_url_rule('/news', 'news', lambda: analytics.track_page_view('News') or 'ok')
+
+        clients = [app.test_client() for _ in range(3)]
+        for client in clients:
+            client.get('/')
+            client.get('/')
+        clients[0].get('/news')
+        # Merged by the flusher in production
+        analytics.flush_sketches()
+
+        summary = analytics.get_analytics_summary()
+        self.assertEqual(summary['unique_visitors'], 3)
+        self.assertEqual(summary['top_pages_unique'], [('Home', 3), ('News', 1)])
+        self.assertEqual(summary['total_page_views'], 7)
+
+        today = datetime.now().replace(hour=0, minute=0)
+        self.assertEqual(analytics.load_unique_visitors(today, datetime.now()), {'*': 3, 'Home': 3, 'News': 1})
+        self.assertEqual(analytics.load_unique_visitors(today - timedelta(days=3), today - timedelta(days=1)), {})
+
+
+class HeavyHitterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.collection = FakeCollection()
+        self.patchers = [patch.object(analytics, 'get_db_collection', return_value=self.collection),
+                         patch.object(analytics, '_buffer', None),
+                         patch.object(analytics, '_heavy_hitters', {}),
+                         patch.object(analytics, 'HEAVY_HITTER_CAPACITY', 20)] + storage_patchers()
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+
+    def test_bounded_storage_keeps_heavy_hitters(self):
+        # Long tail of one-off GPS lookups next to a few popular cities
+        for i in range(3000):
+            analytics.track_weather_query(f'{18 + i / 1000:.3f},{73 + i / 1000:.3f} (GPS)')
+            if i % 3 == 0:
+                analytics.track_weather_query('Pune')
+            if i % 5 == 0:
+                analytics.track_weather_query('Delhi')
+            if i % 300 == 0:
+                analytics.flush_sketches()
+
+        summary = analytics.get_analytics_summary()
+        top = summary['top_weather_cities']
+        self.assertEqual([city for city, _ in top[:2]], ['Pune', 'Delhi'])
+        # Counts never underestimate and overestimate by at most N / capacity
+        total = 3000 + 1000 + 600
+        self.assertTrue(1000 <= top[0][1] <= 1000 + total / 20)
+        self.assertTrue(600 <= top[1][1] <= 600 + total / 20)
+
+        stored = self.collection.docs['topk:all:weather_queries']
+        self.assertEqual(len(stored['items']), 20)
+        self.assertEqual(stored['total'], total)
+        self.assertNotIn('weather_queries', self.collection.docs.get('main_analytics', {}))
+
+    def test_day_range(self):
+        with patch.object(analytics, 'datetime', wraps=datetime) as clock:
+            clock.now.return_value = datetime(2025, 3, 1, 10)
+            analytics.track_weather_query('Pune')
+            clock.now.return_value = datetime(2025, 3, 2, 10)
+            analytics.track_weather_query('Delhi')
+            analytics.flush_sketches()
+        self.assertEqual(analytics.load_heavy_hitters('weather_queries', datetime(2025, 3, 2),
+                                                      datetime(2025, 3, 2, 23)).top(),
+                         [('Delhi', 1, 0)])
+        self.assertEqual(len(analytics.load_heavy_hitters('weather_queries').top()), 2)
+
+
+class BucketRangeTestCase(unittest.TestCase):
+    def test_whole_days_use_daily_rollups(self):
+        ids = analytics.bucket_ids_for_range(datetime(2025, 3, 1, 22, 15), datetime(2025, 3, 4, 2, 0))
+        self.assertEqual(ids, ['hour:2025-03-01T22', 'hour:2025-03-01T23', 'day:2025-03-02',
+                               'day:2025-03-03', 'hour:2025-03-04T00', 'hour:2025-03-04T01'])
+
+    def test_year_range_reads_few_documents(self):
+        end = datetime(2025, 6, 15, 13, 40)
+        ids = analytics.bucket_ids_for_range(end - timedelta(days=365), end)
+        self.assertLessEqual(len(ids), 365 + 46)
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_memory_fallback_ranges(self):
+        with patch.object(analytics, 'get_db_collection', return_value=None), \
+                patch.object(analytics, '_buffer', None), \
+                patch.object(analytics, '_storage', MongoStorage(lambda: analytics.get_db_collection())), \
+                patch.object(analytics, '_memory_storage', MemoryStorage()), \
+                patch.object(analytics, 'datetime', wraps=datetime) as clock:
+            clock.now.return_value = datetime(2025, 3, 1, 10)
+            analytics.track_weather_query('St. Louis')
+            summary = analytics.get_analytics_summary(datetime(2025, 3, 1), datetime(2025, 3, 2))
+        self.assertEqual(summary['top_weather_cities'], [('St. Louis', 1)])
+
+
+class SummaryCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.collection = FakeCollection()
+        self.patchers = [patch.object(analytics, 'get_db_collection', return_value=self.collection),
+                         patch.object(analytics_storage, 'UpdateOne', FakeUpdateOne),
+                         patch.object(analytics, '_buffer', None),
+                         patch.object(analytics, '_summary_cache', {}),
+                         patch.object(analytics, 'SUMMARY_CACHE_TTL', 60)] + storage_patchers()
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+
+    def test_served_from_cache_within_ttl(self):
+        analytics.track_page_view('Home')
+        first = analytics.get_cached_summary()
+        reads = self.collection.find_calls
+        second = analytics.get_cached_summary()
+        self.assertIs(second, first)
+        self.assertEqual(self.collection.find_calls, reads)
+        self.assertEqual(first['cached_at'], second['cached_at'])
+        self.assertEqual(first['db_status'], 'Connected')
+
+    def test_own_writes_update_cached_counters(self):
+        analytics.track_page_view('Home')
+        analytics.get_cached_summary()
+        analytics.get_cached_summary('24h')
+        reads = self.collection.find_calls
+        analytics.track_page_view('Weather')
+        analytics.track_page_view('Weather')
+        for range_key in ('all', '24h'):
+            summary = analytics.get_cached_summary(range_key)
+            self.assertEqual(summary['top_pages'], [('Weather', 2), ('Home', 1)])
+            self.assertEqual(summary['total_page_views'], 3)
+        self.assertEqual(self.collection.find_calls, reads)
+
+    def test_reloads_after_ttl(self):
+        analytics.track_page_view('Home')
+        first = analytics.get_cached_summary()
+        # Another worker's write only shows up once the entry expires
+        self.collection.docs['main_analytics']['page_views']['Market'] = 5
+        self.assertEqual(analytics.get_cached_summary()['total_page_views'], 1)
+        with patch.object(analytics.time, 'monotonic', return_value=analytics.time.monotonic() + 61):
+            summary = analytics.get_cached_summary()
+        self.assertIsNot(summary, first)
+        self.assertEqual(summary['total_page_views'], 6)
+
+    def test_ttl_zero_disables_cache(self):
+        with patch.object(analytics, 'SUMMARY_CACHE_TTL', 0):
+            analytics.get_cached_summary()
+            analytics.track_page_view('Home')
+            self.assertEqual(analytics._summary_cache, {})
+            self.assertEqual(analytics.get_cached_summary()['total_page_views'], 1)
+
+
+class AnalyticsBufferTestCase(unittest.TestCase):
+    def setUp(self):
+        self.flushed = []
+
+    def test_merges_events_until_flush(self):
+        buffer = AnalyticsBuffer(self.flushed.append, interval_ms=60000)
+        for _ in range(3):
+            buffer.add({'page_views.Home': 1})
+        buffer.add({'total_visits': 1})
+        self.assertEqual(self.flushed, [])
+
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(self.flushed, [{'page_views.Home': 3, 'total_visits': 1}])
+        self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(buffer.stats()['events'], 4)
+
+    def test_flushes_early_at_max_events(self):
+        done = threading.Event()
+        buffer = AnalyticsBuffer(lambda increments: (self.flushed.append(increments), done.set()),
+                                 interval_ms=60000, max_events=5)
+        for _ in range(5):
+            buffer.add({'page_views.Home': 1})
+        self.assertTrue(done.wait(5))
+        self.assertEqual(self.flushed, [{'page_views.Home': 5}])
+
+    def test_drops_new_counters_when_full(self):
+        buffer = AnalyticsBuffer(self.flushed.append, interval_ms=60000, max_keys=2)
+        buffer.add({'crop_searches.rice': 1})
+        buffer.add({'crop_searches.maize': 1})
+        buffer.add({'crop_searches.jute': 1})
+        buffer.add({'crop_searches.rice': 1})
+        self.assertEqual(buffer.stats()['dropped'], 1)
+        buffer.flush()
+        self.assertEqual(self.flushed, [{'crop_searches.rice': 2, 'crop_searches.maize': 1}])
+
+    def test_flush_error_is_counted(self):
+        buffer = AnalyticsBuffer(MagicMock(side_effect=Exception('down')), interval_ms=60000)
+        buffer.add({'total_visits': 1})
+        self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(buffer.stats()['flush_errors'], 1)
+
+    def test_tracking_is_one_bulk_update_per_flush(self):
+        collection = FakeCollection()
+        buffer = AnalyticsBuffer(analytics.increment_counters, interval_ms=60000, max_events=10 ** 6)
+        with patch.object(analytics, 'get_db_collection', return_value=collection), \
+                patch.object(analytics_storage, 'UpdateOne', FakeUpdateOne), \
+                patch.object(analytics, '_storage', MongoStorage(lambda: collection)), \
+                patch.object(analytics, '_buffer', buffer):
+            workers = [threading.Thread(target=lambda: [analytics.track_page_view('Weather') for _ in range(200)])
+                       for _ in range(4)]
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+            self.assertEqual(collection.update_calls, 0)
+
+            summary = analytics.get_analytics_summary()
+        self.assertEqual(collection.update_calls, 1)
+        self.assertEqual(summary['top_pages'], [('Weather', 800)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import unittest
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from unittest.mock import MagicMock, patch
+
+# Mock MongoDB before importing analytics
+sys.modules['pymongo'] = MagicMock()
+sys.modules['pymongo.MongoClient'] = MagicMock()
+
+# Add project path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), 'project_agri')))
+
+from project_agri import analytics
+from analytics_storage import MemoryStorage, SQLiteStorage, create_storage
+
+
+def _increment_in_child(path, count):
+    storage = SQLiteStorage(path)
+    for _ in range(count):
+        storage.increment({"main_analytics": {}}, {"page_views.Home": 1}, "2025-03-01T10:00:00")
+
+
+class StorageContract:
+    """Behaviour every backend shares; subclasses provide make_storage()"""
+
+    def test_increment_creates_and_adds(self):
+        storage = self.make_storage()
+        documents = {"main_analytics": {}, "day:2025-03-01": {"bucket": "day", "start": "2025-03-01T00:00:00"}}
+        storage.increment(documents, {"page_views.Home": 1, "total_visits": 1}, "2025-03-01T10:00:00")
+        storage.increment(documents, {"page_views.Home": 2, "crop_searches.rice": 1}, "2025-03-01T09:00:00")
+
+        main = storage.find_one("main_analytics")
+        self.assertEqual(main["page_views"], {"Home": 3})
+        self.assertEqual(main["crop_searches"], {"rice": 1})
+        self.assertEqual(main["total_visits"], 1)
+        self.assertEqual(main["last_updated"], "2025-03-01T10:00:00")
+        day = storage.find_one("day:2025-03-01")
+        self.assertEqual((day["bucket"], day["page_views"]), ("day", {"Home": 3}))
+        self.assertIsNone(storage.find_one("day:2025-03-02"))
+
+    def test_find_ids_and_range(self):
+        storage = self.make_storage()
+        for doc_id in ("hour:2025-03-01T10", "hour:2025-03-01T11", "hour:2025-03-02T00"):
+            storage.increment({doc_id: {}}, {"total_visits": 1}, "2025-03-01T10:00:00")
+        found = storage.find_ids(["hour:2025-03-01T11", "hour:2025-03-09T00"])
+        self.assertEqual([doc["_id"] for doc in found], ["hour:2025-03-01T11"])
+        found = storage.find_range("hour:2025-03-01T", "hour:2025-03-01U")
+        self.assertEqual([doc["_id"] for doc in found], ["hour:2025-03-01T10", "hour:2025-03-01T11"])
+
+    def test_merge_round_trips_bytes(self):
+        storage = self.make_storage()
+        storage.merge("hll:all:Home", lambda doc: {"registers": b"\x00\x03\x01", "p": 4})
+        storage.merge("hll:all:Home", lambda doc: {"registers": bytes(max(a, b) for a, b in
+                                                                      zip(doc["registers"], b"\x02\x00\x00"))})
+        self.assertEqual(storage.merge("hll:all:Home", lambda doc: None), None)
+        doc = storage.find_one("hll:all:Home")
+        self.assertEqual(bytes(doc["registers"]), b"\x02\x03\x01")
+        self.assertEqual(doc["p"], 4)
+
+    def test_replace_counters(self):
+        storage = self.make_storage()
+        storage.increment({"main_analytics": {}}, {"page_views.Home": 5, "page_views.Weather": 1},
+                          "2025-03-01T10:00:00")
+        storage.replace_counters("main_analytics", {"page_views": {"Market": 2}, "total_visits": 7},
+                                 "2025-03-02T00:00:00")
+        main = storage.find_one("main_analytics")
+        self.assertEqual(main["page_views"], {"Market": 2})
+        self.assertEqual(main["total_visits"], 7)
+        self.assertEqual(main["last_updated"], "2025-03-02T00:00:00")
+
+    def test_concurrent_increments_are_not_lost(self):
+        storage = self.make_storage()
+        threads, per_thread = 4, 100
+
+        def worker():
+            for _ in range(per_thread):
+                storage.increment({"main_analytics": {}}, {"page_views.Home": 1}, "2025-03-01T10:00:00")
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        self.assertEqual(storage.find_one("main_analytics")["page_views"], {"Home": threads * per_thread})
+
+
+class MemoryStorageTestCase(StorageContract, unittest.TestCase):
+    def make_storage(self):
+        return MemoryStorage()
+
+
+class SQLiteStorageTestCase(StorageContract, unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'instance', 'site.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def make_storage(self):
+        return SQLiteStorage(self.path)
+
+    def test_wal_mode(self):
+        storage = self.make_storage()
+        storage.find_one("main_analytics")
+        mode = storage._connections.get().execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, "wal")
+
+    def test_counters_shared_between_processes_and_durable(self):
+        context = multiprocessing.get_context('fork')
+        children = [context.Process(target=_increment_in_child, args=(self.path, 50)) for _ in range(2)]
+        for child in children:
+            child.start()
+        for child in children:
+            child.join()
+            self.assertEqual(child.exitcode, 0)
+        # A fresh backend, as after a restart, sees every write
+        self.assertEqual(SQLiteStorage(self.path).find_one("main_analytics")["page_views"], {"Home": 100})
+
+    def test_create_storage(self):
+        self.assertIsInstance(create_storage("sqlite"), SQLiteStorage)
+        self.assertIsInstance(create_storage("memory"), MemoryStorage)
+        with self.assertRaises(ValueError):
+            create_storage("redis")
+
+
+class AnalyticsOnSQLiteTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.storage = SQLiteStorage(os.path.join(self.tmp, 'site.db'))
+        self.patchers = [patch.object(analytics, '_storage', self.storage),
+                         patch.object(analytics, '_memory_storage', MemoryStorage()),
+                         patch.object(analytics, '_buffer', None),
+                         patch.object(analytics, '_sketches', {}),
+                         patch.object(analytics, '_heavy_hitters', {})]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_summary_from_sqlite(self):
+        analytics.track_visit()
+        analytics.track_crop_search('St. Rice')
+        analytics.track_weather_query('Pune')
+        analytics.track_unique_visitor('Home', 'session:a')
+        analytics.track_unique_visitor('Home', 'session:b')
+
+        summary = analytics.get_analytics_summary()
+        self.assertEqual(summary['db_status'], 'Connected')
+        self.assertEqual(summary['storage_backend'], 'SQLite')
+        self.assertEqual(summary['total_visits'], 1)
+        self.assertEqual(summary['top_crops'], [('St. Rice', 1)])
+        self.assertEqual(summary['top_weather_cities'], [('Pune', 1)])
+        self.assertEqual(summary['unique_visitors'], 2)
+        # The whole write batch also landed in today's hour and day buckets
+        self.assertEqual(len(self.storage.find_range("day:", "day;")), 1)
+        self.assertEqual(len(self.storage.find_range("hour:", "hour;")), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
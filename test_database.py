@@ -0,0 +1,107 @@
+import unittest
+import os
+import sys
+from unittest.mock import MagicMock, patch
+
+# Mock MongoDB before importing the data-access modules
+sys.modules['pymongo'] = MagicMock()
+sys.modules['pymongo.MongoClient'] = MagicMock()
+
+# Add project path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), 'project_agri')))
+
+from project_agri import analytics, models
+# The module object models and analytics themselves imported
+import database
+
+
+class SharedClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client_class = MagicMock()
+        self.patchers = [patch.object(database, 'MongoClient', self.client_class),
+                         patch.object(database, 'MONGO_URI', 'mongodb://db.example:27017'),
+                         patch.object(database, 'MONGO_MAX_POOL_SIZE', 7),
+                         patch.object(database, '_client', None),
+                         patch.object(database, '_client_pid', None),
+                         patch.object(database, '_health', None),
+                         patch.object(database, '_health_failures', 0)]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+
+    def test_users_and_analytics_share_one_pool(self):
+        users = models.get_users_collection()
+        events = analytics.get_db_collection()
+        self.assertIsNotNone(users)
+        self.assertIsNotNone(events)
+        self.client_class.assert_called_once()
+        self.assertIs(models.get_mongo_client(), analytics.get_mongo_client())
+        client = self.client_class.return_value
+        client.__getitem__.assert_called_with(database.DB_NAME)
+        self.assertEqual([c.args[0] for c in client.__getitem__.return_value.__getitem__.call_args_list],
+                         ['users', 'analytics'])
+
+    def test_pool_options(self):
+        database.get_client()
+        kwargs = self.client_class.call_args.kwargs
+        self.assertEqual(kwargs['maxPoolSize'], 7)
+        self.assertFalse(kwargs['connect'])
+        self.assertIn('serverSelectionTimeoutMS', kwargs)
+
+    def test_new_client_after_fork(self):
+        self.client_class.side_effect = lambda *args, **kwargs: MagicMock()
+        parent = database.get_client()
+        self.assertIs(database.get_client(), parent)
+        with patch.object(database.os, 'getpid', return_value=os.getpid() + 1):
+            child = database.get_client()
+            self.assertIs(database.get_client(), child)
+        self.assertIsNot(parent, child)
+        self.assertEqual(self.client_class.call_count, 2)
+
+    def test_unhealthy_server_returns_no_collection(self):
+        self.client_class.return_value.admin.command.side_effect = Exception('no server')
+        self.assertIsNone(models.get_users_collection())
+        self.assertIsNone(analytics.get_db_collection())
+        # The failed ping is reused rather than repeated on every call
+        self.assertEqual(self.client_class.return_value.admin.command.call_count, 1)
+
+        with patch.object(database.time, 'monotonic', return_value=database.time.monotonic() + 3600):
+            self.client_class.return_value.admin.command.side_effect = None
+            self.assertIsNotNone(models.get_users_collection())
+
+    def test_failed_ping_retried_with_backoff(self):
+        ping = self.client_class.return_value.admin.command
+        ping.side_effect = Exception('timeout')
+        start = database.time.monotonic()
+        with patch.object(database, 'MONGO_HEALTH_RETRY_INTERVAL', 1), \
+                patch.object(database.time, 'monotonic') as clock:
+            for offset, healthy, pings in ((0, False, 1), (0.5, False, 1), (1.5, False, 2),
+                                           (3, False, 2), (3.6, True, 3), (30, True, 3)):
+                if healthy:
+                    ping.side_effect = None
+                clock.return_value = start + offset
+                self.assertEqual(database.check_health(), healthy)
+                self.assertEqual(ping.call_count, pings)
+
+    def test_concurrent_checks_ping_once(self):
+        ping = self.client_class.return_value.admin.command
+        database.check_health()
+        with patch.object(database, '_health_checked', 0.0):
+            # Another thread holds the lock while pinging; callers keep the last result
+            with database._health_lock:
+                self.assertTrue(database.check_health())
+            self.assertEqual(ping.call_count, 1)
+
+    def test_not_configured(self):
+        with patch.object(database, 'MONGO_URI', None):
+            self.assertIsNone(database.get_client())
+            self.assertIsNone(models.get_users_collection())
+            self.assertFalse(database.check_health())
+        self.client_class.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+import os
+import sys
+
+# Add project path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), 'project_agri')))
+
+from project_agri.hyperloglog import HyperLogLog
+
+
+class HyperLogLogTestCase(unittest.TestCase):
+    def test_estimates_within_error_bounds(self):
+        for n in (10, 1000, 50000):
+            sketch = HyperLogLog()
+            for i in range(n):
+                sketch.add(f'user:{i}')
+            # Duplicates do not change the estimate
+            for i in range(n):
+                sketch.add(f'user:{i}')
+            self.assertAlmostEqual(sketch.count(), n, delta=max(1, n * 0.05))
+
+    def test_fixed_size(self):
+        sketch = HyperLogLog()
+        for i in range(20000):
+            sketch.add(i)
+        self.assertEqual(len(sketch.to_bytes()), 4096)
+
+    def test_merge_is_union(self):
+        a, b, both = HyperLogLog(), HyperLogLog(), HyperLogLog()
+        for i in range(6000):
+            (a if i < 4000 else b).add(i)
+            both.add(i)
+        # Overlapping values counted once
+        for i in range(3000, 4000):
+            b.add(i)
+        a.merge(b.to_bytes())
+        self.assertEqual(a.to_bytes(), both.to_bytes())
+        self.assertEqual(HyperLogLog.from_bytes(a.to_bytes()).count(), both.count())
+
+    def test_rejects_mismatched_registers(self):
+        with self.assertRaises(ValueError):
+            HyperLogLog().merge(HyperLogLog(p=10))
+        with self.assertRaises(ValueError):
+            HyperLogLog.from_bytes(b'\x00' * 10)
+
+if __name__ == '__main__':
+    unittest.main()
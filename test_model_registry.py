@@ -0,0 +1,89 @@
+import unittest
+import os
+import sys
+import json
+import tempfile
+
+# Add project path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), 'project_agri')))
+
+from project_agri.model_registry import ModelRegistry, RegistryError
+from project_agri.model_service import resolve_model_path, BUNDLED_MODEL_PATHS
+
+
+class ModelRegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.registry = ModelRegistry(os.path.join(self.tmpdir.name, 'registry'))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def artifact(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_register_stores_metadata(self):
+        version = self.registry.register([self.artifact('m.npz', b'npz'), self.artifact('m', b'pkl')],
+                                         data_sha256='abc', metrics={'accuracy': 0.99})
+        meta = self.registry.metadata(version)
+        self.assertEqual(meta['data_sha256'], 'abc')
+        self.assertEqual(meta['metrics'], {'accuracy': 0.99})
+        self.assertEqual(sorted(meta['artifacts']), ['model.joblib', 'model.npz'])
+        self.assertIn('created_at', meta)
+        # Compiled artifact is preferred for serving
+        self.assertTrue(self.registry.artifact_path(version).endswith('model.npz'))
+
+    def test_register_compiled_directory(self):
+        directory = os.path.join(self.tmpdir.name, 'm.compiled')
+        os.mkdir(directory)
+        with open(os.path.join(directory, 'feature.npy'), 'wb') as f:
+            f.write(b'arrays')
+        version = self.registry.register([directory, self.artifact('m.npz', b'npz')])
+        path = self.registry.artifact_path(version)
+        self.assertTrue(path.endswith('model.compiled'))
+        self.assertEqual(os.listdir(path), ['feature.npy'])
+        self.assertEqual(len(self.registry.metadata(version)['artifacts']['model.compiled']), 64)
+
+    def test_nothing_active_by_default(self):
+        self.registry.register([self.artifact('m', b'pkl')])
+        self.assertIsNone(self.registry.active_artifact_path())
+
+    def test_activate_and_rollback(self):
+        first = self.registry.register([self.artifact('a', b'1')])
+        second = self.registry.register([self.artifact('b', b'2')])
+        self.assertNotEqual(first, second)
+
+        self.registry.activate(first)
+        self.registry.activate(second)
+        self.assertEqual(self.registry.active_version(), second)
+
+        self.assertEqual(self.registry.rollback(), first)
+        self.assertEqual(self.registry.active_version(), first)
+        with self.assertRaises(RegistryError):
+            self.registry.rollback()
+
+    def test_pointer_file_is_complete_json(self):
+        version = self.registry.register([self.artifact('a', b'1')])
+        self.registry.activate(version)
+        with open(self.registry.pointer_path) as f:
+            self.assertEqual(json.load(f)['active'], version)
+        # No temp files are left behind next to the pointer
+        self.assertEqual(sorted(os.listdir(self.registry.root)), ['ACTIVE.json', 'versions'])
+
+    def test_unknown_version(self):
+        with self.assertRaises(RegistryError):
+            self.registry.activate('v-missing')
+        with self.assertRaises(RegistryError):
+            self.registry.activate('../escape')
+
+    def test_resolve_model_path(self):
+        self.assertIn(resolve_model_path(self.registry), BUNDLED_MODEL_PATHS)
+        version = self.registry.register([self.artifact('a', b'1')])
+        self.registry.activate(version)
+        self.assertEqual(resolve_model_path(self.registry), self.registry.artifact_path(version))
+
+if __name__ == '__main__':
+    unittest.main()
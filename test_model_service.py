@@ -0,0 +1,482 @@
+import unittest
+import os
+import sys
+import pickle
+import json
+import base64
+import itertools
+import tempfile
+import threading
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.ensemble import RandomForestClassifier
+
+# Mock MongoDB before importing app
+sys.modules['pymongo'] = MagicMock()
+sys.modules['pymongo.MongoClient'] = MagicMock()
+
+# Add project path
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), 'project_agri'))
+sys.path.append(PROJECT_DIR)
+
+from project_agri.crop_predict import app
+from project_agri.prediction_batcher import MicroBatcher
+from project_agri.model_service import (ModelHolder, parse_record, validate_features, predict_batch,
+                                        predict_top_k, stream_csv_predictions, PredictionCache,
+                                        parse_precision, build_grid_axes, sweep_grid)
+
+DATASET_FILE = os.path.join(PROJECT_DIR, 'Crop_recommendation.csv')
+RICE_SAMPLE = [90, 42, 43, 20.879, 82.002, 6.502, 202.935]
+
+
+def load_dataset():
+    features = np.loadtxt(DATASET_FILE, delimiter=',', skiprows=1, usecols=range(7))
+    labels = np.loadtxt(DATASET_FILE, delimiter=',', skiprows=1, usecols=7, dtype=str)
+    return features, labels
+
+
+def _pickle_load(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+class ModelHolderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'model.pkl')
+        self.loads = 0
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_model(self, value, mtime=None):
+        with open(self.path, 'wb') as f:
+            pickle.dump(value, f)
+        if mtime is not None:
+            os.utime(self.path, (mtime, mtime))
+
+    def counting_loader(self, path):
+        self.loads += 1
+        return _pickle_load(path)
+
+    def test_model_loaded_once(self):
+        self.write_model({'version': 1})
+        holder = ModelHolder(self.path, loader=self.counting_loader, check_interval=0, background=False)
+        for _ in range(5):
+            self.assertEqual(holder.get(), {'version': 1})
+        self.assertEqual(self.loads, 1)
+
+    def test_reload_on_changed_file(self):
+        self.write_model({'version': 1}, mtime=1000)
+        holder = ModelHolder(self.path, loader=self.counting_loader, check_interval=0, background=False)
+        self.assertEqual(holder.get(), {'version': 1})
+
+        self.write_model({'version': 2}, mtime=2000)
+        self.assertEqual(holder.get(), {'version': 2})
+        self.assertEqual(holder.reloads, 1)
+
+    def test_touch_without_content_change_does_not_reload(self):
+        self.write_model({'version': 1}, mtime=1000)
+        holder = ModelHolder(self.path, loader=self.counting_loader, check_interval=0, background=False)
+        holder.get()
+        os.utime(self.path, (3000, 3000))
+        holder.get()
+        self.assertEqual(self.loads, 1)
+
+    def test_reload_on_replaced_compiled_directory(self):
+        from project_agri.tree_compiler import CompiledTreeModel
+        features, labels = load_dataset()
+        path = os.path.join(self.tmpdir.name, 'model.compiled')
+        CompiledTreeModel.from_model(DecisionTreeClassifier(max_depth=2).fit(features, labels)).save(path)
+        holder = ModelHolder(path, check_interval=0, background=False)
+        self.assertEqual(holder.get().max_depth, 2)
+
+        CompiledTreeModel.from_model(DecisionTreeClassifier(max_depth=4).fit(features, labels)).save(path)
+        self.assertEqual(holder.get().max_depth, 4)
+        self.assertEqual(holder.reloads, 1)
+
+    def test_missing_file(self):
+        holder = ModelHolder(self.path, loader=self.counting_loader, check_interval=0, background=False)
+        with self.assertRaises(FileNotFoundError):
+            holder.get()
+
+    def test_keeps_model_when_file_removed(self):
+        self.write_model({'version': 1})
+        holder = ModelHolder(self.path, loader=self.counting_loader, check_interval=0, background=False)
+        holder.get()
+        os.remove(self.path)
+        self.assertEqual(holder.get(), {'version': 1})
+
+    def test_background_reload_swaps_after_load(self):
+        self.write_model({'version': 1}, mtime=1000)
+        holder = ModelHolder(self.path, loader=self.counting_loader, check_interval=0)
+        self.assertEqual(holder.get(), {'version': 1})
+
+        self.write_model({'version': 2}, mtime=2000)
+        # The request that notices the change keeps the current model
+        self.assertEqual(holder.get(), {'version': 1})
+        holder.wait_for_reload(timeout=5)
+        self.assertEqual(holder.get(), {'version': 2})
+
+    def test_failed_warm_up_keeps_current_model(self):
+        holder = ModelHolder(self.path, loader=self.counting_loader, check_interval=0, background=False)
+        self.write_model(CountingModel(), mtime=1000)
+        first = holder.get()
+
+        self.write_model(BrokenModel(), mtime=2000)
+        self.assertIs(holder.get(), first)
+        # The broken file is not retried until it changes again
+        holder.get()
+        self.assertEqual(self.loads, 2)
+
+    def test_follows_path_callable(self):
+        other = os.path.join(self.tmpdir.name, 'other.pkl')
+        with open(other, 'wb') as f:
+            pickle.dump({'version': 'other'}, f)
+        self.write_model({'version': 1})
+        current = {'path': self.path}
+        holder = ModelHolder(lambda: current['path'], loader=self.counting_loader,
+                             check_interval=0, background=False)
+        self.assertEqual(holder.get(), {'version': 1})
+        current['path'] = other
+        self.assertEqual(holder.get(), {'version': 'other'})
+        self.assertEqual(holder.model_path, other)
+
+
+class CountingModel:
+    """Records the shape of every predict call"""
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, matrix):
+        self.calls.append(matrix.shape)
+        return ['crop%d' % i for i in range(len(matrix))]
+
+
+class BrokenModel:
+    """Loads fine but fails on its first prediction"""
+    def predict(self, matrix):
+        raise RuntimeError('corrupt model')
+
+
+class BatchPredictionTestCase(unittest.TestCase):
+    def test_parse_record_object_and_list(self):
+        record = dict(zip(['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall'], RICE_SAMPLE))
+        self.assertEqual(parse_record(record), [float(v) for v in RICE_SAMPLE])
+        self.assertEqual(parse_record(RICE_SAMPLE), [float(v) for v in RICE_SAMPLE])
+
+    def test_parse_record_rejects_bad_input(self):
+        with self.assertRaises(ValueError):
+            parse_record({'N': 1})
+        with self.assertRaises(ValueError):
+            parse_record(RICE_SAMPLE[:6])
+        with self.assertRaises(ValueError):
+            parse_record(RICE_SAMPLE[:6] + ['abc'])
+        with self.assertRaises(ValueError):
+            parse_record(RICE_SAMPLE[:6] + [float('inf')])
+
+    def test_validate_features_matches_form_rules(self):
+        self.assertIsNone(validate_features(RICE_SAMPLE))
+        self.assertIn('PH', validate_features(RICE_SAMPLE[:5] + [15, 100]))
+        self.assertIn('Temperature', validate_features(RICE_SAMPLE[:3] + [100] + RICE_SAMPLE[4:]))
+        self.assertIn('Humidity', validate_features(RICE_SAMPLE[:4] + [0] + RICE_SAMPLE[5:]))
+
+    def test_predict_batch_single_call(self):
+        model = CountingModel()
+        labels = predict_batch([RICE_SAMPLE] * 250, model=model)
+        self.assertEqual(len(labels), 250)
+        self.assertEqual(model.calls, [(250, 7)])
+
+    def test_stream_csv_predicts_in_chunks(self):
+        model = CountingModel()
+        lines = ['N,P,K,temperature,humidity,ph,rainfall,label\n']
+        lines += ['90,42,43,20.8,82.0,6.5,202.9,rice\n'] * 5
+        lines += ['90,42,43,20.8,82.0,16.5,202.9,rice\n']
+        chunks = list(stream_csv_predictions(iter(lines), chunk_rows=2, model=model))
+
+        self.assertEqual(chunks[0], 'N,P,K,temperature,humidity,ph,rainfall,label,prediction,error\n')
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(model.calls, [(2, 7), (2, 7), (1, 7)])
+        self.assertIn('PH value must be between 0 and 14', chunks[-1])
+
+    def test_stream_ndjson(self):
+        model = CountingModel()
+        lines = ['N,P,K,temperature,humidity,ph,rainfall\n', '90,42,43,20.8,82.0,6.5,202.9\n']
+        output = ''.join(stream_csv_predictions(iter(lines), fmt='ndjson', model=model))
+        record = json.loads(output)
+        self.assertEqual(record['N'], '90')
+        self.assertEqual(record['prediction'], 'crop0')
+
+    def test_stream_rejects_missing_columns(self):
+        with self.assertRaises(ValueError):
+            stream_csv_predictions(iter(['N,P,K\n', '1,2,3\n']), model=CountingModel())
+
+
+class TopKPredictionTestCase(unittest.TestCase):
+    def test_ranked_scores(self):
+        model = MagicMock(spec=['predict_proba', 'classes_'])
+        model.classes_ = np.array(['maize', 'rice', 'jute'])
+        model.predict_proba.return_value = np.array([[0.2, 0.5, 0.3], [0.0, 0.0, 1.0]])
+
+        results = predict_top_k([RICE_SAMPLE, RICE_SAMPLE], k=2, model=model)
+        self.assertEqual(model.predict_proba.call_count, 1)
+        self.assertEqual(results[0]['prediction'], 'rice')
+        self.assertEqual([c['crop'] for c in results[0]['top_k']], ['rice', 'jute'])
+        self.assertEqual(results[1]['top_k'], [{'crop': 'jute', 'score': 1.0}])
+
+    def test_one_hot_probabilities_rank_only_the_prediction(self):
+        features, labels = load_dataset()
+        model = DecisionTreeClassifier(random_state=0).fit(features, labels)
+        results = predict_top_k(features[:50], k=3, model=model)
+        for result in results:
+            self.assertEqual(result['top_k'], [{'crop': result['prediction'], 'score': 1.0}])
+
+    def test_matches_predict_on_dataset(self):
+        features, labels = load_dataset()
+        for model in (DecisionTreeClassifier(random_state=0).fit(features, labels),
+                      RandomForestClassifier(n_estimators=10, random_state=0).fit(features, labels)):
+            results = predict_top_k(features, k=3, model=model)
+            self.assertEqual([r['prediction'] for r in results], list(model.predict(features)))
+
+
+class PredictionCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.model = MagicMock(spec=['predict_proba', 'classes_'])
+        self.model.classes_ = np.array(['maize', 'rice'])
+        self.model.predict_proba.side_effect = lambda X: np.tile([0.25, 0.75], (len(X), 1))
+
+    def test_hit_skips_model(self):
+        cache = PredictionCache(maxsize=10)
+        first = cache.predict(RICE_SAMPLE, k=2, model=self.model)
+        second = cache.predict([v + 0.001 for v in RICE_SAMPLE[:6]] + [RICE_SAMPLE[6]], k=2, model=self.model)
+        self.assertEqual(first, second)
+        self.assertEqual(self.model.predict_proba.call_count, 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_miss_predicts_rounded_values(self):
+        cache = PredictionCache(maxsize=10, precision=parse_precision('ph=0'))
+        cache.predict(RICE_SAMPLE, k=1, model=self.model)
+        predicted = self.model.predict_proba.call_args[0][0]
+        self.assertEqual(predicted[0][5], 7.0)
+
+    def test_eviction(self):
+        cache = PredictionCache(maxsize=2)
+        for n in (10, 20, 30):
+            cache.predict([n] + RICE_SAMPLE[1:], model=self.model)
+        stats = cache.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['size'], 2)
+
+    def test_model_reload_clears_cache(self):
+        cache = PredictionCache(maxsize=10)
+        cache.predict(RICE_SAMPLE, model=self.model)
+        other = MagicMock(spec=['predict_proba', 'classes_'])
+        other.classes_ = np.array(['jute'])
+        other.predict_proba.return_value = np.array([[1.0]])
+        self.assertEqual(cache.predict(RICE_SAMPLE, model=other)['prediction'], 'jute')
+
+    def test_parse_precision(self):
+        precision = parse_precision('ph=1, rainfall=0,bogus=3,N=x')
+        self.assertEqual(precision['ph'], 1)
+        self.assertEqual(precision['rainfall'], 0)
+        self.assertEqual(precision['N'], 0)
+        self.assertNotIn('bogus', precision)
+
+
+class MicroBatcherTestCase(unittest.TestCase):
+    def test_concurrent_rows_share_a_batch(self):
+        calls = []
+
+        def predict_fn(rows, key):
+            calls.append(len(rows))
+            return [row[0] * key for row in rows]
+
+        batcher = MicroBatcher(predict_fn, max_batch=8, max_wait_ms=200)
+        results = {}
+        start = threading.Barrier(8)
+
+        def worker(n):
+            start.wait()
+            results[n] = batcher.predict([n], key=10, timeout=5)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, {n: n * 10 for n in range(8)})
+        self.assertEqual(sum(calls), 8)
+        self.assertLess(len(calls), 8)
+        stats = batcher.stats()
+        self.assertEqual(stats['rows'], 8)
+        self.assertEqual(stats['batches'], len(calls))
+        self.assertGreaterEqual(stats['delay_max_ms'], stats['delay_p50_ms'])
+
+    def test_rows_grouped_by_key(self):
+        seen = []
+
+        def predict_fn(rows, key):
+            seen.append((key, len(rows)))
+            return [key] * len(rows)
+
+        batcher = MicroBatcher(predict_fn, max_batch=4, max_wait_ms=50)
+        futures = [batcher.submit([n], key=n % 2) for n in range(4)]
+        self.assertEqual([f.result(5) for f in futures], [0, 1, 0, 1])
+        self.assertEqual(sum(count for _, count in seen), 4)
+
+    def test_errors_reach_callers(self):
+        def predict_fn(rows, key):
+            raise ValueError('bad batch')
+
+        batcher = MicroBatcher(predict_fn, max_wait_ms=1)
+        with self.assertRaises(ValueError):
+            batcher.predict([1], timeout=5)
+
+
+class GridSweepTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        features, labels = load_dataset()
+        cls.model = DecisionTreeClassifier(random_state=0).fit(features, labels)
+
+    def test_matches_materialized_grid(self):
+        axes = build_grid_axes(RICE_SAMPLE, {'rainfall': {'start': 20, 'stop': 300, 'steps': 13},
+                                             'ph': {'start': 4, 'stop': 9, 'steps': 7}})
+        grid = sweep_grid(RICE_SAMPLE, axes, chunk_cells=10, model=self.model)
+        self.assertEqual(grid.shape, (13, 7))
+        self.assertEqual(grid.dtype, np.uint8)
+
+        rows = []
+        for rainfall, ph in itertools.product(axes[0][1], axes[1][1]):
+            rows.append(RICE_SAMPLE[:5] + [ph, rainfall])
+        expected = self.model.predict(np.array(rows)).reshape(13, 7)
+        np.testing.assert_array_equal(self.model.classes_[grid], expected)
+
+    def test_rejects_invalid_ranges(self):
+        with self.assertRaises(ValueError):
+            build_grid_axes(RICE_SAMPLE, {'ph': {'start': 5, 'stop': 15, 'steps': 3}})
+        with self.assertRaises(ValueError):
+            build_grid_axes(RICE_SAMPLE, {'colour': {'start': 1, 'stop': 2, 'steps': 3}})
+        with self.assertRaises(ValueError):
+            build_grid_axes(RICE_SAMPLE, {'ph': {'start': 5, 'stop': 7}})
+        with self.assertRaises(ValueError):
+            build_grid_axes(RICE_SAMPLE, {'N': {'start': 0, 'stop': 140, 'steps': 5000},
+                                          'rainfall': {'start': 20, 'stop': 300, 'steps': 5000}})
+
+
+class BatchPredictionApiTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        features, labels = load_dataset()
+        cls.model = DecisionTreeClassifier(random_state=0).fit(features, labels)
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.secret_key = 'test_secret_key'
+        self.app = app.test_client()
+
+        self.user_patcher = patch('project_agri.crop_predict.User')
+        mock_user_class = self.user_patcher.start()
+        mock_user = MagicMock()
+        mock_user.is_authenticated = True
+        mock_user.get_id.return_value = '1'
+        mock_user_class.get.return_value = mock_user
+
+        # crop_predict imports model_service as a top-level module
+        self.model_patcher = patch('model_service.get_model', return_value=self.model)
+        self.model_patcher.start()
+        self.route_model_patcher = patch('project_agri.crop_predict.get_model', return_value=self.model)
+        self.route_model_patcher.start()
+
+        with self.app.session_transaction() as sess:
+            sess['_user_id'] = '1'
+            sess['_fresh'] = True
+            sess['visited'] = True
+
+    def tearDown(self):
+        self.user_patcher.stop()
+        self.model_patcher.stop()
+        self.route_model_patcher.stop()
+
+    def test_batch_predictions(self):
+        response = self.app.post('/api/predict/batch', json=[RICE_SAMPLE, RICE_SAMPLE])
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['predictions'], ['rice', 'rice'])
+
+    def test_batch_top_k(self):
+        response = self.app.post('/api/predict/batch?top_k=3', json=[RICE_SAMPLE])
+        data = response.get_json()
+        self.assertEqual(data['predictions'], ['rice'])
+        # The served tree is certain, so crops it scored zero are not offered as alternatives
+        self.assertEqual(data['top_k'][0], [{'crop': 'rice', 'score': 1.0}])
+
+    def test_form_shows_prediction(self):
+        form = dict(zip(['Nitrogen', 'Phosphorus', 'Potassium', 'Temperature', 'Humidity', 'PH', 'Rainfall'],
+                        RICE_SAMPLE))
+        response = self.app.post('/form', data=form)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'rice', response.data)
+        self.assertIn(b'Confidence: 100.0%', response.data)
+
+    def test_grid_sweep(self):
+        response = self.app.post('/api/predict/grid', json={
+            'base': RICE_SAMPLE,
+            'ranges': {'rainfall': {'start': 20, 'stop': 300, 'steps': 50}, 'ph': {'start': 4, 'stop': 9, 'steps': 20}},
+        })
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        # Axes follow the order of 'features' in the response
+        steps = {'rainfall': 50, 'ph': 20}
+        self.assertEqual(sorted(data['features']), ['ph', 'rainfall'])
+        self.assertEqual(data['shape'], [steps[name] for name in data['features']])
+        cells = np.frombuffer(base64.b64decode(data['cells']), dtype=data['dtype']).reshape(data['shape'])
+        self.assertEqual(sum(data['label_counts'].values()), 1000)
+        self.assertIn(data['labels'][cells[-1, -1]], data['label_counts'])
+
+    def test_grid_sweep_rejects_bad_range(self):
+        response = self.app.post('/api/predict/grid', json={
+            'base': RICE_SAMPLE, 'ranges': {'ph': {'start': 0, 'stop': 7, 'steps': 5}}})
+        self.assertEqual(response.status_code, 400)
+
+    def test_similar_farms(self):
+        response = self.app.post('/api/similar', json={'record': RICE_SAMPLE, 'k': 3})
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(data['neighbours'][0]['label'], 'rice')
+
+        response = self.app.post('/api/similar', json={'record': RICE_SAMPLE, 'k': 0})
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_record_rejected(self):
+        response = self.app.post('/api/predict/batch', json={'records': [RICE_SAMPLE, RICE_SAMPLE[:5] + [20, 100]]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['errors'][0]['index'], 1)
+
+    def test_csv_upload(self):
+        with open(DATASET_FILE, 'rb') as f:
+            response = self.app.post('/api/predict/csv', data={'file': (f, 'crops.csv')},
+                                     content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 200)
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(len(lines), 2201)
+        self.assertTrue(lines[1].endswith('rice,rice,'))
+
+    def test_csv_body_ndjson(self):
+        body = 'N,P,K,temperature,humidity,ph,rainfall\n90,42,43,20.879,82.002,6.502,202.935\n'
+        response = self.app.post('/api/predict/csv?format=ndjson', data=body, content_type='text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.get_data(as_text=True))['prediction'], 'rice')
+
+    def test_empty_batch_rejected(self):
+        response = self.app.post('/api/predict/batch', json=[])
+        self.assertEqual(response.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,8 +10,14 @@ sys.modules['pymongo.MongoClient'] = MagicMock()
 # Add project path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), 'project_agri')))
 
-from project_agri.models import User
+from project_agri import models
+from project_agri.models import User, UserCache
+from user_repository import MongoUserRepository
 
+# These tests drive the MongoDB repository through a patched get_users_collection
+mongo_repository = patch.object(models, '_repository', MongoUserRepository(lambda: models.get_users_collection()))
+
+@mongo_repository
 class UserModelTestCase(unittest.TestCase):
     @patch('project_agri.models.get_users_collection')
     def test_save_success(self, mock_get_collection):
@@ -38,5 +44,90 @@ class UserModelTestCase(unittest.TestCase):
         user = User('test', 'test@example.com', 'password')
         self.assertFalse(user.save())
 
+    @patch('project_agri.models.get_users_collection')
+    def test_save_duplicate_key(self, mock_get_collection):
+        error = Exception("E11000 duplicate key error")
+        error.code = 11000
+        error.details = {'keyPattern': {'email': 1}, 'keyValue': {'email': 'test@example.com'}}
+        mock_get_collection.return_value.insert_one.side_effect = error
+
+        user = User('test', 'test@example.com', 'password')
+        self.assertFalse(user.save())
+        self.assertEqual(user.duplicate_field, 'email')
+
+    @patch('project_agri.models.get_users_collection')
+    def test_find_conflicts_is_one_query(self, mock_get_collection):
+        mock_collection = mock_get_collection.return_value
+        mock_collection.find.return_value.limit.return_value = [
+            {'_id': 1, 'username': 'test', 'email': 'other@example.com'},
+            {'_id': 2, 'username': 'other', 'email': 'test@example.com'},
+        ]
+        self.assertEqual(User.find_conflicts('test', 'test@example.com'), {'username', 'email'})
+        mock_collection.find.assert_called_once()
+        query = mock_collection.find.call_args[0][0]
+        self.assertEqual(query, {'$or': [{'username': 'test'}, {'email': 'test@example.com'}]})
+
+    @patch('project_agri.models.get_users_collection')
+    def test_ensure_user_indexes(self, mock_get_collection):
+        self.assertTrue(models.ensure_user_indexes())
+        calls = mock_get_collection.return_value.create_index.call_args_list
+        self.assertEqual([(c.args[0], c.kwargs['unique']) for c in calls], [('username', True), ('email', True)])
+
+        mock_get_collection.return_value = None
+        self.assertFalse(models.ensure_user_indexes())
+
+
+class UserCacheTestCase(unittest.TestCase):
+    USER_ID = '507f1f77bcf86cd799439011'
+
+    def setUp(self):
+        self.collection = MagicMock()
+        self.collection.find_one.return_value = {
+            '_id': self.USER_ID, 'username': 'test', 'email': 'test@example.com', 'password': 'hash'}
+        self.patchers = [patch('project_agri.models.get_users_collection', return_value=self.collection),
+                         patch.object(models, '_user_cache', UserCache(maxsize=2, ttl=60)),
+                         patch.object(models, '_repository', MongoUserRepository(lambda: models.get_users_collection()))]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+
+    def test_repeated_get_hits_cache(self):
+        first = User.get(self.USER_ID)
+        second = User.get(self.USER_ID)
+        self.assertEqual(self.collection.find_one.call_count, 1)
+        self.assertEqual((second.id, second.email), (self.USER_ID, 'test@example.com'))
+        self.assertIsNot(first, second)
+        self.assertEqual(models._user_cache.stats()['hits'], 1)
+
+    def test_expired_entry_is_reloaded(self):
+        User.get(self.USER_ID)
+        with patch.object(models.time, 'monotonic', return_value=models.time.monotonic() + 61):
+            User.get(self.USER_ID)
+        self.assertEqual(self.collection.find_one.call_count, 2)
+
+    def test_save_invalidates(self):
+        User.get(self.USER_ID)
+        self.collection.insert_one.return_value.inserted_id = self.USER_ID
+        User('test', 'new@example.com', 'hash').save()
+        User.get(self.USER_ID)
+        self.assertEqual(self.collection.find_one.call_count, 2)
+
+    def test_missing_user_is_not_cached(self):
+        self.collection.find_one.return_value = None
+        self.assertIsNone(User.get(self.USER_ID))
+        self.assertIsNone(User.get(self.USER_ID))
+        self.assertEqual(self.collection.find_one.call_count, 2)
+
+    def test_bounded_size(self):
+        cache = UserCache(maxsize=2, ttl=60)
+        for user_id in ('a', 'b', 'c'):
+            cache.put(user_id, {'username': user_id})
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('c'), {'username': 'c'})
+        self.assertEqual(cache.stats()['size'], 2)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+import os
+import sys
+import tempfile
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+# Add project path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), 'project_agri')))
+
+from project_agri import password_hasher
+from project_agri.password_hasher import PasswordHasher, HasherBusy, calibrate_rounds, hash_rounds, shared_rounds
+
+
+class PasswordHasherTestCase(unittest.TestCase):
+    def setUp(self):
+        # Cheapest work factor, so the tests stay fast
+        self.hasher = PasswordHasher(rounds=4, workers=2, max_pending=4, queue_timeout=0.05)
+
+    def test_hash_and_check(self):
+        password_hash = self.hasher.hash('password123')
+        self.assertEqual(hash_rounds(password_hash), 4)
+        self.assertTrue(self.hasher.check(password_hash, 'password123'))
+        self.assertFalse(self.hasher.check(password_hash, 'wrong'))
+        self.assertFalse(self.hasher.check('not a hash', 'password123'))
+        stats = self.hasher.stats()
+        self.assertEqual((stats['completed'], stats['pending']), (4, 0))
+
+    def test_needs_rehash(self):
+        old = PasswordHasher(rounds=4).hash('password123')
+        self.assertFalse(self.hasher.needs_rehash(old))
+        self.assertTrue(PasswordHasher(rounds=5).needs_rehash(old))
+        self.assertFalse(self.hasher.needs_rehash('plain'))
+
+    def test_rehash_in_background(self):
+        saved = threading.Event()
+        stored = []
+        upgraded = PasswordHasher(rounds=5, queue_timeout=0.05)
+        upgraded.rehash_in_background('password123', lambda new_hash: (stored.append(new_hash), saved.set()))
+        self.assertTrue(saved.wait(5))
+        self.assertEqual(hash_rounds(stored[0]), 5)
+        self.assertTrue(upgraded.check(stored[0], 'password123'))
+
+    def test_queue_is_bounded(self):
+        release = threading.Event()
+        futures = [self.hasher.submit(release.wait) for _ in range(4)]
+        self.assertEqual(self.hasher.stats()['pending'], 4)
+        with self.assertRaises(HasherBusy):
+            self.hasher.hash('password123')
+        release.set()
+        for future in futures:
+            future.result(timeout=5)
+        stats = self.hasher.stats()
+        self.assertEqual((stats['pending'], stats['peak_pending'], stats['rejected']), (0, 4, 1))
+        self.assertTrue(self.hasher.check(self.hasher.hash('x'), 'x'))
+
+    def test_rehash_never_waits_for_a_slot(self):
+        release = threading.Event()
+        slow = PasswordHasher(rounds=4, workers=1, max_pending=1, queue_timeout=5)
+        future = slow.submit(release.wait)
+        start = time.perf_counter()
+        slow.rehash_in_background('password123', lambda new_hash: None)
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertEqual(slow.stats()['rejected'], 1)
+        release.set()
+        future.result(timeout=5)
+
+    def test_calibration_extrapolates_from_one_sample(self):
+        clock = MagicMock(side_effect=[0.0, 0.010])  # 10 ms at 8 rounds
+        with patch.object(password_hasher.time, 'perf_counter', clock):
+            self.assertEqual(calibrate_rounds(target_ms=250), 12)
+        clock = MagicMock(side_effect=[0.0, 0.010])
+        with patch.object(password_hasher.time, 'perf_counter', clock):
+            self.assertEqual(calibrate_rounds(target_ms=1), password_hasher.MIN_ROUNDS)
+
+    def test_calibration_never_below_previous_default(self):
+        clock = MagicMock(side_effect=[0.0, 0.010])  # a slow machine: 10 ms at 8 rounds
+        with patch.object(password_hasher.time, 'perf_counter', clock):
+            self.assertEqual(calibrate_rounds(target_ms=50), 12)
+
+    def test_workers_share_one_stored_work_factor(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'instance', 'bcrypt_rounds')
+            with patch.object(password_hasher, 'calibrate_rounds', return_value=13) as calibrate:
+                self.assertEqual(shared_rounds(path), 13)
+                # A second worker reads the stored value instead of calibrating again
+                calibrate.return_value = 14
+                self.assertEqual(shared_rounds(path), 13)
+            calibrate.assert_called_once()
+            self.assertEqual(os.listdir(os.path.dirname(path)), ['bcrypt_rounds'])
+
+            with open(path, 'w') as f:
+                f.write('10\n')
+            self.assertEqual(shared_rounds(path), password_hasher.MIN_ROUNDS)
+
+    def test_unwritable_store_falls_back_to_own_calibration(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            blocker = os.path.join(tmp, 'blocker')
+            open(blocker, 'w').close()
+            with patch.object(password_hasher, 'calibrate_rounds', return_value=13):
+                self.assertEqual(shared_rounds(os.path.join(blocker, 'bcrypt_rounds')), 13)
+
+
+if __name__ == '__main__':
+    unittest.main()
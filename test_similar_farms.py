@@ -0,0 +1,99 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+
+import numpy as np
+
+# Add project path
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), 'project_agri'))
+sys.path.append(PROJECT_DIR)
+
+from project_agri.similar_farms import FarmIndex
+
+DATASET_FILE = os.path.join(PROJECT_DIR, 'Crop_recommendation.csv')
+RICE_SAMPLE = [90, 42, 43, 20.879, 82.002, 6.502, 202.935]
+
+
+def brute_force(path, values, k):
+    features = np.loadtxt(path, delimiter=',', skiprows=1, usecols=range(7))
+    scaled = (features - features.mean(axis=0)) / features.std(axis=0)
+    point = (np.asarray(values) - features.mean(axis=0)) / features.std(axis=0)
+    distances = np.sqrt(((scaled - point) ** 2).sum(axis=1))
+    return sorted(distances)[:k]
+
+
+class FarmIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'farms.csv')
+        shutil.copyfile(DATASET_FILE, self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def append(self, rows):
+        with open(self.path, 'a') as f:
+            for row in rows:
+                f.write(','.join(str(v) for v in row) + '\n')
+
+    def test_matches_brute_force(self):
+        index = FarmIndex(self.path)
+        neighbours = index.query(RICE_SAMPLE, k=5)
+        self.assertEqual(len(neighbours), 5)
+        self.assertEqual(neighbours[0]['label'], 'rice')
+        self.assertEqual(neighbours[0]['features']['N'], 90.0)
+        np.testing.assert_allclose([n['distance'] for n in neighbours],
+                                   brute_force(self.path, RICE_SAMPLE, 5), atol=1e-4)
+
+    def test_appended_rows_are_found_before_rebuild(self):
+        index = FarmIndex(self.path, check_interval=0, rebuild_fraction=0.5)
+        self.assertEqual(len(index), 2200)
+        self.append([[1, 2, 3, 30.0, 40.0, 5.5, 100.0, 'testcrop']])
+
+        neighbours = index.query([1, 2, 3, 30.0, 40.0, 5.5, 100.0], k=2)
+        self.assertEqual(neighbours[0]['label'], 'testcrop')
+        self.assertEqual(neighbours[0]['distance'], 0.0)
+        self.assertEqual(len(index), 2201)
+        self.assertEqual(index.rebuilds, 1)
+
+    def test_partial_line_waits_for_newline(self):
+        index = FarmIndex(self.path, check_interval=0)
+        index.query(RICE_SAMPLE)
+        with open(self.path, 'a') as f:
+            f.write('1,2,3,30.0,40.0,5.5,100.0,test')
+        self.assertEqual(len(index), 2200)
+        with open(self.path, 'a') as f:
+            f.write('crop\n')
+        self.assertEqual(len(index), 2201)
+        self.assertEqual(index.query([1, 2, 3, 30.0, 40.0, 5.5, 100.0], k=1)[0]['label'], 'testcrop')
+
+    def test_rebuild_after_growth(self):
+        index = FarmIndex(self.path, check_interval=0, rebuild_fraction=0.01)
+        index.query(RICE_SAMPLE)
+        rows = [[n, 10, 10, 25.0, 60.0, 6.5, 80.0, 'grown'] for n in range(30)]
+        self.append(rows)
+
+        self.assertEqual(len(index), 2230)
+        self.assertEqual(index.rebuilds, 2)
+        np.testing.assert_allclose([n['distance'] for n in index.query(RICE_SAMPLE, k=3)],
+                                   brute_force(self.path, RICE_SAMPLE, 3), atol=1e-4)
+
+    def test_rewritten_file_is_reloaded(self):
+        index = FarmIndex(self.path, check_interval=0)
+        index.query(RICE_SAMPLE)
+        with open(DATASET_FILE) as src, open(self.path, 'w') as dst:
+            dst.writelines(src.readlines()[:11])
+        self.assertEqual(len(index), 10)
+        self.assertEqual(len(index.query(RICE_SAMPLE, k=50)), 10)
+
+    def test_add(self):
+        index = FarmIndex(self.path)
+        index.add([[5, 5, 5, 22.0, 50.0, 7.0, 90.0]], ['manual'])
+        self.assertEqual(index.query([5, 5, 5, 22.0, 50.0, 7.0, 90.0], k=1)[0]['label'], 'manual')
+        with self.assertRaises(ValueError):
+            index.add([[5, 5, 5, 22.0, 50.0, 7.0, 90.0]], [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import os
+import sys
+import random
+from collections import Counter
+
+# Add project path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), 'project_agri')))
+
+from project_agri.space_saving import SpaceSaving
+
+
+def zipf_stream(n, seed):
+    rng = random.Random(seed)
+    return [f'city{int(rng.paretovariate(1.2))}' for _ in range(n)]
+
+
+class SpaceSavingTestCase(unittest.TestCase):
+    def assert_guarantees(self, summary, stream):
+        exact = Counter(stream)
+        bound = len(stream) / summary.capacity
+        self.assertLessEqual(len(summary.counts), summary.capacity)
+        for item, count, error in summary.top(summary.capacity):
+            self.assertGreaterEqual(count, exact[item])
+            self.assertLessEqual(count - error, exact[item])
+            self.assertLessEqual(error, bound)
+        for item, count in exact.items():
+            if count > bound:
+                self.assertIn(item, summary.counts)
+
+    def test_exact_below_capacity(self):
+        summary = SpaceSaving(10)
+        for item in ['a', 'b', 'a', 'c', 'a', 'b']:
+            summary.add(item)
+        self.assertEqual(summary.top(2), [('a', 3, 0), ('b', 2, 0)])
+
+    def test_error_bounds(self):
+        stream = zipf_stream(20000, seed=1)
+        summary = SpaceSaving(50)
+        for item in stream:
+            summary.add(item)
+        self.assert_guarantees(summary, stream)
+        self.assertEqual(summary.top(1)[0][0], Counter(stream).most_common(1)[0][0])
+
+    def test_merge_keeps_guarantees(self):
+        streams = [zipf_stream(8000, seed) for seed in range(4)]
+        merged = SpaceSaving(50)
+        for stream in streams:
+            part = SpaceSaving(50)
+            for item in stream:
+                part.add(item)
+            merged.merge(SpaceSaving.from_dict(part.to_dict()))
+        combined = [item for stream in streams for item in stream]
+        self.assertEqual(merged.total, len(combined))
+        self.assert_guarantees(merged, combined)
+
+if __name__ == '__main__':
+    unittest.main()
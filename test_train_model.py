@@ -0,0 +1,56 @@
+import unittest
+import os
+import sys
+import tempfile
+
+# Add project path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), 'project_agri')))
+
+from project_agri.train_model import train, choose, write_artifact
+
+
+def result(name, accuracy, p50, throughput):
+    return {'name': name, 'model': None,
+            'metrics': {'accuracy': accuracy, 'p50_ms': p50, 'throughput_rows_s': throughput}}
+
+
+class ChooseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.results = [
+            result('fast', 0.96, 0.01, 100),
+            result('accurate', 0.99, 2.0, 10),
+            result('bulk', 0.97, 0.5, 1000),
+            result('bad', 0.50, 0.001, 10000),
+        ]
+
+    def test_accuracy(self):
+        self.assertEqual(choose(self.results, 'accuracy')['name'], 'accurate')
+
+    def test_latency_respects_accuracy_floor(self):
+        self.assertEqual(choose(self.results, 'latency', min_accuracy=0.95)['name'], 'fast')
+
+    def test_throughput_respects_accuracy_floor(self):
+        self.assertEqual(choose(self.results, 'throughput', min_accuracy=0.95)['name'], 'bulk')
+
+
+class TrainTestCase(unittest.TestCase):
+    def test_train_and_write_decision_tree(self):
+        results, data_hash = train(candidates=['decision_tree'], n_jobs=1)
+        self.assertEqual([r['name'] for r in results], ['decision_tree', 'decision_tree (compiled)'])
+        self.assertEqual(len(data_hash), 64)
+        for r in results:
+            self.assertGreater(r['metrics']['accuracy'], 0.95)
+            self.assertLessEqual(r['metrics']['p50_ms'], r['metrics']['p99_ms'])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output = os.path.join(tmpdir, 'crop_recommend')
+            self.assertEqual(write_artifact(results[1], output), output + '.compiled')
+            self.assertTrue(os.path.isdir(output + '.compiled'))
+            self.assertTrue(os.path.exists(output))
+
+            # Shipping the plain sklearn model removes the now stale compiled artifact
+            self.assertEqual(write_artifact(results[0], output), output)
+            self.assertFalse(os.path.exists(output + '.compiled'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+import os
+import sys
+import tempfile
+import warnings
+
+import joblib
+import numpy as np
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.ensemble import RandomForestClassifier
+
+# Add project path
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), 'project_agri'))
+sys.path.append(PROJECT_DIR)
+
+from project_agri.tree_compiler import CompiledTreeModel
+from project_agri.model_service import load_artifact
+
+DATASET_FILE = os.path.join(PROJECT_DIR, 'Crop_recommendation.csv')
+
+
+class TreeCompilerParityTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.features = np.loadtxt(DATASET_FILE, delimiter=',', skiprows=1, usecols=range(7))
+        cls.labels = np.loadtxt(DATASET_FILE, delimiter=',', skiprows=1, usecols=7, dtype=str)
+
+    def assert_parity(self, model):
+        compiled = CompiledTreeModel.from_model(model)
+        np.testing.assert_array_equal(compiled.classes_, model.classes_)
+        np.testing.assert_array_equal(compiled.predict(self.features), model.predict(self.features))
+        np.testing.assert_allclose(compiled.predict_proba(self.features), model.predict_proba(self.features))
+
+    def test_decision_tree_parity(self):
+        self.assert_parity(DecisionTreeClassifier(random_state=1).fit(self.features, self.labels))
+
+    def test_random_forest_parity(self):
+        model = RandomForestClassifier(n_estimators=25, random_state=1).fit(self.features, self.labels)
+        self.assert_parity(model)
+
+    def test_single_sample_walk_matches_batch(self):
+        model = RandomForestClassifier(n_estimators=5, random_state=1).fit(self.features, self.labels)
+        compiled = CompiledTreeModel.from_model(model)
+        sample = self.features[::50]
+        single = np.vstack([compiled.apply(row[None, :]) for row in sample])
+        np.testing.assert_array_equal(single, compiled.apply(sample))
+
+    def test_save_and_load(self):
+        model = DecisionTreeClassifier(random_state=1).fit(self.features, self.labels)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'model.npz')
+            CompiledTreeModel.from_model(model).save(path)
+            loaded = load_artifact(path)
+        self.assertEqual(type(loaded).__name__, 'CompiledTreeModel')
+        np.testing.assert_array_equal(loaded.predict(self.features), model.predict(self.features))
+
+    def test_directory_is_memory_mapped(self):
+        model = RandomForestClassifier(n_estimators=5, random_state=1).fit(self.features, self.labels)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'model.compiled')
+            CompiledTreeModel.from_model(model).save(path)
+            loaded = load_artifact(path)
+            for array in (loaded.feature, loaded.threshold, loaded.value, loaded.leaf_class, loaded.is_leaf):
+                self.assertIsInstance(array.base, np.memmap)
+            np.testing.assert_array_equal(loaded.predict(self.features), model.predict(self.features))
+            self.assertIs(type(loaded.predict(self.features[:2])), np.ndarray)
+
+            # Saving over the directory swaps it in whole; the mapped model keeps working
+            CompiledTreeModel.from_model(DecisionTreeClassifier(random_state=1).fit(
+                self.features, self.labels)).save(path)
+            self.assertEqual(len(CompiledTreeModel.load(path).roots), 1)
+            np.testing.assert_array_equal(loaded.predict(self.features), model.predict(self.features))
+            self.assertEqual(os.listdir(tmpdir), ['model.compiled'])
+
+    def test_shipped_artifact_matches_pickle(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            model = joblib.load(os.path.join(PROJECT_DIR, 'crop_recommend'))
+        compiled = CompiledTreeModel.load(os.path.join(PROJECT_DIR, 'crop_recommend.compiled'))
+
+        # Walk the pickled tree directly so the check does not depend on the estimator's sklearn version
+        expected = model.classes_[model.tree_.predict(self.features.astype(np.float32)).argmax(axis=1)]
+        np.testing.assert_array_equal(compiled.predict(self.features), expected)
+
+    def test_rejects_unsupported_model(self):
+        with self.assertRaises(TypeError):
+            CompiledTreeModel.from_model(object())
+
+if __name__ == '__main__':
+    unittest.main()
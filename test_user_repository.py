@@ -0,0 +1,158 @@
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+from unittest.mock import MagicMock, patch
+
+# Mock MongoDB before importing models
+sys.modules['pymongo'] = MagicMock()
+sys.modules['pymongo.MongoClient'] = MagicMock()
+
+# Add project path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), 'project_agri')))
+
+from project_agri import models
+from project_agri.models import User, UserCache
+# The module object models itself imported
+import user_repository
+from user_repository import (DuplicateUser, MongoUserRepository, SQLiteUserRepository,
+                             create_user_repository)
+
+
+class SQLiteUserRepositoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.repository = SQLiteUserRepository(os.path.join(self.tmp, 'instance', 'site.db'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_insert_and_find(self):
+        user_id = self.repository.insert('farmer', 'farmer@example.com', 'hash')
+        record = self.repository.get(user_id)
+        self.assertEqual((record['username'], record['email'], record['password']),
+                         ('farmer', 'farmer@example.com', 'hash'))
+        self.assertEqual(self.repository.find_by_email('farmer@example.com')['_id'], record['_id'])
+        self.assertEqual(self.repository.find_by_username('farmer')['_id'], record['_id'])
+        self.assertIsNone(self.repository.find_by_email('nobody@example.com'))
+        self.assertIsNone(self.repository.get('507f1f77bcf86cd799439011'))
+
+    def test_unique_index_rejects_duplicates(self):
+        self.repository.insert('farmer', 'farmer@example.com', 'hash')
+        with self.assertRaises(DuplicateUser) as raised:
+            self.repository.insert('other', 'farmer@example.com', 'hash')
+        self.assertEqual(raised.exception.field, 'email')
+        with self.assertRaises(DuplicateUser) as raised:
+            self.repository.insert('farmer', 'other@example.com', 'hash')
+        self.assertEqual(raised.exception.field, 'username')
+
+    def test_find_conflicts(self):
+        self.repository.insert('farmer', 'farmer@example.com', 'hash')
+        self.repository.insert('grower', 'grower@example.com', 'hash')
+        self.assertEqual(self.repository.find_conflicts('farmer', 'grower@example.com'), {'username', 'email'})
+        self.assertEqual(self.repository.find_conflicts('new', 'farmer@example.com'), {'email'})
+        self.assertEqual(self.repository.find_conflicts('new', 'new@example.com'), set())
+
+    def test_lookups_use_indexes(self):
+        conn = self.repository._connections.get()
+        for column in ('username', 'email'):
+            plan = ' '.join(row[-1] for row in conn.execute(
+                f"EXPLAIN QUERY PLAN SELECT id FROM users WHERE {column} = ?", ('x',)))
+            self.assertIn(f'users_{column}_unique', plan)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+
+    def test_update_password(self):
+        user_id = self.repository.insert('farmer', 'farmer@example.com', 'old')
+        self.assertTrue(self.repository.update_password(user_id, 'new'))
+        self.assertEqual(self.repository.get(user_id)['password'], 'new')
+        self.assertFalse(self.repository.update_password('999', 'new'))
+
+    def test_ensure_indexes_reports_unusable_path(self):
+        # The database directory cannot be created because a file is in its place
+        blocker = os.path.join(self.tmp, 'blocker')
+        open(blocker, 'w').close()
+        repository = SQLiteUserRepository(os.path.join(blocker, 'site.db'))
+        self.assertFalse(repository.ensure_indexes())
+
+    def test_create_user_repository(self):
+        self.assertIsInstance(create_user_repository('sqlite', path=self.repository.path), SQLiteUserRepository)
+        self.assertIsInstance(create_user_repository('mongodb', lambda: None), MongoUserRepository)
+        with self.assertRaises(ValueError):
+            create_user_repository('redis')
+
+
+class UserOnSQLiteTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.patchers = [patch.object(models, '_repository', SQLiteUserRepository(os.path.join(self.tmp, 'site.db'))),
+                         patch.object(models, '_user_cache', UserCache(ttl=60))]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_register_and_load(self):
+        self.assertTrue(models.ensure_user_indexes())
+        user = User('farmer', 'farmer@example.com', 'hash')
+        self.assertTrue(user.save())
+        loaded = User.get(user.id)
+        self.assertEqual((loaded.id, loaded.username), (user.id, 'farmer'))
+        self.assertEqual(User.find_by_email('farmer@example.com').id, user.id)
+        self.assertEqual(User.find_conflicts('farmer', 'x@example.com'), {'username'})
+
+        duplicate = User('farmer2', 'farmer@example.com', 'hash')
+        self.assertFalse(duplicate.save())
+        self.assertEqual(duplicate.duplicate_field, 'email')
+
+    def test_update_password_refreshes_cache(self):
+        user = User('farmer', 'farmer@example.com', 'old')
+        user.save()
+        User.get(user.id)
+        self.assertTrue(user.update_password('new'))
+        self.assertEqual(User.get(user.id).password, 'new')
+
+
+class MongoIndexCreationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.collection = MagicMock()
+        self.collection.find_one.return_value = None
+        self.repository = MongoUserRepository(lambda: self.collection)
+
+    def test_indexes_created_on_first_access(self):
+        self.collection.create_index.assert_not_called()
+        self.repository.find_by_email('farmer@example.com')
+        self.assertEqual([c.args[0] for c in self.collection.create_index.call_args_list], ['username', 'email'])
+        self.repository.find_by_username('farmer')
+        self.assertEqual(self.collection.create_index.call_count, 2)
+
+    def test_failed_creation_retried_until_it_succeeds(self):
+        self.collection.create_index.side_effect = Exception('not primary')
+        start = user_repository.time.monotonic()
+        with patch.object(user_repository.time, 'monotonic', return_value=start):
+            self.repository.find_by_email('farmer@example.com')
+            self.repository.find_by_email('farmer@example.com')
+        self.assertEqual(self.collection.create_index.call_count, 1)
+
+        self.collection.create_index.side_effect = None
+        with patch.object(user_repository.time, 'monotonic',
+                          return_value=start + user_repository.INDEX_RETRY_INTERVAL):
+            self.repository.find_by_email('farmer@example.com')
+            self.repository.find_by_email('farmer@example.com')
+        self.assertEqual(self.collection.create_index.call_count, 3)
+
+
+class UserOnUnavailableMongoTestCase(unittest.TestCase):
+    def test_save_fails_without_falling_back(self):
+        with patch.object(models, '_repository', MongoUserRepository(lambda: None)):
+            user = User('farmer', 'farmer@example.com', 'hash')
+            self.assertFalse(user.save())
+            self.assertIsNone(User.find_by_email('farmer@example.com'))
+            self.assertFalse(models.ensure_user_indexes())
+
+
+if __name__ == '__main__':
+    unittest.main()